@@ -4,66 +4,115 @@ bulletproof_hinv_lfns_final.py
 
 Parse ILD MC-2020 LFNs robustly, compare processes while skipping SUSY processes,
 and ignore differences in the 'another file number' folder under the process ID.
+
+With --jobs N the LFN file is memory-mapped and split into N newline-aligned
+byte ranges that are parsed in worker processes; the per-range results are
+merged in file order, so output and CSV are identical to the serial path.
 """
 
+import os
 import re
 import csv
+import mmap
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-# Robust regex for ILD MC-2020 LFNs
-pattern = re.compile(
-    r"(?P<rest>.+?)"                     # anything before energy tag
-    r"\.E\d+(?:-[A-Za-z0-9]+)?"          # energy + optional Set tag
-    r"\.I(?P<genid>\d+)"                 # generator ID
-    r"\.P(?P<process>.+?)"               # process name
-    r"\.e[LR]\.p[LR]"                    # polarization (case-insensitive)
-    r"\.n\d{1,5}[_\.]?\d{1,5}"           # n_number (1-5 digits each part)
-    r"\.d_dst_(?P<procid>\d+)_"          # process ID
-    r"\d+\.slcio",                        # file ID
-    re.IGNORECASE
-)
+from lfn_parser import LFNCatalog, normalize_line
 
 # SUSY detection pattern: neutralinos or selectrons + Higgs, optional _dd/_uu/_ss
 susy_pattern = re.compile(r"^[ne]\d+[ne]?\d*h(_[dus]{2})?$", re.IGNORECASE)
 
-def parse_lfns(file_path):
-    mapping = defaultdict(lambda: defaultdict(set))
+def collect(catalog):
+    """
+    Build (mapping, all_entries, susy_processes) from a parsed LFNCatalog.
+    mapping[process][(genid, procid)] holds the cleaned rest-of-path strings as
+    dict keys, so they keep first-seen order and merge deterministically.
+    """
+    mapping = defaultdict(lambda: defaultdict(dict))
     susy_processes = set()
     all_entries = []
 
-    with open(file_path, "rb") as f:
-        for line in f:
-            # Normalize line
-            line = line.strip().replace(b"\r", b"").decode("utf-8", errors="ignore")
-            if not line:
-                continue
+    for rec in catalog:
+        process = rec.process
+        genid = str(rec.genid)
+        procid = f"{rec.prodid:08d}"
+        # Everything before the energy tag: directory + rvXX.svXX.mILD_... prefix
+        rest = rec.lfn[:rec.lfn.rindex("/") + 1] + rec.prefix
+
+        all_entries.append((process, genid, procid, rest))
+
+        if susy_pattern.match(process):
+            susy_processes.add(process)
+            continue  # skip SUSY in main comparison
 
-            match = pattern.search(line)
-            if not match:
-                print(f"⚠️ Could not parse line:\n{line}")
-                continue
+        # Ignore differences in the 'another file number' subdirectory
+        rest_parts = rest.split('/')
+        if len(rest_parts) >= 2:
+            # Keep everything except the last folder (subdirectory number)
+            rest_cleaned = '/'.join(rest_parts[:-1])
+        else:
+            rest_cleaned = rest
 
-            process = match.group("process")
-            genid = match.group("genid")
-            procid = match.group("procid")
-            rest = match.group("rest")
+        mapping[process][(genid, procid)][rest_cleaned] = None
 
-            all_entries.append((process, genid, procid, rest))
+    return mapping, all_entries, susy_processes
 
-            if susy_pattern.match(process):
-                susy_processes.add(process)
-                continue  # skip SUSY in main comparison
+def parse_lfns(file_path):
+    catalog = LFNCatalog.from_file(file_path)
+    for line in catalog.unparsed:
+        print(f"⚠️ Could not parse line:\n{line}")
+    return collect(catalog)
+
+def split_byte_ranges(file_path, n_ranges):
+    """Split a file into at most n_ranges (start, end) byte ranges ending on a newline."""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = [0]
+        for k in range(1, n_ranges):
+            pos = max(size * k // n_ranges, bounds[-1])
+            nl = mm.find(b"\n", pos)
+            end = size if nl == -1 else nl + 1
+            if end > bounds[-1]:
+                bounds.append(end)
+            if end >= size:
+                break
+        if bounds[-1] < size:
+            bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _parse_range(args):
+    """Worker: parse one byte range of the memory-mapped LFN file."""
+    file_path, start, end = args
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lines = (normalize_line(raw) for raw in mm[start:end].split(b"\n"))
+        catalog = LFNCatalog.from_lines(line for line in lines if line)
+    mapping, all_entries, susy_processes = collect(catalog)
+    # Plain dicts so the result can be pickled back to the parent
+    mapping = {process: dict(combos) for process, combos in mapping.items()}
+    return mapping, all_entries, susy_processes, catalog.unparsed
+
+def parse_lfns_parallel(file_path, jobs):
+    """Same result as parse_lfns, with byte ranges parsed in `jobs` worker processes."""
+    mapping = defaultdict(lambda: defaultdict(dict))
+    susy_processes = set()
+    all_entries = []
 
-            # Ignore differences in the 'another file number' subdirectory
-            rest_parts = rest.split('/')
-            if len(rest_parts) >= 2:
-                # Keep everything except the last folder (subdirectory number)
-                rest_cleaned = '/'.join(rest_parts[:-1])
-            else:
-                rest_cleaned = rest
+    ranges = split_byte_ranges(file_path, jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_parse_range, [(str(file_path), start, end) for start, end in ranges]))
 
-            mapping[process][(genid, procid)].add(rest_cleaned)
+    # Merge in file order to reproduce the serial first-seen ordering
+    for part_mapping, part_entries, part_susy, part_unparsed in results:
+        for line in part_unparsed:
+            print(f"⚠️ Could not parse line:\n{line}")
+        for process, combos in part_mapping.items():
+            for key, rests in combos.items():
+                mapping[process][key].update(rests)
+        all_entries.extend(part_entries)
+        susy_processes |= part_susy
 
     return mapping, all_entries, susy_processes
 
@@ -99,9 +148,14 @@ def main():
     parser.add_argument("lfn_file", type=Path, help="Path to text file containing LFNs")
     parser.add_argument("-o", "--output", type=Path, default=None,
                         help="Optional CSV output file")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Parse the LFN file in N worker processes (memory-mapped byte ranges)")
     args = parser.parse_args()
 
-    mapping, entries, susy_processes = parse_lfns(args.lfn_file)
+    if args.jobs > 1:
+        mapping, entries, susy_processes = parse_lfns_parallel(args.lfn_file, args.jobs)
+    else:
+        mapping, entries, susy_processes = parse_lfns(args.lfn_file)
 
     print("\n=== NON-SUSY PROCESS COMPARISON ===")
     summarize(mapping)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+condor_job_state.py
+
+Persistent HTCondor job-state store (SQLite) and automatic resubmission engine
+used by submit_and_monitor_condor_jobs.py.
+
+The jobs table keeps one row per job directory:
+  job_dir, job_name, cluster_id, proc_id, attempts, last_status, exit_code,
+  first_submitted, last_submitted, updated_at, next_retry_at
+
+ResubmissionEngine decides what to do with a held or non-zero-exit job:
+  - outputs already present in OUTPUT_CHECK_DIR -> treat as done, no resubmission
+  - attempts exhausted                          -> give up (Failed)
+  - backoff not yet elapsed                     -> wait
+  - otherwise                                   -> condor_rm (if still queued) and
+                                                   condor_submit <job_dir>/job.sub again
+The backoff doubles with every attempt. Only the engine's resubmissions use up
+the attempt budget: a new submission by the user starts again at one attempt.
+
+Usage (inspect the store):
+    python3 condor_job_state.py [--db condor_job_state.sqlite]
+"""
+
+import re
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+
+DEFAULT_DB = "condor_job_state.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_dir         TEXT PRIMARY KEY,
+    job_name        TEXT NOT NULL,
+    cluster_id      INTEGER,
+    proc_id         INTEGER,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    last_status     TEXT,
+    exit_code       INTEGER,
+    first_submitted REAL,
+    last_submitted  REAL,
+    updated_at      REAL,
+    next_retry_at   REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (last_status);
+"""
+
+# Output file names as written into the options file by generate_key4hep_options_and_htcondor.py
+OUTPUT_NAME_PATTERNS = [
+    re.compile(r"^output\.filename\s*=\s*'([^']+)'", re.MULTILINE),
+    re.compile(r"^myalg\.root_output_file\s*=\s*'([^']+)'", re.MULTILINE),
+]
+
+# -----------------------------
+# State store
+# -----------------------------
+class JobStateDB:
+    """SQLite store of per-job submission state."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.conn = sqlite3.connect(str(path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, job_dir):
+        row = self.conn.execute("SELECT * FROM jobs WHERE job_dir = ?", (str(job_dir),)).fetchone()
+        return dict(row) if row else None
+
+    def all(self):
+        return [dict(row) for row in self.conn.execute("SELECT * FROM jobs ORDER BY job_name")]
+
+    def record_submission(self, job_dir, job_id, fresh=False):
+        """
+        Register a submission of job_dir as ClusterId.ProcId job_id.
+        fresh=True marks a user-initiated submission, which starts a new attempt
+        count (and first_submitted); automatic resubmissions add one attempt.
+        """
+        cluster_id, _, proc_id = job_id.partition(".")
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (job_dir, job_name, first_submitted) VALUES (?, ?, ?) "
+                "ON CONFLICT (job_dir) DO UPDATE SET first_submitted = excluded.first_submitted, attempts = 0 "
+                "WHERE ?",
+                (str(job_dir), Path(job_dir).name, now, fresh),
+            )
+            self.conn.execute(
+                "UPDATE jobs SET cluster_id = ?, proc_id = ?, attempts = attempts + 1, last_status = 'Submitted', "
+                "exit_code = NULL, last_submitted = ?, updated_at = ?, next_retry_at = NULL WHERE job_dir = ?",
+                (int(cluster_id), int(proc_id or 0), now, now, str(job_dir)),
+            )
+
+    def update_status(self, job_dir, status, exit_code=None):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET last_status = ?, exit_code = ?, updated_at = ? WHERE job_dir = ?",
+                (status, exit_code, time.time(), str(job_dir)),
+            )
+
+    def schedule_retry(self, job_dir, retry_at):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET next_retry_at = ?, updated_at = ? WHERE job_dir = ?",
+                (retry_at, time.time(), str(job_dir)),
+            )
+
+# -----------------------------
+# Resubmission
+# -----------------------------
+def expected_outputs(job_dir):
+    """ROOT output names declared in the job's options file(s)."""
+    names = []
+    for options_file in sorted(Path(job_dir).glob("higgsTo_invisible_*.py")):
+        text = options_file.read_text()
+        for pattern in OUTPUT_NAME_PATTERNS:
+            names.extend(pattern.findall(text))
+    return names
+
+def outputs_exist(job_dir, output_check_dir):
+    """True if every expected output is already present in output_check_dir."""
+    if not output_check_dir:
+        return False
+    names = expected_outputs(job_dir)
+    return bool(names) and all((Path(output_check_dir) / name).exists() for name in names)
+
+class ResubmissionEngine:
+    """
+    Retries held or failed jobs with a capped budget and exponential backoff.
+    submit_fn(sub_file) -> (job_id or None, output) and remove_fn(job_id) are
+    injected so the engine does not depend on how condor is called.
+    """
+
+    def __init__(self, db, submit_fn, remove_fn, max_attempts=3, backoff=300.0, output_check_dir=None):
+        self.db = db
+        self.submit_fn = submit_fn
+        self.remove_fn = remove_fn
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.output_check_dir = output_check_dir
+
+    def handle(self, job_dir, job_id, status, exit_code=None):
+        """
+        Handle one held or failed job. Returns (action, new_job_id) where action
+        is "outputs_exist", "gave_up", "waiting" or "resubmitted".
+        """
+        self.db.update_status(job_dir, status, exit_code)
+        state = self.db.get(job_dir)
+
+        if outputs_exist(job_dir, self.output_check_dir):
+            if status == "Held":
+                self.remove_fn(job_id)
+            self.db.update_status(job_dir, "Completed", 0)
+            return "outputs_exist", None
+
+        if state["attempts"] >= self.max_attempts:
+            self.db.update_status(job_dir, "Failed", exit_code)
+            return "gave_up", None
+
+        now = time.time()
+        if state["next_retry_at"] is None:
+            retry_at = now + self.backoff * 2 ** (state["attempts"] - 1)
+            self.db.schedule_retry(job_dir, retry_at)
+            state["next_retry_at"] = retry_at
+        if now < state["next_retry_at"]:
+            return "waiting", None
+
+        if status == "Held":
+            self.remove_fn(job_id)
+        new_job_id, output = self.submit_fn(Path(job_dir) / "job.sub")
+        if not new_job_id or new_job_id == "Unknown":
+            # try again after another backoff period
+            self.db.schedule_retry(job_dir, now + self.backoff * 2 ** (state["attempts"] - 1))
+            return "waiting", None
+        self.db.record_submission(job_dir, new_job_id)
+        return "resubmitted", new_job_id
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Show the persistent HTCondor job-state store")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite job-state file")
+    args = parser.parse_args()
+
+    db = JobStateDB(args.db)
+    print(f"{'Job Name':<30} | {'Job ID':<12} | {'Attempts':>8} | {'Exit':>4} | Status")
+    print("-" * 80)
+    for job in db.all():
+        job_id = f"{job['cluster_id']}.{job['proc_id']}"
+        exit_code = "" if job["exit_code"] is None else job["exit_code"]
+        print(f"{job['job_name']:<30} | {job_id:<12} | {job['attempts']:>8} | {exit_code:>4} | {job['last_status']}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
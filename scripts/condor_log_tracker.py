@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+condor_log_tracker.py
+
+Event-driven HTCondor job tracking from the per-job user logs
+(generated_jobs/<job>/job.log) instead of polling the schedd.
+
+Each log is tailed incrementally: the tracker remembers the byte offset after the
+last complete event ("...") per file, so every poll only reads what was appended
+since. The following events update the job state:
+
+  000 submit     -> Idle
+  001 execute    -> Running
+  004 evicted    -> Idle      (eviction counter)
+  005 terminated -> Completed (exit code or signal, run time, memory/disk usage)
+  006 image size -> memory high-water mark
+  009 aborted    -> Removed
+  012 held       -> Held      (hold reason)
+  013 released   -> Idle
+
+Per job ("ClusterId.ProcId") it exports wall time, memory high-water mark (MB),
+disk usage (KB), exit code and state to CSV. Offsets and states can be kept
+in a JSON state file between runs.
+
+Usage:
+    python3 condor_log_tracker.py generated_jobs [--state tracker_state.json] [--csv job_usage.csv]
+    python3 condor_log_tracker.py generated_jobs --follow --interval 10
+"""
+
+import re
+import csv
+import json
+import time
+import argparse
+import datetime
+from collections import Counter
+from pathlib import Path
+
+# -----------------------------
+# Event parsing
+# -----------------------------
+EVENT_HEADER = re.compile(r"^(\d{3}) \((\d+)\.(\d+)\.\d+\) (\S+ \S+) (.*)$")
+RETURN_VALUE = re.compile(r"\(return value (-?\d+)\)")
+SIGNAL = re.compile(r"\(signal (\d+)\)")
+MEMORY_USAGE = re.compile(r"^\s*(\d+)\s+-\s+MemoryUsage of job \(MB\)")
+RESIDENT_SET = re.compile(r"^\s*(\d+)\s+-\s+ResidentSetSize of job \(KB\)")
+RESOURCE_ROW = re.compile(r"^\s*(Memory \(MB\)|Disk \(KB\)|Cpus)\s*:\s*(\d+)")
+EVENT_STATUS = {
+    "000": "Idle",
+    "001": "Running",
+    "004": "Idle",
+    "005": "Completed",
+    "009": "Removed",
+    "012": "Held",
+    "013": "Idle",
+}
+STATE_FIELDS = [
+    "job_id", "log_file", "status", "submit_time", "start_time", "end_time",
+    "wall_time_s", "memory_mb", "disk_kb", "exit_code", "exit_signal",
+    "evictions", "hold_reason",
+]
+
+def parse_event_time(stamp: str) -> float:
+    """Parse 'YYYY-MM-DD HH:MM:SS' or the older 'MM/DD HH:MM:SS' user-log timestamps."""
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(stamp, fmt).timestamp()
+        except ValueError:
+            pass
+    year = datetime.datetime.now().year
+    return datetime.datetime.strptime(f"{year}/{stamp}", "%Y/%m/%d %H:%M:%S").timestamp()
+
+def split_events(data: bytes):
+    """Split raw user-log bytes into (complete events as line lists, bytes consumed)."""
+    events = []
+    consumed = 0
+    while True:
+        end = data.find(b"\n...\n", consumed)
+        if end == -1:
+            break
+        block = data[consumed:end].decode("utf-8", errors="replace").strip("\n")
+        consumed = end + len(b"\n...\n")
+        if block:
+            events.append(block.splitlines())
+    return events, consumed
+
+# -----------------------------
+# Tracker
+# -----------------------------
+class CondorLogTracker:
+    """Keeps per-file read offsets and per-job state built from user-log events."""
+
+    def __init__(self, state_file=None):
+        self.state_file = Path(state_file) if state_file else None
+        self.offsets = {}
+        self.jobs = {}
+        if self.state_file and self.state_file.exists():
+            state = json.loads(self.state_file.read_text())
+            self.offsets = state.get("offsets", {})
+            self.jobs = state.get("jobs", {})
+
+    def save(self):
+        if not self.state_file:
+            return
+        tmp_path = self.state_file.with_suffix(self.state_file.suffix + ".tmp")
+        tmp_path.write_text(json.dumps({"offsets": self.offsets, "jobs": self.jobs}, indent=1))
+        tmp_path.replace(self.state_file)
+
+    def poll(self, log_files):
+        """Read newly appended events from all log files; returns the number of events applied."""
+        n_events = 0
+        for log_file in log_files:
+            log_file = str(log_file)
+            offset = self.offsets.get(log_file, 0)
+            try:
+                with open(log_file, "rb") as f:
+                    f.seek(0, 2)
+                    size = f.tell()
+                    if size < offset:  # log was truncated or replaced: start over
+                        offset = 0
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            events, consumed = split_events(data)
+            for lines in events:
+                n_events += self._apply(lines, log_file)
+            self.offsets[log_file] = offset + consumed
+        return n_events
+
+    def _job(self, job_id, log_file):
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = self.jobs[job_id] = dict.fromkeys(STATE_FIELDS)
+            job.update(job_id=job_id, log_file=log_file, evictions=0)
+        return job
+
+    def _apply(self, lines, log_file):
+        m = EVENT_HEADER.match(lines[0])
+        if not m:
+            return 0
+        code, cluster, proc, stamp, _ = m.groups()
+        job = self._job(f"{int(cluster)}.{int(proc)}", log_file)
+        when = parse_event_time(stamp)
+        body = lines[1:]
+
+        if code in EVENT_STATUS:
+            job["status"] = EVENT_STATUS[code]
+
+        if code == "000":
+            job["submit_time"] = when
+        elif code == "001":
+            job["start_time"] = when
+        elif code == "004":
+            job["evictions"] += 1
+        elif code == "006":
+            for line in body:
+                mem = MEMORY_USAGE.match(line)
+                rss = RESIDENT_SET.match(line)
+                if mem:
+                    self._max(job, "memory_mb", int(mem.group(1)))
+                elif rss:
+                    self._max(job, "memory_mb", -(-int(rss.group(1)) // 1024))
+        elif code == "012":
+            job["hold_reason"] = body[0].strip() if body else None
+        elif code == "005":
+            job["end_time"] = when
+            for line in body:
+                ret = RETURN_VALUE.search(line)
+                sig = SIGNAL.search(line)
+                res = RESOURCE_ROW.match(line)
+                if ret:
+                    job["exit_code"] = int(ret.group(1))
+                elif sig:
+                    job["exit_signal"] = int(sig.group(1))
+                elif res and res.group(1) == "Memory (MB)":
+                    self._max(job, "memory_mb", int(res.group(2)))
+                elif res and res.group(1) == "Disk (KB)":
+                    self._max(job, "disk_kb", int(res.group(2)))
+            if job["start_time"] is not None:
+                job["wall_time_s"] = round(when - job["start_time"])
+        return 1
+
+    @staticmethod
+    def _max(job, field, value):
+        job[field] = value if job[field] is None else max(job[field], value)
+
+    def counts(self):
+        return Counter(job["status"] for job in self.jobs.values())
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=STATE_FIELDS)
+            writer.writeheader()
+            for job_id in sorted(self.jobs, key=lambda j: tuple(int(x) for x in j.split("."))):
+                writer.writerow(self.jobs[job_id])
+
+def find_user_logs(jobs_dir):
+    return sorted(Path(jobs_dir).glob("*/job.log"))
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Track HTCondor jobs from their user logs")
+    parser.add_argument("jobs_dir", type=Path, help="Directory with <job>/job.log user logs (e.g. generated_jobs)")
+    parser.add_argument("--state", default=None, help="JSON file keeping read offsets and job states between runs")
+    parser.add_argument("--csv", default=None, help="Write per-job wall time, memory, disk and exit code to CSV")
+    parser.add_argument("--follow", action="store_true", help="Keep tailing until all jobs are Completed or Removed")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls with --follow")
+    args = parser.parse_args()
+
+    tracker = CondorLogTracker(args.state)
+    while True:
+        tracker.poll(find_user_logs(args.jobs_dir))
+        tracker.save()
+        counts = tracker.counts()
+        now = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{now}] " + " | ".join(f"{s}: {counts.get(s, 0):>5}" for s in ("Idle", "Running", "Held", "Completed", "Removed"))
+              + f" | Total: {len(tracker.jobs)}")
+        if not args.follow or (tracker.jobs and all(j["status"] in ("Completed", "Removed") for j in tracker.jobs.values())):
+            break
+        time.sleep(args.interval)
+
+    if args.csv:
+        tracker.export_csv(args.csv)
+        print(f"Per-job usage written to {args.csv}")
+
+if __name__ == "__main__":
+    main()
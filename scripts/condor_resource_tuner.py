@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+condor_resource_tuner.py
+
+Per-process HTCondor resource requests derived from the measured usage of past
+jobs, instead of the same request_memory/request_disk/+MaxRuntime for everything.
+
+Harvesting:
+  - user logs: generated_jobs/<job>/job.log parsed with condor_log_tracker.py
+    (memory high-water mark, disk usage, wall time of terminated jobs)
+  - history:   condor_history -json for the clusters recorded in the job-state
+    store (condor_job_state.py), using MemoryUsage, DiskUsage and
+    RemoteWallClockTime; the job directory is found from the UserLog attribute
+
+Only jobs that terminated with exit code 0 are used. Samples are stored per
+process (read from myalg.processName in the job's options file) in a YAML
+profile file, keeping the newest MAX_SAMPLES per process. Each sample also
+records the events the job processed, estimated from its options file as
+myalg.n_events_generated shared out over the files in the input directory
+(capped by EvtMax), so the profiles give a measured throughput per process
+(events per wall-clock second) that generate_grid_jobs.py uses to size grid jobs.
+
+Recommendation per process:
+  request_memory = max measured memory * (1 + margin), rounded up to 100 MB
+  request_disk   = max measured disk   * (1 + margin), rounded up to 100 MB
+  +MaxRuntime    = max measured wall   * (1 + margin), rounded up to 10 min
+each bounded by the FLOOR/CEILING values below. Processes without samples keep
+DEFAULT_RESOURCES. generate_key4hep_options_and_htcondor.py reads the profile
+file when writing job.sub / jobs.sub.
+
+Usage:
+    python3 condor_resource_tuner.py harvest generated_jobs [--profiles resource_profiles.yaml] [--history]
+    python3 condor_resource_tuner.py show [--profiles resource_profiles.yaml]
+"""
+
+import re
+import json
+import math
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+import yaml
+
+from condor_log_tracker import CondorLogTracker, find_user_logs
+
+# -----------------------------
+# Configuration
+# -----------------------------
+DEFAULT_PROFILES = Path(__file__).resolve().parent.parent / "resource_profiles.yaml"  # Read by generate_key4hep_options_and_htcondor.py
+DEFAULT_JOB_STATE_DB = "condor_job_state.sqlite"
+MAX_SAMPLES = 50        # Newest samples kept per process
+SAFETY_MARGIN = 0.3     # Requests are the measured maximum + 30%
+
+# Requests used when a process has no history yet (the former hardcoded values)
+DEFAULT_RESOURCES = {
+    "request_cpus": 1,
+    "request_memory": 4000,      # MB
+    "request_disk": 2097152,     # KB (2GB, as Condor reads "2GB")
+    "max_runtime": 43200,        # s
+}
+FLOOR = {"request_memory": 500, "request_disk": 100000, "max_runtime": 1800}
+CEILING = {"request_memory": 16000, "request_disk": 20000000, "max_runtime": 172800}
+
+PROCESS_NAME = re.compile(r"^myalg\.processName\s*=\s*'([^']+)'", re.MULTILINE)
+N_EVENTS_GENERATED = re.compile(r"^myalg\.n_events_generated\s*=\s*(\d+)", re.MULTILINE)
+EVTMAX_SETTING = re.compile(r"EvtMax\s*=\s*(-?\d+)")
+FILES_LIST = re.compile(r"^files = \[(.*?)^\]", re.MULTILINE | re.DOTALL)
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def process_of_job_dir(job_dir):
+    """Process name of a generated job directory (myalg.processName, else <process>_jobNNN)."""
+    job_dir = Path(job_dir)
+    for options_file in sorted(job_dir.glob("higgsTo_invisible_*.py")):
+        m = PROCESS_NAME.search(options_file.read_text())
+        if m:
+            return m.group(1)
+    return re.sub(r"_job\d+$", "", job_dir.name)
+
+def events_of_job_dir(job_dir):
+    """
+    Estimated events processed by a generated job: n_events_generated times the
+    job's share of the .root files in its input directory, capped by EvtMax.
+    None if the options file does not give enough information.
+    """
+    for options_file in sorted(Path(job_dir).glob("higgsTo_invisible_*.py")):
+        text = options_file.read_text()
+        n_generated = N_EVENTS_GENERATED.search(text)
+        files = FILES_LIST.search(text)
+        if not n_generated or not files:
+            continue
+        inputs = [Path(f) for f in re.findall(r'"([^"]+)"', files.group(1))]
+        if not inputs:
+            continue
+        try:
+            n_available = sum(1 for f in inputs[0].parent.iterdir() if f.suffix == ".root")
+        except OSError:
+            return None
+        if not n_available:
+            return None
+        events = int(n_generated.group(1)) * len(inputs) / n_available
+        evtmax = EVTMAX_SETTING.search(text)
+        if evtmax and int(evtmax.group(1)) > 0:
+            events = min(events, int(evtmax.group(1)))
+        return round(events)
+    return None
+
+def round_up(value, step):
+    return int(math.ceil(value / step) * step)
+
+def bounded(name, value):
+    return max(FLOOR[name], min(CEILING[name], value))
+
+# -----------------------------
+# Profile store
+# -----------------------------
+class ResourceProfiles:
+    """
+    YAML store of measured usage per process:
+      {process: {job_id: {memory_mb, disk_kb, wall_time_s, n_events, recorded_at}}}
+    """
+
+    def __init__(self, path=DEFAULT_PROFILES, margin=SAFETY_MARGIN):
+        self.path = Path(path)
+        self.margin = margin
+        self.samples = {}
+        if self.path.exists():
+            self.samples = (yaml.safe_load(self.path.read_text()) or {}).get("processes", {})
+
+    def save(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(yaml.safe_dump({"processes": self.samples}, sort_keys=True))
+        tmp_path.replace(self.path)
+
+    def add(self, process, job_id, memory_mb, disk_kb, wall_time_s, n_events=None):
+        """Record one finished job; returns False if the job was already recorded."""
+        per_process = self.samples.setdefault(process, {})
+        if job_id in per_process:
+            return False
+        per_process[job_id] = {
+            "memory_mb": memory_mb,
+            "disk_kb": disk_kb,
+            "wall_time_s": wall_time_s,
+            "n_events": n_events,
+            "recorded_at": time.time(),
+        }
+        if len(per_process) > MAX_SAMPLES:
+            newest = sorted(per_process.items(), key=lambda kv: kv[1]["recorded_at"])[-MAX_SAMPLES:]
+            self.samples[process] = dict(newest)
+        return True
+
+    def _peak(self, process, field):
+        values = [s[field] for s in self.samples.get(process, {}).values() if s.get(field)]
+        return max(values) if values else None
+
+    def throughput(self, process):
+        """(events per wall-clock second, number of jobs) measured for a process, or (None, 0)."""
+        samples = [s for s in self.samples.get(process, {}).values() if s.get("n_events") and s.get("wall_time_s")]
+        if not samples:
+            return None, 0
+        return sum(s["n_events"] for s in samples) / sum(s["wall_time_s"] for s in samples), len(samples)
+
+    def recommend(self, process):
+        """Resource requests for one process (DEFAULT_RESOURCES where nothing was measured)."""
+        resources = dict(DEFAULT_RESOURCES)
+        scale = 1.0 + self.margin
+        memory = self._peak(process, "memory_mb")
+        disk = self._peak(process, "disk_kb")
+        wall = self._peak(process, "wall_time_s")
+        if memory:
+            resources["request_memory"] = bounded("request_memory", round_up(memory * scale, 100))
+        if disk:
+            resources["request_disk"] = bounded("request_disk", round_up(disk * scale, 100000))
+        if wall:
+            resources["max_runtime"] = bounded("max_runtime", round_up(wall * scale, 600))
+        return resources
+
+# -----------------------------
+# Harvesting
+# -----------------------------
+def harvest_user_logs(profiles, jobs_dir):
+    """Add the successful jobs found in <jobs_dir>/*/job.log. Returns the number of new samples."""
+    tracker = CondorLogTracker()
+    tracker.poll(find_user_logs(jobs_dir))
+    processes = {}
+    n_new = 0
+    for job_id, job in tracker.jobs.items():
+        if job["status"] != "Completed" or job["exit_code"] != 0:
+            continue
+        job_dir = Path(job["log_file"]).parent
+        if job_dir not in processes:
+            processes[job_dir] = process_of_job_dir(job_dir), events_of_job_dir(job_dir)
+        process, n_events = processes[job_dir]
+        n_new += profiles.add(process, job_id, job["memory_mb"], job["disk_kb"], job["wall_time_s"], n_events)
+    return n_new
+
+def harvest_history(profiles, job_state_db):
+    """Add the successful jobs of the clusters in the job-state store, via one condor_history call."""
+    from condor_job_state import JobStateDB
+
+    db = JobStateDB(job_state_db)
+    clusters = sorted({job["cluster_id"] for job in db.all() if job["cluster_id"] is not None})
+    db.close()
+    if not clusters:
+        return 0
+    result = subprocess.run(
+        ["condor_history", "-json",
+         "-constraint", " || ".join(f"ClusterId == {c}" for c in clusters),
+         "-attributes", "ClusterId,ProcId,ExitCode,MemoryUsage,DiskUsage,RemoteWallClockTime,UserLog"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True
+    )
+    output = result.stdout.strip()
+    n_new = 0
+    for ad in json.loads(output) if output else []:
+        if ad.get("ExitCode") != 0 or not ad.get("UserLog"):
+            continue
+        job_dir = Path(ad["UserLog"]).parent
+        wall = ad.get("RemoteWallClockTime")
+        n_new += profiles.add(process_of_job_dir(job_dir), f"{ad['ClusterId']}.{ad['ProcId']}",
+                              ad.get("MemoryUsage"), ad.get("DiskUsage"), round(wall) if wall else None,
+                              events_of_job_dir(job_dir))
+    return n_new
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Per-process HTCondor resource requests from measured usage")
+    parser.add_argument("--profiles", default=DEFAULT_PROFILES, help="YAML file with per-process usage samples (default: resource_profiles.yaml in the repository root, where the job generator reads it)")
+    parser.add_argument("--margin", type=float, default=SAFETY_MARGIN, help="Safety margin on top of the measured maximum")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_harvest = sub.add_parser("harvest", help="Collect usage of finished jobs")
+    p_harvest.add_argument("jobs_dir", type=Path, help="Directory with <job>/job.log user logs (e.g. generated_jobs)")
+    p_harvest.add_argument("--history", action="store_true", help="Also query condor_history for the clusters in --job-state-db")
+    p_harvest.add_argument("--job-state-db", default=DEFAULT_JOB_STATE_DB, help="Job-state store written by submit_and_monitor_condor_jobs.py")
+
+    sub.add_parser("show", help="Print the recommended requests per process")
+
+    args = parser.parse_args()
+    profiles = ResourceProfiles(args.profiles, margin=args.margin)
+
+    if args.command == "harvest":
+        n_new = harvest_user_logs(profiles, args.jobs_dir)
+        if args.history:
+            try:
+                n_new += harvest_history(profiles, args.job_state_db)
+            except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
+                print(f"condor_history query failed: {e}")
+        profiles.save()
+        print(f"✅ Recorded {n_new} new job samples in {args.profiles}")
+
+    print(f"{'Process':<30} | {'Samples':>7} | {'Memory (MB)':>11} | {'Disk (KB)':>10} | {'MaxRuntime (s)':>14} | {'Evt/s':>7}")
+    print("-" * 96)
+    for process in sorted(profiles.samples):
+        r = profiles.recommend(process)
+        rate, _ = profiles.throughput(process)
+        rate_str = "n/a" if rate is None else f"{rate:.2f}"
+        print(f"{process:<30} | {len(profiles.samples[process]):>7} | {r['request_memory']:>11} | "
+              f"{r['request_disk']:>10} | {r['max_runtime']:>14} | {rate_str:>7}")
+
+if __name__ == "__main__":
+    main()
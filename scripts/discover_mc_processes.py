@@ -13,12 +13,16 @@ Produces a master metadata YAML (`mc_metadata.yaml`) that contains:
 - absolute path (stored once)
 - list of .root files
 
+The directory walk is done by sample_scanner.py (parallel listings, cached
+per directory in SCAN_CACHE so unchanged directories are not listed again).
+
 Also writes a logfile `discover_mc_processes.log`.
 """
 
 import yaml
 import logging
-from pathlib import Path
+
+from sample_scanner import scan_samples
 
 # -----------------------------
 # Configuration
@@ -26,6 +30,8 @@ from pathlib import Path
 ROOT_DIR = "/afs/cern.ch/user/c/chensel/cernbox/ILC/HtoInv/MC/pilot_samples"   # TODO: adjust
 OUTPUT_FILE = "mc_metadata.yaml"
 LOG_FILE = "discover_mc_processes.log"
+SCAN_CACHE = "sample_scan_cache.json"   # Directory listing cache, "" to disable
+SCAN_WORKERS = 16                       # Parallel directory listings
 
 # -----------------------------
 # Logging setup
@@ -42,25 +48,24 @@ logging.basicConfig(
 # -----------------------------
 def discover_processes(root_dir: str):
     processes = {}
-    for process_dir in Path(root_dir).iterdir():
-        edm_dir = process_dir / "edm4hep"
-        if not edm_dir.is_dir():
-            logging.warning(f"Skipping {process_dir}, no edm4hep/ subdir")
+    for process_name, edm in scan_samples(root_dir, workers=SCAN_WORKERS, cache_path=SCAN_CACHE).items():
+        if edm is None:
+            logging.warning(f"Skipping {process_name}, no edm4hep/ subdir")
             continue
 
-        root_files = sorted([f.name for f in edm_dir.glob("*.root")])
+        root_files = list(edm["files"])
         if not root_files:
-            logging.warning(f"Process {process_dir.name} has no .root files")
+            logging.warning(f"Process {process_name} has no .root files")
             continue
 
-        processes[process_dir.name] = {
+        processes[process_name] = {
             "cross_section_pb": 0.0,   # placeholder
             "n_events": 0,             # placeholder
             "k_factor": 1.0,
-            "path": str(edm_dir.resolve()),
+            "path": edm["path"],
             "files": root_files
         }
-        logging.info(f"Discovered {len(root_files)} files for {process_dir.name}")
+        logging.info(f"Discovered {len(root_files)} files for {process_name}")
     return processes
 
 # -----------------------------
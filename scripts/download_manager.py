@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+download_manager.py
+
+Parallel, resumable download of grid files (LFNs) into samples/<process>/.
+
+- N concurrent transfers (one TRANSFER_CMD call per file, default dirac-dms-get-file)
+- Each transfer runs in a private .partial directory next to the target and the
+  file is renamed into place only after verification, so a file present under
+  its final name is always complete and is skipped on the next run
+- Verification against the catalogue size and Adler32 checksum from
+  METADATA_CMD (dirac-dms-lfn-metadata, queried in batches); without metadata
+  only a non-empty file is required
+- Per-file retries with exponential backoff
+- The target directory comes from the parsed process name (lfn_parser), not
+  from substring matching on the LFN
+
+TRANSFER_CMD and METADATA_CMD can point to local fake commands for testing:
+the transfer command is called as `<cmd> <lfn>` in the download directory and
+must leave <basename(lfn)> there; the metadata command is called as
+`<cmd> <lfn> [<lfn> ...]` and must print DIRAC's {'Successful': {...}, 'Failed': {...}} dict.
+
+Usage:
+    python3 download_manager.py pilot_lfns.txt [--samples-dir samples] [-j 8] [--retries 3] [--no-verify]
+"""
+
+import ast
+import time
+import zlib
+import shutil
+import argparse
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from lfn_parser import LFNCatalog
+
+# -----------------------------
+# Configuration
+# -----------------------------
+TRANSFER_CMD = "dirac-dms-get-file"
+METADATA_CMD = "dirac-dms-lfn-metadata"
+METADATA_BATCH = 200
+PARTIAL_PREFIX = ".partial_"
+
+# -----------------------------
+# Verification
+# -----------------------------
+def adler32_file(path, chunk_size=8 * 1024 * 1024) -> str:
+    """Adler32 of a file as the 8-digit hex string DIRAC stores."""
+    value = 1
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            value = zlib.adler32(chunk, value)
+    return f"{value & 0xFFFFFFFF:08x}"
+
+def fetch_metadata(lfns, cmd=METADATA_CMD, batch=METADATA_BATCH):
+    """{lfn: {"size": int, "adler32": str or None}} from the file catalogue; LFNs it cannot resolve are left out."""
+    metadata = {}
+    lfns = list(lfns)
+    for start in range(0, len(lfns), batch):
+        chunk = lfns[start:start + batch]
+        try:
+            result = subprocess.run([cmd, *chunk], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    text=True, check=True)
+            output = result.stdout
+            reply = ast.literal_eval(output[output.index("{"):output.rindex("}") + 1])
+            reply = reply.get("Value", reply)  # S_OK({...}) wrapper or the bare dict
+        except (subprocess.CalledProcessError, FileNotFoundError, ValueError, SyntaxError) as e:
+            print(f"⚠️ Metadata query failed for {len(chunk)} LFNs: {e}")
+            continue
+        for lfn, meta in reply.get("Successful", {}).items():
+            checksum = meta.get("Checksum")
+            metadata[lfn] = {
+                "size": int(meta["Size"]) if "Size" in meta else None,
+                "adler32": checksum.lower().zfill(8) if checksum and meta.get("ChecksumType", "AD").upper().startswith("AD") else None,
+            }
+    return metadata
+
+def verify_file(path: Path, expected) -> str:
+    """Empty string if path matches the expected size/checksum, else the reason."""
+    size = path.stat().st_size
+    if size == 0:
+        return "empty file"
+    if not expected:
+        return ""
+    if expected.get("size") is not None and size != expected["size"]:
+        return f"size {size} != {expected['size']}"
+    if expected.get("adler32") and adler32_file(path) != expected["adler32"]:
+        return "Adler32 checksum mismatch"
+    return ""
+
+# -----------------------------
+# Download manager
+# -----------------------------
+class DownloadManager:
+    """Downloads (lfn, process) pairs into samples_dir/<process>/ with retries and verification."""
+
+    def __init__(self, samples_dir, transfers=4, retries=3, backoff=10.0, transfer_cmd=TRANSFER_CMD,
+                 metadata=None, timeout=None):
+        self.samples_dir = Path(samples_dir)
+        self.transfers = transfers
+        self.retries = retries
+        self.backoff = backoff
+        self.transfer_cmd = transfer_cmd
+        self.metadata = metadata or {}
+        self.timeout = timeout
+
+    def target(self, lfn, process) -> Path:
+        return self.samples_dir / process / Path(lfn).name
+
+    def download(self, lfn, process):
+        """
+        Fetch one LFN unless it is already present and valid.
+        Returns (status, path, message) with status "skipped", "downloaded" or "failed".
+        """
+        target = self.target(lfn, process)
+        expected = self.metadata.get(lfn)
+        if target.exists():
+            try:
+                problem = verify_file(target, expected)
+                if not problem:
+                    return "skipped", target, "already present"
+                print(f"⚠️ Existing {target} is invalid ({problem}), downloading again")
+                target.unlink()
+            except OSError as e:
+                return "failed", target, f"cannot check existing file: {e}"
+
+        partial_dir = target.parent / f"{PARTIAL_PREFIX}{target.name}"
+        problem = ""
+        for attempt in range(1, self.retries + 1):
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            try:
+                partial_dir.mkdir(parents=True)
+                subprocess.run(
+                    [self.transfer_cmd, lfn],
+                    cwd=partial_dir,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    check=True,
+                    timeout=self.timeout,
+                )
+                fetched = partial_dir / target.name
+                problem = verify_file(fetched, expected) if fetched.exists() else "transfer produced no file"
+                if not problem:
+                    fetched.replace(target)
+                    shutil.rmtree(partial_dir, ignore_errors=True)
+                    return "downloaded", target, f"attempt {attempt}"
+            except subprocess.CalledProcessError as e:
+                lines = (e.stderr or "").strip().splitlines()
+                problem = lines[-1] if lines else f"exit code {e.returncode}"
+            except subprocess.TimeoutExpired:
+                problem = f"timed out after {self.timeout}s"
+            except FileNotFoundError as e:
+                if e.filename == self.transfer_cmd:  # not installed: retrying will not help
+                    problem = f"{self.transfer_cmd} not found"
+                    break
+                problem = str(e)
+            except OSError as e:
+                problem = str(e)
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        return "failed", target, problem
+
+    def run(self, items):
+        """
+        Download all (lfn, process) pairs with self.transfers concurrent transfers.
+        Returns (Counter of statuses, [(lfn, reason), ...] for failures).
+        """
+        items = list(items)
+        tally = Counter()
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.transfers) as pool:
+            futures = {pool.submit(self.download, lfn, process): lfn for lfn, process in items}
+            for n, future in enumerate(as_completed(futures), 1):
+                lfn = futures[future]
+                status, path, message = future.result()
+                tally[status] += 1
+                if status == "failed":
+                    failures.append((lfn, message))
+                    print(f"❌ [{n}/{len(items)}] {Path(lfn).name}: {message}")
+                elif status == "downloaded":
+                    print(f"⬇ [{n}/{len(items)}] {path} ({message})")
+        return tally, failures
+
+def items_from_catalog(catalog):
+    """(lfn, process) pairs for every parsed LFN; unparsed LFNs go to 'unknown'."""
+    items = list(zip(catalog.lfns, catalog.column("process")))
+    items.extend((lfn, "unknown") for lfn in catalog.unparsed)
+    return items
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Parallel resumable download of LFNs into samples/<process>/")
+    parser.add_argument("lfn_file", help="LFNs to download, one per line")
+    parser.add_argument("--samples-dir", default="samples", help="Target directory (files go to <samples-dir>/<process>/)")
+    parser.add_argument("-j", "--transfers", type=int, default=4, help="Concurrent transfers")
+    parser.add_argument("--retries", type=int, default=3, help="Attempts per file")
+    parser.add_argument("--backoff", type=float, default=10.0, help="Seconds before the first retry (doubles each time)")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds per transfer attempt")
+    parser.add_argument("--no-verify", action="store_true", help="Skip the catalogue size/checksum lookup")
+    parser.add_argument("--transfer-cmd", default=TRANSFER_CMD, help="Transfer command (a fake one for testing)")
+    parser.add_argument("--metadata-cmd", default=METADATA_CMD, help="Catalogue metadata command (a fake one for testing)")
+    args = parser.parse_args()
+
+    items = items_from_catalog(LFNCatalog.from_file(args.lfn_file))
+    metadata = {} if args.no_verify else fetch_metadata([lfn for lfn, _ in items], args.metadata_cmd)
+    manager = DownloadManager(args.samples_dir, args.transfers, args.retries, args.backoff,
+                              args.transfer_cmd, metadata, args.timeout)
+    tally, failures = manager.run(items)
+    print(f"✔ Downloaded {tally['downloaded']}, already present {tally['skipped']}, failed {tally['failed']} "
+          f"(verified against catalogue: {len(metadata)} of {len(items)})")
+    for lfn, reason in failures:
+        print(f"   failed: {lfn} ({reason})")
+
+if __name__ == "__main__":
+    main()
@@ -17,38 +17,32 @@
 #
 # Notes:
 #   - The SUSY process list is based on known naming patterns (n1n1h, e2e2h, etc.).
-#     Update SUSY_KEYWORDS if new naming conventions appear in future productions.
+#     Update SUSY_KEYWORDS in lfn_parser.py if new naming conventions appear in
+#     future productions.
+#   - LFNs are parsed once by the shared lfn_parser.LFNCatalog. Entries that are
+#     not DST files (e.g. LOG tarballs) are grouped by their directory part
+#     alone and kept with their process and version, as before.
 #   - The script ignores differences in file numbering (e.g. “000/”, “001/”) since
 #     those reflect splitting within a single production, not distinct datasets.
+#   - --streaming runs two passes over the input instead of loading it: pass 1
+#     collects the versions per process, pass 2 spills the selected and SUSY LFNs
+#     into sorted temporary chunks that are merged into the output files. Memory
+#     then scales with the number of (process, version) groups, and the output
+#     is byte-identical to the default mode.
 #   - Recommended versions may evolve (e.g. v02-02 → v02-02-03); always verify
 #     the latest production recommendations on the MC production website before running.
 #
 # Author: Carsten (with GPT-5 assistance)
 # -----------------------------------------------------------------------------
 
-import re
 import argparse
+import heapq
+import tempfile
 from collections import defaultdict
+from pathlib import Path
 
-# ----------------------------
-# Configuration
-# ----------------------------
-
-# Known SUSY process patterns
-SUSY_KEYWORDS = [
-    "n1n1h", "n23n23h", "e1e1h", "e2e2h", "e3e3h",
-    "n23n23h_dd", "n23n23h_uu", "n23n23h_ss",
-    "n1n1h_dd", "n1n1h_uu", "n1n1h_ss",
-    "e3e3h_dd", "e3e3h_uu", "e3e3h_ss",
-    "e2e2h_dd", "e2e2h_uu", "e2e2h_ss",
-    "e1e1h_dd", "e1e1h_uu", "e1e1h_ss",
-    "qqh_e2e2", "qqh_e3e3"
-]
-
-# Regex to extract version and process name
-pattern = re.compile(
-    r"/ild/dst/[^/]+/(?P<process>[^/]+)/ILD_[^/]+/(?P<version>v\d{2}-\d{2}(?:-\d{2})?)"
-)
+from lfn_parser import LFNCatalog, SUSY_KEYWORDS, version_key, parse_lfn, parse_group_version, iter_lfns
+from lfn_catalog_db import LFNDatabase
 
 # ----------------------------
 # Helpers
@@ -57,48 +51,147 @@ pattern = re.compile(
 def is_susy(lfn: str) -> bool:
     return any(tag in lfn for tag in SUSY_KEYWORDS)
 
-def version_key(version: str) -> tuple:
-    """Convert version string like 'v02-02-03' → (2, 2, 3) for comparison"""
-    parts = version.strip("v").split("-")
-    return tuple(int(p) for p in parts)
+class ExternalSorter:
+    """
+    Sort an arbitrary number of lines with bounded memory: lines are buffered,
+    spilled to sorted temporary chunk files every chunk_lines lines, and
+    merged with heapq.merge when written out.
+    """
+
+    def __init__(self, tmp_dir: str, name: str, chunk_lines: int):
+        self.tmp_dir = Path(tmp_dir)
+        self.name = name
+        self.chunk_lines = chunk_lines
+        self.buffer = []
+        self.chunks = []
+        self.count = 0
+
+    def add(self, line: str):
+        self.buffer.append(line)
+        self.count += 1
+        if len(self.buffer) >= self.chunk_lines:
+            self._spill()
+
+    def _spill(self):
+        if not self.buffer:
+            return
+        chunk = self.tmp_dir / f"{self.name}_{len(self.chunks):05d}.txt"
+        self.buffer.sort()
+        with open(chunk, "w") as f:
+            f.writelines(line + "\n" for line in self.buffer)
+        self.chunks.append(chunk)
+        self.buffer = []
+
+    def write_sorted(self, output_file: str):
+        """Write all lines sorted and joined by newlines (no trailing newline)."""
+        self._spill()
+        handles = [open(chunk) for chunk in self.chunks]
+        try:
+            merged = heapq.merge(*((line.rstrip("\n") for line in h) for h in handles))
+            with open(output_file, "w") as out:
+                for i, line in enumerate(merged):
+                    out.write(line if i == 0 else "\n" + line)
+        finally:
+            for h in handles:
+                h.close()
+
+def select_latest_versions(process_versions):
+    """Returns (summary_lines, {process: latest_version}) for the version mapping."""
+    summary_lines = []
+    summary_lines.append(f"{'Process':40} | {'Versions Found':35} | Selected\n" + "-"*90)
+    latest = {}
+
+    for process, versions in sorted(process_versions.items()):
+        all_versions = sorted(versions, key=version_key)
+        latest[process] = all_versions[-1]
+        summary_lines.append(
+            f"{process:40} | {', '.join(all_versions):35} | {latest[process]}"
+        )
+    return summary_lines, latest
+
+def print_report(output_file, susy_file, summary_file, n_processes, n_susy, summary_lines):
+    print(f"\n✅ Output written to {output_file}")
+    print(f"✅ Skipped SUSY LFNs written to {susy_file}")
+    print(f"✅ Process summary written to {summary_file}")
+    print(f"Processes kept (latest versions only): {n_processes}")
+    print(f"Skipped SUSY files: {n_susy}\n")
+
+    print("\n".join(summary_lines[:15]))
+    if len(summary_lines) > 15:
+        print(f"... ({len(summary_lines)-15} more processes) ...")
 
 # ----------------------------
 # Main function
 # ----------------------------
 
-def main(input_file: str, output_file: str, susy_file: str, summary_file: str):
-    with open(input_file) as f:
-        lfns = [line.strip() for line in f if line.strip()]
-
-    susy_lfns = []
+def split_non_dst(lines):
+    """
+    Sort the lines that are not DST files into ({process_group: {version: [lfn]}},
+    susy_lfns, unparsed): non-SUSY entries whose directory part still gives a
+    process group and version (e.g. LOG tarballs) are kept there.
+    """
     process_versions = defaultdict(lambda: defaultdict(list))
-
-    for lfn in lfns:
+    susy_lfns = []
+    unparsed = []
+    for lfn in lines:
+        group_version = parse_group_version(lfn)
         if is_susy(lfn):
             susy_lfns.append(lfn)
-            continue
+        elif group_version is None:
+            unparsed.append(lfn)
+        else:
+            process_versions[group_version[0]][group_version[1]].append(lfn)
+    return process_versions, susy_lfns, unparsed
 
-        m = pattern.search(lfn)
-        if not m:
-            print(f"⚠️ Could not parse: {lfn}")
-            continue
+def load_from_file(input_file: str):
+    """Parse the flat LFN list; returns (process_versions, fetch, susy_lfns, unparsed)."""
+    catalog = LFNCatalog.from_file(input_file)
 
-        process = m.group("process")
-        version = m.group("version")
-        process_versions[process][version].append(lfn)
+    # Group by the process-group directory (e.g. 4f_WW_hadronic) and version
+    process_versions, susy_lfns, unparsed = split_non_dst(catalog.unparsed)
+    for (process, version), rows in catalog.group_rows("group", "version").items():
+        for i in rows:
+            lfn = catalog.lfns[i]
+            if is_susy(lfn):
+                susy_lfns.append(lfn)
+            else:
+                process_versions[process][version].append(lfn)
+
+    fetch = lambda process, version: process_versions[process][version]
+    return process_versions, fetch, susy_lfns, unparsed
+
+def load_from_db(db: LFNDatabase):
+    """Same as load_from_file, but as indexed queries against the SQLite catalog."""
+    extra_versions, susy_lfns, unparsed = split_non_dst(db.unparsed())
+    susy_processes = [p for p in db.processes() if is_susy(p)]
+    susy_lfns += db.lfns_for_processes(susy_processes)
+
+    process_versions = db.group_versions(exclude_processes=susy_processes)
+    for process, versions in extra_versions.items():
+        known = process_versions.setdefault(process, [])
+        known.extend(v for v in versions if v not in known)
+    fetch = lambda process, version: (db.lfns_for_group_version(process, version, exclude_processes=susy_processes)
+                                      + extra_versions.get(process, {}).get(version, []))
+    return process_versions, fetch, susy_lfns, unparsed
+
+def main(input_file: str, output_file: str, susy_file: str, summary_file: str, catalog_db: str = None):
+    db = None
+    if catalog_db:
+        db = LFNDatabase(catalog_db)
+        process_versions, fetch, susy_lfns, unparsed = load_from_db(db)
+    else:
+        process_versions, fetch, susy_lfns, unparsed = load_from_file(input_file)
+
+    for lfn in unparsed:
+        print(f"⚠️ Could not parse: {lfn}")
 
     # Keep latest version per process
+    summary_lines, latest = select_latest_versions(process_versions)
     selected = []
-    summary_lines = []
-    summary_lines.append(f"{'Process':40} | {'Versions Found':35} | Selected\n" + "-"*90)
-
-    for process, versions in sorted(process_versions.items()):
-        all_versions = sorted(versions.keys(), key=version_key)
-        latest_version = all_versions[-1]
-        selected.extend(versions[latest_version])
-        summary_lines.append(
-            f"{process:40} | {', '.join(all_versions):35} | {latest_version}"
-        )
+    for process, latest_version in latest.items():
+        selected.extend(fetch(process, latest_version))
+    if db is not None:
+        db.close()
 
     # Output results
     with open(output_file, "w") as out:
@@ -108,15 +201,48 @@ def main(input_file: str, output_file: str, susy_file: str, summary_file: str):
     with open(summary_file, "w") as out:
         out.write("\n".join(summary_lines))
 
-    print(f"\n✅ Output written to {output_file}")
-    print(f"✅ Skipped SUSY LFNs written to {susy_file}")
-    print(f"✅ Process summary written to {summary_file}")
-    print(f"Processes kept (latest versions only): {len(process_versions)}")
-    print(f"Skipped SUSY files: {len(susy_lfns)}\n")
+    print_report(output_file, susy_file, summary_file, len(process_versions), len(susy_lfns), summary_lines)
 
-    print("\n".join(summary_lines[:15]))
-    if len(summary_lines) > 15:
-        print(f"... ({len(summary_lines)-15} more processes) ...")
+def stream_group_version(lfn: str):
+    """(process group, version) of one LFN; the directory part alone for non-DST entries."""
+    rec = parse_lfn(lfn)
+    return (rec.group, rec.version) if rec is not None else parse_group_version(lfn)
+
+def main_streaming(input_file: str, output_file: str, susy_file: str, summary_file: str,
+                   chunk_lines: int = 500000):
+    """Two-pass variant of main() whose memory scales with the number of (process, version) groups."""
+    # Pass 1: versions per process-group directory, no LFNs kept
+    process_versions = defaultdict(set)
+    for lfn in iter_lfns(input_file):
+        if is_susy(lfn):
+            continue
+        group_version = stream_group_version(lfn)
+        if group_version is None:
+            print(f"⚠️ Could not parse: {lfn}")
+        else:
+            process_versions[group_version[0]].add(group_version[1])
+
+    summary_lines, latest = select_latest_versions(process_versions)
+
+    # Pass 2: route LFNs into external sorters
+    with tempfile.TemporaryDirectory(prefix="filter_and_merge_") as tmp_dir:
+        selected = ExternalSorter(tmp_dir, "selected", chunk_lines)
+        susy_lfns = ExternalSorter(tmp_dir, "susy", chunk_lines)
+        for lfn in iter_lfns(input_file):
+            if is_susy(lfn):
+                susy_lfns.add(lfn)
+                continue
+            group_version = stream_group_version(lfn)
+            if group_version is not None and latest.get(group_version[0]) == group_version[1]:
+                selected.add(lfn)
+
+        selected.write_sorted(output_file)
+        susy_lfns.write_sorted(susy_file)
+
+    with open(summary_file, "w") as out:
+        out.write("\n".join(summary_lines))
+
+    print_report(output_file, susy_file, summary_file, len(process_versions), susy_lfns.count, summary_lines)
 
 # ----------------------------
 # CLI entry
@@ -124,9 +250,22 @@ def main(input_file: str, output_file: str, susy_file: str, summary_file: str):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Filter and combine ILD MC LFN list")
-    parser.add_argument("input_file", help="Input LFN list (one per line)")
+    parser.add_argument("input_file", nargs="?", help="Input LFN list (one per line)")
     parser.add_argument("-o", "--output", default="filtered_LFNs.txt", help="Output LFN file")
     parser.add_argument("-s", "--susy", default="skipped_SUSY_LFNs.txt", help="Output file for skipped SUSY LFNs")
     parser.add_argument("-t", "--summary", default="process_summary.txt", help="Process summary output file")
+    parser.add_argument("--catalog-db", default=None,
+                        help="Query this SQLite LFN catalog (see lfn_catalog_db.py) instead of reading input_file")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Bounded-memory two-pass mode with external merge sort (byte-identical output)")
+    parser.add_argument("--chunk-lines", type=int, default=500000,
+                        help="LFNs held in memory per sorted chunk in --streaming mode")
     args = parser.parse_args()
-    main(args.input_file, args.output, args.susy, args.summary)
+    if not args.input_file and not args.catalog_db:
+        parser.error("either input_file or --catalog-db is required")
+    if args.streaming:
+        if args.catalog_db:
+            parser.error("--streaming reads input_file and cannot be combined with --catalog-db")
+        main_streaming(args.input_file, args.output, args.susy, args.summary, args.chunk_lines)
+    else:
+        main(args.input_file, args.output, args.susy, args.summary, args.catalog_db)
@@ -10,65 +10,174 @@ from a master LFN list and a YAML cross-section file (new format).
 - Writes submit_grid_<GenID>_<ProdID>.py (job submission script)
 - Logs actions to a timestamped log file
 - Supports dry run (--dry-run)
+- Optionally queries the SQLite LFN catalog (--catalog-db) instead of the flat LFN list
+- Splits every (GenID, ProdID) into grid jobs of about --target-cpu-hours (or
+  --target-events) each: events per file = NumberOfEvents / number of files of
+  the process, CPU time = events / events_per_second. The throughput of a
+  process is measured from its finished HTCondor analysis jobs
+  (condor_resource_tuner.py harvest, --resource-profiles: events per wall-clock
+  second, so setup and copy time count as well). --split-config (see
+  yaml/grid_split.yaml) overrides it and the split per process:
+
+    default:
+      events_per_second: 10.0             # processes without a measurement
+    processes:
+      qqh:    {events_per_second: 25.0}   # fixed throughput
+      2f_z_h: {files_per_job: 5}          # fixed split
+      4f_ww_h: {target_events: 20000}     # own event target
+
+  Per-process entries win over the command line, which wins over the default
+  section. The chosen split and where its throughput came from are written to
+  the generation log
+- With --shared-steering, the options file is rendered once into
+  steering/higgsToInvisible_shared_<hash>.py (name from the content hash, never
+  rewritten) and every job directory only gets a job_params.json sidecar with
+  cross_section, n_events_generated, processName and processID, which the
+  steering file reads at startup. With --steering-lfn-dir the steering file is
+  referenced from grid storage, and submit_all.sh uploads it once if missing
+- Regenerates incrementally (job_manifest.py): each <GenID>_<ProdID>/ records a
+  hash of its rendered files (which reflect the file list, split, cross
+  section, steering and global settings) and is only rewritten, atomically,
+  when that hash changes; generated directories no longer produced are reported as stale
 """
 
-import os
+import json
+import math
+import hashlib
 import argparse
 import yaml
 from datetime import datetime
 from pathlib import Path
 import textwrap
-import re
+
+from lfn_parser import LFNCatalog
+from lfn_catalog_db import LFNDatabase
+from job_chunker import plan_n_jobs
+from condor_resource_tuner import ResourceProfiles, DEFAULT_PROFILES
+from job_manifest import inputs_hash, is_current, write_job_files, write_if_changed, atomic_write_text, find_stale_dirs
 
 # --- hardcoded global settings
 TARGET_LUMI = 1000.0
 SANDBOX_PATH = "LFN:/ilc/user/c/chensel/job_sandbox.tgz"
 GAUDI_VERSION = "key4hep_250529"
+TARGET_CPU_HOURS = 8.0              # Aimed-for CPU time per grid job
+DEFAULT_EVENTS_PER_SECOND = 10.0    # Throughput when neither the split config nor a measurement has one
+SPLIT_RULES = ("files_per_job", "target_events", "target_cpu_hours")  # First one set in a config layer wins
+MAX_FILES_PER_GRID_JOB = 100
+STEERING_DIR = Path("steering")     # Shared steering files (--shared-steering)
+JOB_PARAMS_FILE = "job_params.json"
+STEERING_SE = "CERN-DST-EOS"
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Generate ILCDIRAC submission scripts.")
-    parser.add_argument("lfn_file", help="Path to all_files.txt (list of LFNs)")
+    parser.add_argument("lfn_file", nargs="?", help="Path to all_files.txt (list of LFNs)")
     parser.add_argument("xsec_file", help="Path to cross-section YAML file")
+    parser.add_argument("--catalog-db", default=None,
+                        help="Query this SQLite LFN catalog (see lfn_catalog_db.py) instead of reading lfn_file")
+    parser.add_argument("--split-config", default=None,
+                        help="YAML with per-process throughput and split overrides (see yaml/grid_split.yaml)")
+    parser.add_argument("--target-cpu-hours", type=float, default=None,
+                        help=f"CPU time per grid job (default: split config, else {TARGET_CPU_HOURS})")
+    parser.add_argument("--target-events", type=int, default=None,
+                        help="Events per grid job instead of a CPU-time target")
+    parser.add_argument("--resource-profiles", default=DEFAULT_PROFILES,
+                        help="Measured per-process throughput from condor_resource_tuner.py harvest (default: %(default)s)")
+    parser.add_argument("--shared-steering", action="store_true",
+                        help=f"One content-hashed steering file for all jobs plus a {JOB_PARAMS_FILE} per job")
+    parser.add_argument("--steering-lfn-dir", default=None,
+                        help="Grid directory (e.g. /ilc/user/c/chensel/steering) to reference the shared steering file from")
     parser.add_argument("--dry-run", action="store_true", help="Print actions without creating files")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.lfn_file and not args.catalog_db:
+        parser.error("either lfn_file or --catalog-db is required")
+    return args
 
 def load_inputs(lfn_file, xsec_file):
-    with open(lfn_file) as f:
-        lfns = [line.strip() for line in f if line.strip()]
+    catalog = LFNCatalog.from_file(lfn_file)
     with open(xsec_file) as f:
         xsecs = yaml.safe_load(f)
-    return lfns, xsecs
-
-def extract_genid_from_lfn(lfn):
-    """
-    Extract Generator ID (6 digits after '.I') from LFN.
-    """
-    match = re.search(r'\.I(\d{6})\.', lfn)
-    return int(match.group(1)) if match else None
+    return catalog, xsecs
 
-def extract_prodid_from_lfn(lfn):
-    """
-    Extract Production ID (number after 'd_dst_') from LFN.
-    """
-    match = re.search(r'd_dst_(\d+)_', lfn)
-    return int(match.group(1)) if match else None
+def _as_lfn_entry(lfn):
+    return lfn if lfn.startswith("LFN:") else "LFN:/" + lfn.lstrip("/")
 
-def group_lfns_by_genid_prodid(lfns):
+def group_lfns_by_genid_prodid(catalog):
     """
     Groups LFNs by (genid, prodid) combination.
     """
     grouped = {}
-    for lfn in lfns:
-        genid = extract_genid_from_lfn(lfn)
-        prodid = extract_prodid_from_lfn(lfn)
-        if genid is None or prodid is None:
-            continue
-        key = (genid, prodid)
-        lfn_entry = lfn if lfn.startswith("LFN:") else "LFN:/" + lfn.lstrip("/")
-        grouped.setdefault(key, []).append(lfn_entry)
+    for key, rows in catalog.group_rows("genid", "prodid").items():
+        grouped[key] = [_as_lfn_entry(catalog.lfns[i]) for i in rows]
     return grouped
 
-def write_option_file(path: Path, genid: int, prodid: int, proc: str, xsec: float, nevts: int):
+def lookup_lfns_in_db(db):
+    """
+    Returns a lookup (genid, prodid) -> [LFN entries] backed by indexed
+    queries on the SQLite LFN catalog instead of a full in-memory grouping.
+    """
+    def lookup(genid, prodid):
+        return [_as_lfn_entry(lfn) for lfn in db.lfns_for_genid_prodid(genid, prodid)]
+    return lookup
+
+def load_split_config(path):
+    """Split settings {"default": {...}, "processes": {proc: {...}}} ({} sections if no file)."""
+    config = {}
+    if path:
+        with open(path) as f:
+            config = yaml.safe_load(f) or {}
+    return {"default": config.get("default") or {}, "processes": config.get("processes") or {}}
+
+def plan_split(proc, n_files, events_per_file, split_config, target_cpu_hours=None, target_events=None, profiles=None):
+    """
+    Files per grid job for one (GenID, ProdID).
+    The split rule (files_per_job, target_events or target_cpu_hours) is taken
+    from the process's entry in split_config, else from the command line, else
+    from the default section, else TARGET_CPU_HOURS. The throughput is the
+    process's events_per_second override, else the rate measured by
+    condor_resource_tuner.py (profiles, ignored unless positive), else the
+    default events_per_second. Raises ValueError for a configured rate <= 0.
+    Returns (files_per_job, n_jobs, events_per_job, cpu_hours_per_job, source).
+    """
+    overrides = split_config["processes"].get(proc, {})
+    default = split_config["default"]
+    measured, n_measured = profiles.throughput(proc) if profiles is not None else (None, 0)
+    if overrides.get("events_per_second") is not None:
+        rate, rate_source = overrides["events_per_second"], "override"
+    elif measured and measured > 0:
+        rate, rate_source = measured, f"measured over {n_measured} jobs"
+    else:
+        rate, rate_source = default.get("events_per_second", DEFAULT_EVENTS_PER_SECOND), "default"
+    if not isinstance(rate, (int, float)) or rate <= 0:
+        raise ValueError(f"events_per_second for process {proc} must be a positive number, "
+                         f"got {rate!r} ({rate_source})")
+
+    mode, value = "target_cpu_hours", TARGET_CPU_HOURS
+    cli = {"target_events": target_events, "target_cpu_hours": target_cpu_hours}
+    for layer in (overrides, cli, default):
+        rules = [(m, layer[m]) for m in SPLIT_RULES if layer.get(m)]
+        if rules:
+            mode, value = rules[0]
+            break
+
+    if mode == "files_per_job":
+        files_per_job = max(1, min(int(value), n_files))
+        source = f"fixed {value} files/job"
+    else:
+        if mode == "target_events":
+            per_file, target, source = events_per_file, value, f"target {value} events"
+        else:
+            per_file, target, source = events_per_file / rate, value * 3600, f"target {value} CPU h"
+        n_jobs = plan_n_jobs(n_files, per_file * n_files, target, max_files=MAX_FILES_PER_GRID_JOB)
+        files_per_job = math.ceil(n_files / n_jobs)
+        if per_file > 0:
+            # DIRAC splits into equal file counts: never go over the target with a full job
+            files_per_job = max(1, min(files_per_job, math.floor(target / per_file)))
+    events_per_job = files_per_job * events_per_file
+    source += f", {rate:.2f} evt/s ({rate_source})"
+    return files_per_job, math.ceil(n_files / files_per_job), events_per_job, events_per_job / rate / 3600, source
+
+def render_options(myalg_params: str):
+    """Full Gaudi options text; myalg_params sets the four per-process myalg parameters."""
     content = f'''\
 from Gaudi.Configuration import *
 import os
@@ -104,10 +213,7 @@ io_handler.add_reader(reco_args.inputFiles)
 # setting up the Higgs to Invisible algorithm
 from Configurables import HtoInvAlg
 myalg = HtoInvAlg()
-myalg.cross_section = {xsec}
-myalg.n_events_generated = {nevts}
-myalg.processName = '{proc}'
-myalg.processID = {prodid}
+{myalg_params}
 myalg.targetLumi = {TARGET_LUMI}
 myalg.root_output_file = reco_args.myOutputFile 
 myalg.RecoParticleColl = 'PandoraPFOs'
@@ -252,15 +358,55 @@ ApplicationMgr( TopAlg = alg_list,
                )
 
 '''
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as f:
-        f.write(textwrap.dedent(content))
+    return textwrap.dedent(content)
+
+def render_option_file(genid: int, prodid: int, proc: str, xsec: float, nevts: int):
+    myalg_params = (
+        f"myalg.cross_section = {xsec}\n"
+        f"myalg.n_events_generated = {nevts}\n"
+        f"myalg.processName = '{proc}'\n"
+        f"myalg.processID = {prodid}"
+    )
+    return render_options(myalg_params)
+
+def write_shared_steering(steering_dir: Path):
+    """
+    Writes the job-independent steering file once; its name carries the content
+    hash, so an existing file with that name is already correct. Returns its path.
+    """
+    myalg_params = (
+        f"# per-job parameters from the sidecar written by generate_grid_jobs.py\n"
+        f"import json\n"
+        f"with open(os.environ.get('HTOINV_JOB_PARAMS', '{JOB_PARAMS_FILE}')) as _f:\n"
+        f"    job_params = json.load(_f)\n"
+        f"myalg.cross_section = job_params['cross_section']\n"
+        f"myalg.n_events_generated = job_params['n_events_generated']\n"
+        f"myalg.processName = job_params['processName']\n"
+        f"myalg.processID = job_params['processID']"
+    )
+    text = render_options(myalg_params)
+    digest = hashlib.sha256(text.encode()).hexdigest()[:12]
+    path = steering_dir / f"higgsToInvisible_shared_{digest}.py"
+    if not path.exists():
+        steering_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(path, text)
+    return path
+
+def render_job_params(prodid: int, proc: str, xsec: float, nevts: int):
+    params = {"cross_section": xsec, "n_events_generated": nevts, "processName": proc, "processID": prodid}
+    return json.dumps(params)
 
 def _make_output_filename_from_lfn(lfn: str, genid: int, prodid: int, idx: int):
     return f"myalg_higgs_to_invisible_{genid}_{prodid}_{idx}.root"
 
-def write_submit_file(path: Path, genid: int, prodid: int, proc: str, input_files):
-    steering_name = f"higgsToInvisible_{proc}_{genid}_{prodid}.py"
+def render_submit_file(genid: int, prodid: int, proc: str, input_files, files_per_job: int,
+                       steering_name=None, sandbox_files=None):
+    """
+    Text of the DIRAC submission script. steering_name defaults to the per-job
+    options file; sandbox_files (besides SANDBOX_PATH) default to that file.
+    """
+    steering_name = steering_name or f"higgsToInvisible_{proc}_{genid}_{prodid}.py"
+    input_sandbox = [SANDBOX_PATH] + (sandbox_files or [steering_name])
     output_files = [_make_output_filename_from_lfn(inf, genid, prodid, i+1) for i, inf in enumerate(input_files)]
     content = f'''\
 from DIRAC.Core.Base import Script
@@ -280,8 +426,7 @@ job.setName("htoinv_DST_%n")
 
 # 1) Split input
 #job.setInputData(inputFiles)
-chunk_size = min(20, len(inputFiles))
-job.setSplitInputData(inputFiles, numberOfFilesPerJob=chunk_size)
+job.setSplitInputData(inputFiles, numberOfFilesPerJob={files_per_job})
 
 # 2) Output files
 job.setOutputData(
@@ -309,7 +454,7 @@ job.append(gaudi)
 # 5) Sandboxes
 job.setOutputSandbox(["*.log", "*.out", "*.err"])
 
-job.setInputSandbox(["{SANDBOX_PATH}", "{steering_name}"])
+job.setInputSandbox({json.dumps(input_sandbox)})
 
 job.dontPromptMe()
 
@@ -322,33 +467,61 @@ if res.get("OK"):
 else:
     print("Submission failed:", res)
 '''
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as f:
-        f.write(textwrap.dedent(content))
+    return textwrap.dedent(content)
 
-def write_master_submit(job_keys):
+def write_master_submit(job_keys, steering_upload=None):
+    """steering_upload = (local path, LFN): upload the shared steering file first unless it is on the grid already."""
     script_path = Path("submit_all.sh")
     lines = ["#!/bin/bash", "# Auto-generated master submission script", "set -euo pipefail", ""]
+    if steering_upload:
+        local, lfn = steering_upload
+        # decide on the command's own output and exit code, not on a pipeline's status
+        lines.append(f"if steering_meta=$(dirac-dms-lfn-metadata {lfn} 2>&1); then steering_rc=0; else steering_rc=$?; fi")
+        lines.append(f'if [[ "$steering_meta" == *"No such file"* ]]; then')
+        lines.append(f"    echo 'Uploading shared steering file {local} ...'")
+        lines.append(f"    dirac-dms-add-file {lfn} {local} {STEERING_SE}")
+        lines.append(f'elif [ "$steering_rc" -ne 0 ]; then')
+        lines.append(f'    echo "Cannot check {lfn} (dirac-dms-lfn-metadata exit code $steering_rc):" >&2')
+        lines.append(f'    echo "$steering_meta" >&2')
+        lines.append(f"    exit 1")
+        lines.append(f"fi\n")
     for genid, prodid in job_keys:
         lines.append(f"echo 'Submitting GenID {genid}, ProdID {prodid} ...'")
         lines.append(f"cd {genid}_{prodid}/")
         lines.append(f"python3 submit_grid_{genid}_{prodid}.py")
         lines.append(f"cd ../")
         lines.append(f"sleep 10\n")
-    with open(script_path, "w") as f:
-        f.write("\n".join(lines))
-    os.chmod(script_path, 0o755)
+    write_if_changed(script_path, "\n".join(lines), 0o755)
     return script_path
 
 def main():
     args = parse_args()
-    lfns, xsecs = load_inputs(args.lfn_file, args.xsec_file)
-    grouped_lfns = group_lfns_by_genid_prodid(lfns)
+    db = None
+    if args.catalog_db:
+        with open(args.xsec_file) as f:
+            xsecs = yaml.safe_load(f)
+        db = LFNDatabase(args.catalog_db)
+        lookup = lookup_lfns_in_db(db)
+    else:
+        catalog, xsecs = load_inputs(args.lfn_file, args.xsec_file)
+        grouped_lfns = group_lfns_by_genid_prodid(catalog)
+        lookup = lambda genid, prodid: grouped_lfns.get((genid, prodid), [])
+
+    split_config = load_split_config(args.split_config)
+    profiles = ResourceProfiles(args.resource_profiles)
+
+    steering_path = steering_lfn = None
+    if args.shared_steering and not args.dry_run:
+        steering_path = write_shared_steering(STEERING_DIR)
+        if args.steering_lfn_dir:
+            steering_lfn = f"{args.steering_lfn_dir.removeprefix('LFN:').rstrip('/')}/{steering_path.name}"
+        print(f"Shared steering file: {steering_path}" + (f" (grid copy {steering_lfn})" if steering_lfn else ""))
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = f"job_generation_{timestamp}.log"
     log_lines = []
     job_keys = []
+    n_written = 0
 
     for entry in xsecs:
         genid = entry.get("GeneratorID", -1)
@@ -357,32 +530,71 @@ def main():
         nevts = entry.get("NumberOfEvents", 0)
         prod_ids = entry.get("ProductionIDs", [])
 
+        files_by_prodid = {prodid: lookup(genid, prodid) for prodid in prod_ids}
+        n_files_total = sum(len(files) for files in files_by_prodid.values())
+        events_per_file = nevts / n_files_total if nevts and n_files_total else 0
+
         for prodid in prod_ids:
             key = (genid, prodid)
-            if key not in grouped_lfns:
+            input_files = files_by_prodid[prodid]
+            if not input_files:
                 msg = f"[{timestamp}] GenID {genid}, ProdID {prodid} not found in LFN list - skipping"
                 print(msg)
                 log_lines.append(msg)
                 continue
 
             outdir = Path(f"{genid}_{prodid}")
-            opt_path = outdir / f"higgsToInvisible_{proc}_{genid}_{prodid}.py"
-            sub_path = outdir / f"submit_grid_{genid}_{prodid}.py"
-
-            msg = f"[{timestamp}] Process {proc}. GenID {genid}, ProdID {prodid} ({proc}) → {len(grouped_lfns[key])} files"
+            opt_name = f"higgsToInvisible_{proc}_{genid}_{prodid}.py"
+            sub_name = f"submit_grid_{genid}_{prodid}.py"
+
+            try:
+                files_per_job, n_jobs, events_per_job, cpu_hours, source = plan_split(
+                    proc, len(input_files), events_per_file, split_config, args.target_cpu_hours, args.target_events, profiles)
+            except ValueError as e:
+                raise SystemExit(f"❌ Invalid split configuration ({args.split_config}): {e}")
+            msg = (f"[{timestamp}] Process {proc}. GenID {genid}, ProdID {prodid} ({proc}) → {len(input_files)} files, "
+                   f"{files_per_job} files/job → {n_jobs} jobs (~{events_per_job:.0f} events, ~{cpu_hours:.1f} CPU h per job; {source})")
             print(msg)
             log_lines.append(msg)
 
             if not args.dry_run:
-                outdir.mkdir(parents=True, exist_ok=True)
-                write_option_file(opt_path, genid, prodid, proc, xsec, nevts)
-                write_submit_file(sub_path, genid, prodid, proc, grouped_lfns[key])
                 job_keys.append(key)
+                if steering_path is not None:
+                    steering_entry = _as_lfn_entry(steering_lfn) if steering_lfn else f"../{steering_path}"
+                    files = {
+                        JOB_PARAMS_FILE: render_job_params(prodid, proc, xsec, nevts),
+                        sub_name: render_submit_file(genid, prodid, proc, input_files, files_per_job,
+                                                     steering_name=steering_path.name,
+                                                     sandbox_files=[steering_entry, JOB_PARAMS_FILE]),
+                    }
+                else:
+                    files = {
+                        opt_name: render_option_file(genid, prodid, proc, xsec, nevts),
+                        sub_name: render_submit_file(genid, prodid, proc, input_files, files_per_job),
+                    }
+                # Hash of the rendered files: edits to this script that leave the
+                # output unchanged do not rewrite any job directory
+                digest = inputs_hash(files)
+                if is_current(outdir, digest):
+                    continue
+                write_job_files(outdir, files, digest)
+                n_written += 1
+    if db is not None:
+        db.close()
+
+    if not args.dry_run:
+        msg = f"[{timestamp}] {n_written} job directories (re)generated, {len(job_keys) - n_written} unchanged"
+        print(msg)
+        log_lines.append(msg)
+        for stale in find_stale_dirs(".", [f"{genid}_{prodid}" for genid, prodid in job_keys]):
+            msg = f"[{timestamp}] Stale job directory (not generated any more): {stale}"
+            print(msg)
+            log_lines.append(msg)
 
     if not args.dry_run and job_keys:
         with open(log_file, "w") as f:
             f.write("\n".join(log_lines))
-        master_script = write_master_submit(job_keys)
+        master_script = write_master_submit(job_keys, (steering_path, steering_lfn) if steering_lfn else None)
         print(f"Master submission script written: {master_script}")
 
     print("Done. Log lines:")
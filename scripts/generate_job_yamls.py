@@ -3,9 +3,25 @@ generate_job_yamls.py
 
 This script scans a directory of Monte Carlo EDM4hep ROOT files and generates
 job YAML files suitable for batch processing. Each job YAML contains a subset
-of ROOT files (chunked by CHUNK_SIZE) along with associated metadata such as
-cross-section (in pb), number of events, k-factor, and process ID read from
-the input cross-section YAML.
+of ROOT files along with associated metadata such as cross-section (in pb),
+number of events, k-factor, and process ID read from the input cross-section YAML.
+
+Files are split into jobs of about TARGET_JOB_RUNTIME_S each (job_chunker.py),
+with the runtime of a file estimated according to CHUNK_BALANCE:
+  - "events": events / EVENTS_PER_SECOND, events from the nXXX field of the file
+    name, else NumberOfEvents of the process shared out by file size
+  - "bytes":  file size / BYTES_PER_SECOND
+  - "files":  fixed slices of CHUNK_SIZE files (previous behaviour)
+Each process gets between MIN_FILES_PER_JOB and MAX_FILES_PER_JOB files per job
+(the maximum wins where both cannot hold), overridable per process in
+PROCESS_FILE_LIMITS.
+
+The directory walk is done by sample_scanner.py (parallel listings, cached
+per directory in SCAN_CACHE so unchanged directories are not listed again).
+
+Since the number of jobs per process can change from one run to the next,
+<process>_jobNNN.yaml files of an earlier run beyond the new job count are
+deleted before a process's YAMLs are written.
 
 Logging is written to generate_job_yamls.log, recording discovered processes,
 warnings for missing files or metadata, and summaries of generated job YAMLs.
@@ -14,20 +30,32 @@ Usage:
     python generate_job_yamls.py
 """
 
+import re
 import yaml
 import os
-import math
 import logging
 from pathlib import Path
 
+from sample_scanner import scan_samples
+from job_chunker import balanced_chunks, chunk_costs
+
 # -----------------------------
 # Configuration
 # -----------------------------
 ROOT_DIR = "/afs/cern.ch/user/c/chensel/cernbox/ILC/HtoInv/MC/pilot_samples"
 OUTPUT_DIR = "job_yamls"
-CHUNK_SIZE = 100
+CHUNK_SIZE = 100                # Files per job with CHUNK_BALANCE = "files"
+CHUNK_BALANCE = "events"        # "events", "bytes" or "files"
+TARGET_JOB_RUNTIME_S = 4 * 3600 # Aimed-for runtime per job
+EVENTS_PER_SECOND = 25.0        # Analysis throughput (adjust from measured job wall times)
+BYTES_PER_SECOND = 5e6          # Input read rate, used with CHUNK_BALANCE = "bytes"
+MIN_FILES_PER_JOB = 1
+MAX_FILES_PER_JOB = CHUNK_SIZE
+PROCESS_FILE_LIMITS = {}        # {process: (min_files, max_files)}, e.g. {"2f_z_h": (5, 200)}
 CROSS_SECTION_FILE = "/afs/cern.ch/user/c/chensel/cernbox/ILC/HtoInv/MC/pilot_xsec.yaml"
 LOG_FILE = "generate_job_yamls.log"
+SCAN_CACHE = "sample_scan_cache.json"   # Directory listing cache, "" to disable
+SCAN_WORKERS = 16                       # Parallel directory listings
 
 # -----------------------------
 # Setup logging
@@ -39,6 +67,8 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
+N_EVENTS_FIELD = re.compile(r"\.n(\d+)_\d+\.")
+
 # -----------------------------
 # Helpers
 # -----------------------------
@@ -61,37 +91,67 @@ def discover_processes(root_dir, cross_sections):
     """Scan ROOT_DIR for process directories containing edm4hep/*.root files"""
     processes = {}
 
-    for process_dir in Path(root_dir).iterdir():
-        edm_dir = process_dir / "edm4hep"
-        if not edm_dir.is_dir():
-            logging.warning(f"Skipping {process_dir}, no edm4hep/ subdir")
+    for process_name, edm in scan_samples(root_dir, workers=SCAN_WORKERS, cache_path=SCAN_CACHE).items():
+        if edm is None:
+            logging.warning(f"Skipping {process_name}, no edm4hep/ subdir")
             continue
 
-        root_files = sorted([f.name for f in edm_dir.glob("*.root")])
+        root_files = list(edm["files"])
         if not root_files:
-            logging.warning(f"Process {process_dir.name} has no .root files")
+            logging.warning(f"Process {process_name} has no .root files")
             continue
 
         # Get cross-section info and ProdID from YAML
-        cs_info = cross_sections.get(process_dir.name, {})
+        cs_info = cross_sections.get(process_name, {})
         process_id = cs_info.get("process_id", -1)
         cross_section_pb = cs_info.get("cross_section_pb", 0.0)
         n_events = cs_info.get("n_events", 0)
 
-        processes[process_dir.name] = {
+        processes[process_name] = {
             "process_id": process_id,
             "cross_section_pb": cross_section_pb,
             "n_events": n_events,
             "k_factor": 1.0,
-            "path": str(edm_dir.resolve()),
-            "files": root_files
+            "path": edm["path"],
+            "files": root_files,
+            "file_sizes": edm["files"]
         }
 
         if not cs_info:
-            logging.warning(f"No cross-section info for process {process_dir.name}")
+            logging.warning(f"No cross-section info for process {process_name}")
 
     return processes
 
+def estimate_runtimes(meta, balance=CHUNK_BALANCE):
+    """{file: estimated runtime in s} for one process (see the module docstring)."""
+    sizes = meta["file_sizes"]
+    if balance == "bytes":
+        return {f: sizes[f] / BYTES_PER_SECOND for f in meta["files"]}
+    total_size = sum(sizes.values())
+    runtimes = {}
+    for f in meta["files"]:
+        m = N_EVENTS_FIELD.search(f)
+        if m and int(m.group(1)) > 0:
+            events = int(m.group(1))
+        elif meta.get("n_events") and total_size:
+            events = meta["n_events"] * sizes[f] / total_size
+        else:
+            # no event information: fall back to the file size
+            runtimes[f] = sizes[f] / BYTES_PER_SECOND
+            continue
+        runtimes[f] = events / EVENTS_PER_SECOND
+    return runtimes
+
+def split_into_jobs(process_name, meta):
+    """File chunks for one process; returns (chunks, estimated runtime per chunk or None)."""
+    files = meta["files"]
+    if CHUNK_BALANCE == "files":
+        return [files[i:i + CHUNK_SIZE] for i in range(0, len(files), CHUNK_SIZE)], None
+    min_files, max_files = PROCESS_FILE_LIMITS.get(process_name, (MIN_FILES_PER_JOB, MAX_FILES_PER_JOB))
+    runtimes = estimate_runtimes(meta)
+    chunks = balanced_chunks(files, [runtimes[f] for f in files], TARGET_JOB_RUNTIME_S, min_files, max_files)
+    return chunks, chunk_costs(chunks, runtimes)
+
 def write_job_yaml(process_name, metadata, chunk_idx, chunk_files):
     job_config = {
         "process": process_name,
@@ -108,6 +168,20 @@ def write_job_yaml(process_name, metadata, chunk_idx, chunk_files):
         yaml.dump(job_config, f, sort_keys=False)
     return out_name
 
+def remove_stale_job_yamls(process_name, n_chunks):
+    """
+    Delete <process>_jobNNN.yaml files from an earlier run with NNN >= n_chunks,
+    so the job generators do not process their files a second time.
+    """
+    pattern = re.compile(rf"^{re.escape(process_name)}_job(\d+)\.yaml$")
+    removed = []
+    for path in sorted(Path(OUTPUT_DIR).glob(f"{process_name}_job*.yaml")):
+        m = pattern.match(path.name)
+        if m and int(m.group(1)) >= n_chunks:
+            path.unlink()
+            removed.append(path.name)
+    return removed
+
 # -----------------------------
 # Main
 # -----------------------------
@@ -125,17 +199,25 @@ def main():
     logging.info(f"Discovered {len(processes)} processes under {ROOT_DIR}")
 
     for process_name, meta in processes.items():
-        files = meta["files"]
-        n_files = len(files)
-        n_chunks = math.ceil(n_files / CHUNK_SIZE)
-
-        logging.info(
-            f"Process {process_name} (ID={meta['process_id']}): {n_files} files → {n_chunks} jobs "
-            f"(chunk size {CHUNK_SIZE})"
-        )
-
-        for i in range(n_chunks):
-            chunk_files = files[i*CHUNK_SIZE : (i+1)*CHUNK_SIZE]
+        n_files = len(meta["files"])
+        chunks, runtimes = split_into_jobs(process_name, meta)
+        n_chunks = len(chunks)
+
+        if runtimes is None:
+            logging.info(
+                f"Process {process_name} (ID={meta['process_id']}): {n_files} files → {n_chunks} jobs "
+                f"(chunk size {CHUNK_SIZE})"
+            )
+        else:
+            logging.info(
+                f"Process {process_name} (ID={meta['process_id']}): {n_files} files → {n_chunks} jobs "
+                f"(balanced by {CHUNK_BALANCE}, est. runtime {min(runtimes) / 60:.0f}-{max(runtimes) / 60:.0f} min, "
+                f"target {TARGET_JOB_RUNTIME_S / 60:.0f} min)"
+            )
+
+        for stale in remove_stale_job_yamls(process_name, n_chunks):
+            logging.warning(f"  Removed {stale} left over from an earlier run with more jobs")
+        for i, chunk_files in enumerate(chunks):
             out_yaml = write_job_yaml(process_name, meta, i, chunk_files)
             logging.info(f"  Wrote {out_yaml} with {len(chunk_files)} files")
 
@@ -8,21 +8,36 @@ ROOT output files.
 
 Features:
 - Reads input job YAMLs (process info, file lists, cross section, etc.)
-- Injects values into a Key4hep options template
+- Injects values into a Key4hep options template; the template is parsed once
+  into literal text and named slots (OptionsTemplate), so rendering a job is a
+  string join, and a template missing one of the anchors is rejected up front
 - Adds myalg parameters including cross-section, n_events, processName, processID,
   targetLumi, and a unique myalg.root_output_file
 - Ensures unique output ROOT filenames for parallel job safety
 - Creates corresponding Condor job submission scripts (.sh and .sub)
+- Optionally (CLUSTER_SUBMIT) writes one cluster submit description
+  (generated_jobs/jobs.sub) that queues every job directory from
+  generated_jobs/jobs.txt, so all jobs go in with a single condor_submit
+- Optionally (AUTOTUNE_RESOURCES) sizes request_memory, request_disk and
+  +MaxRuntime per process from the usage measured for earlier jobs
+  (condor_resource_tuner.py, RESOURCE_PROFILES); the cluster submit file then
+  takes the per-job values from extra jobs.txt columns
+- Regenerates incrementally (job_manifest.py): each job directory records a
+  hash of its rendered files (which reflect the job YAML, template, settings
+  and resources) and is only rewritten, atomically, when that hash changes;
+  job directories without a job YAML any more are reported as stale
 - Produces both a master logfile (with timestamp) and per-job Condor logs
 """
 
-import os
 import re
 import yaml
 import logging
 import datetime
 from pathlib import Path
 
+from condor_resource_tuner import ResourceProfiles, DEFAULT_RESOURCES, DEFAULT_PROFILES
+from job_manifest import inputs_hash, is_current, write_job_files, write_if_changed, find_stale_dirs
+
 # -----------------------------
 # User-configurable parameters
 # -----------------------------
@@ -36,6 +51,11 @@ YAML_DIR = BASE_DIR / "job_yamls"      # Directory with YAML job descriptions
 TEMPLATE_FILE = "/afs/cern.ch/user/c/chensel/ILD/workarea/May2025/k4-project-template/k4ProjectTemplate/options/default_options_file.py"  # Options template
 OUTPUT_DIR = BASE_DIR / "generated_jobs"              # Where all jobs will be written
 EOS_OUTPUT_DIR = "root://eosuser.cern.ch//eos/user/c/chensel/ILC/KEY4HEP_OUTPUT/PILOT_MC_RUN" # the directory on eos
+CLUSTER_SUBMIT = True       # Also write OUTPUT_DIR/jobs.sub + jobs.txt (one ClusterId, one ProcId per job)
+CLUSTER_SUB_FILE = "jobs.sub"
+CLUSTER_ITEMDATA_FILE = "jobs.txt"
+AUTOTUNE_RESOURCES = True   # Per-process requests from RESOURCE_PROFILES (falls back to DEFAULT_RESOURCES)
+RESOURCE_PROFILES = DEFAULT_PROFILES  # Written by condor_resource_tuner.py harvest
 
 # -----------------------------
 # Setup logging (master logfile with timestamp)
@@ -53,13 +73,61 @@ logging.basicConfig(
 # -----------------------------
 # Helpers
 # -----------------------------
-def load_yaml(path):
-    with open(path) as f:
-        return yaml.safe_load(f)
+class OptionsTemplate:
+    """
+    Key4hep options template parsed once into literal text and named slots:
+    - files:  every files = [...] list (replaced by the job's file list)
+    - evtmax: every EvtMax = N (replaced by EvtMax=<evtmax>)
+    - output: every output.filename = ... line (replaced by the job's output name)
+    - myalg:  right after every myalg = HtoInvAlg() (myalg parameters inserted)
+    Raises ValueError if an anchor is missing, instead of letting jobs run
+    with an unmodified template.
+    """
 
-def generate_options_newtemplate(yaml_info, template_text, evtmax, target_lumi, job_num):
+    SLOT_PATTERNS = {
+        "files": re.compile(r'files\s*=\s*\[.*?\]', re.DOTALL),
+        "evtmax": re.compile(r'EvtMax\s*=\s*\d+'),
+        "output": re.compile(r'output\.filename\s*=.*'),
+        "myalg": re.compile(r'myalg = HtoInvAlg\(\)'),
+    }
+
+    def __init__(self, text, source="options template"):
+        spans = []
+        missing = []
+        for name, pattern in self.SLOT_PATTERNS.items():
+            found = list(pattern.finditer(text))
+            if not found:
+                missing.append(f"{name} ({pattern.pattern})")
+            for m in found:
+                # the myalg anchor stays in place, its parameters go right after it
+                start = m.end() if name == "myalg" else m.start()
+                spans.append((start, m.end(), name))
+        if missing:
+            raise ValueError(f"{source}: anchor(s) not found: {', '.join(missing)}")
+
+        self.literals = []
+        self.slots = []
+        pos = 0
+        for start, end, name in sorted(spans):
+            if start < pos:
+                raise ValueError(f"{source}: overlapping '{name}' anchor at offset {start}")
+            self.literals.append(text[pos:start])
+            self.slots.append(name)
+            pos = end
+        self.literals.append(text[pos:])
+
+    def render(self, **values):
+        """Options text with every slot filled from values[slot]."""
+        parts = []
+        for literal, slot in zip(self.literals, self.slots):
+            parts.append(literal)
+            parts.append(values[slot])
+        parts.append(self.literals[-1])
+        return "".join(parts)
+
+def generate_options_newtemplate(yaml_info, template, evtmax, target_lumi, job_num):
     """
-    Generates a Key4hep options file:
+    Generates a Key4hep options file from an OptionsTemplate:
     - Replaces files = [...] with YAML file list
     - Replaces EvtMax with evtmax
     - Adds myalg parameters from YAML and targetLumi
@@ -69,18 +137,11 @@ def generate_options_newtemplate(yaml_info, template_text, evtmax, target_lumi,
     files_list_str = ",\n    ".join(
         [f'"{yaml_info["path"]}/{f}"' for f in yaml_info["files"]]
     )
-    files_assignment = f"files = [\n    {files_list_str}\n]\n"
-    template_text = re.sub(r'files\s*=\s*\[.*?\]', files_assignment, template_text, flags=re.DOTALL)
-
-    # Replace EvtMax
-    template_text = re.sub(r'EvtMax\s*=\s*\d+', f"EvtMax={evtmax}", template_text)
 
     # Unique filenames
     root_filename = f"output_higgsTo_invisible_{yaml_info['process']}_{job_num}.root"
     myalg_root_filename = f"myalg_higgsTo_invisible_{yaml_info['process']}_{job_num}.root"
 
-    template_text = re.sub(r'output\.filename\s*=.*', f"output.filename = '{root_filename}'", template_text)
-
     # myalg params
     myalg_lines = (
         f"myalg.cross_section = {yaml_info['cross_section_pb']}\n"
@@ -90,17 +151,21 @@ def generate_options_newtemplate(yaml_info, template_text, evtmax, target_lumi,
         f"myalg.targetLumi = {target_lumi}\n"
         f"myalg.root_output_file = '{myalg_root_filename}'\n"
     )
-    template_text = re.sub(r'(myalg = HtoInvAlg\(\))', r'\1\n' + myalg_lines, template_text)
 
-    return template_text
+    return template.render(
+        files=f"files = [\n    {files_list_str}\n]\n",
+        evtmax=f"EvtMax={evtmax}",
+        output=f"output.filename = '{root_filename}'",
+        myalg="\n" + myalg_lines,
+    )
 
-def write_file(path, content):
-    with open(path, "w") as f:
-        f.write(content)
+def write_file(path, content, mode=None):
+    """Atomic write, skipped if the file already has this content."""
+    write_if_changed(path, content, mode)
 
 
-def generate_run_script(options_file, job_dir):
-    """Creates .sh run script for Condor"""
+def render_run_script(options_file, job_dir):
+    """Text of the .sh run script for Condor"""
     run_script = f"""#!/bin/bash
 echo "Starting job on $(date)"
 echo "Running on host $(hostname)"
@@ -130,13 +195,10 @@ done
 
 echo "Job finished on $(date)"
 """
-    script_path = Path(job_dir) / "run_job.sh"
-    write_file(script_path, run_script)
-    os.chmod(script_path, 0o755)
-    return script_path
+    return run_script
 
-def generate_condor_sub(run_script, job_dir):
-    """Creates .sub HTCondor submission file with resource requests"""
+def render_condor_sub(run_script, job_dir, resources=DEFAULT_RESOURCES):
+    """Text of the .sub HTCondor submission file with resource requests"""
 
     run_script_abs = Path(run_script).resolve()
 
@@ -149,17 +211,50 @@ error      = {Path(job_dir)/'job.err'}
 log        = {Path(job_dir)/'job.log'}
 
 # Resource requests
-request_cpus   = 1
-request_memory = 4000
-request_disk   = 2GB
-+MaxRuntime    = 43200  
+request_cpus   = {resources['request_cpus']}
+request_memory = {resources['request_memory']}
+request_disk   = {resources['request_disk']}
++MaxRuntime    = {resources['max_runtime']}
 
 queue
 """
+    return sub_file
 
-    sub_path = Path(job_dir) / "job.sub"
+def generate_cluster_sub(job_dirs, output_dir, job_resources=None):
+    """
+    Creates one .sub HTCondor submission file for all jobs plus its itemdata file.
+    ProcId N runs the run_job.sh of line N in the itemdata file, with the same
+    per-job output/error/log files and resource requests as the single-job job.sub.
+    job_resources maps job_dir -> resources (DEFAULT_RESOURCES if missing).
+    """
+    job_resources = job_resources or {}
+    itemdata_path = Path(output_dir) / CLUSTER_ITEMDATA_FILE
+    lines = []
+    for d in job_dirs:
+        r = job_resources.get(d, DEFAULT_RESOURCES)
+        lines.append(f"{Path(d).resolve()} {r['request_cpus']} {r['request_memory']} {r['request_disk']} {r['max_runtime']}\n")
+    write_file(itemdata_path, "".join(lines))
+
+    sub_file = f"""universe   = vanilla
+executable = $(job_dir)/run_job.sh
+arguments  = 
+
+output     = $(job_dir)/job.out
+error      = $(job_dir)/job.err
+log        = $(job_dir)/job.log
+
+# Resource requests (per job, from the itemdata columns)
+request_cpus   = $(cpus)
+request_memory = $(memory)
+request_disk   = $(disk)
++MaxRuntime    = $(max_runtime)
+
+queue job_dir, cpus, memory, disk, max_runtime from {itemdata_path.resolve()}
+"""
+
+    sub_path = Path(output_dir) / CLUSTER_SUB_FILE
     write_file(sub_path, sub_file)
-    return sub_path
+    return sub_path, itemdata_path
 
 
 
@@ -168,7 +263,12 @@ queue
 # -----------------------------
 def main():
     Path(OUTPUT_DIR).mkdir(exist_ok=True)
-    template_text = Path(TEMPLATE_FILE).read_text()
+    try:
+        template = OptionsTemplate(Path(TEMPLATE_FILE).read_text(), source=TEMPLATE_FILE)
+    except ValueError as e:
+        logging.error(f"Unusable options template: {e}")
+        print(f"Unusable options template: {e}. Exiting.")
+        return
 
     yaml_files = list(Path(YAML_DIR).glob("*.yaml"))
     if not yaml_files:
@@ -178,25 +278,65 @@ def main():
 
     logging.info(f"Found {len(yaml_files)} job YAMLs.")
 
+    profiles = ResourceProfiles(RESOURCE_PROFILES) if AUTOTUNE_RESOURCES else None
+    if profiles is not None:
+        logging.info(f"Resource profiles for {len(profiles.samples)} processes loaded from {RESOURCE_PROFILES}")
+
+    job_dirs = []
+    failed = []
+    job_resources = {}
+    n_written = 0
     for yaml_file in yaml_files:
         try:
-            info = load_yaml(yaml_file)
+            yaml_text = Path(yaml_file).read_text()
+            info = yaml.safe_load(yaml_text)
             job_name = Path(yaml_file).stem
             job_dir = Path(OUTPUT_DIR) / job_name
-            job_dir.mkdir(exist_ok=True)
+            resources = profiles.recommend(info["process"]) if profiles is not None else DEFAULT_RESOURCES
 
             options_filename = f"higgsTo_invisible_{info['process']}_{job_name.split('_')[-1]}.py"
             options_path = job_dir / options_filename
-
-            options_text = generate_options_newtemplate(info, template_text, EVTMAX, TARGETLUMINOSITY, job_name.split('_')[-1])
-            write_file(options_path, options_text)
-
-            run_script = generate_run_script(options_path, job_dir)
-            generate_condor_sub(run_script, job_dir)
-
-            logging.info(f"Generated job {job_name} -> {options_filename}")
+            run_script = job_dir / "run_job.sh"
+
+            # Rendering is cheap; the hash of the rendered files decides whether the
+            # directory is rewritten, so edits to this script that do not change
+            # the output (comments, log messages) leave existing jobs alone
+            options_text = generate_options_newtemplate(info, template, EVTMAX, TARGETLUMINOSITY, job_name.split('_')[-1])
+            files = {
+                options_filename: options_text,
+                "run_job.sh": (render_run_script(options_path, job_dir), 0o755),
+                "job.sub": render_condor_sub(run_script, job_dir, resources),
+            }
+            digest = inputs_hash(files)
+            if is_current(job_dir, digest):
+                job_dirs.append(job_dir)
+                job_resources[job_dir] = resources
+                continue
+
+            write_job_files(job_dir, files, digest)
+            n_written += 1
+            job_dirs.append(job_dir)
+            job_resources[job_dir] = resources
+
+            logging.info(f"Generated job {job_name} -> {options_filename} "
+                         f"(memory {resources['request_memory']} MB, disk {resources['request_disk']} KB, runtime {resources['max_runtime']} s)")
         except Exception as e:
             logging.error(f"Failed to process {yaml_file}: {e}")
+            failed.append(Path(yaml_file).stem)
+
+    logging.info(f"{n_written} job directories (re)generated, {len(job_dirs) - n_written} unchanged")
+    if failed:
+        print(f"⚠️ {len(failed)} job YAMLs could not be processed (existing directories left as they are), see {LOGFILE}")
+    # A YAML that failed to parse still exists, so its directory is not stale
+    stale = find_stale_dirs(OUTPUT_DIR, [d.name for d in job_dirs] + failed)
+    for d in stale:
+        logging.warning(f"Stale job directory (no job YAML any more): {d}")
+    if stale:
+        print(f"⚠️ {len(stale)} stale job directories without a job YAML, see {LOGFILE}")
+
+    if CLUSTER_SUBMIT and job_dirs:
+        sub_path, itemdata_path = generate_cluster_sub(sorted(job_dirs), OUTPUT_DIR, job_resources)
+        logging.info(f"Cluster submit file {sub_path} queues {len(job_dirs)} jobs from {itemdata_path}")
 
     logging.info("All jobs generated successfully.")
     
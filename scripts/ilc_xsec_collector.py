@@ -5,31 +5,33 @@ ilc_xsec_collector.py
 Modified to combine multiple production IDs of the same process
 into a single YAML entry with summed number of events.
 SUSY processes are filtered out.
+
+dirac-ilc-get-info is queried for all productions through a bounded thread
+pool (--max-workers) with an optional start-rate limit (--max-rate), a
+per-call timeout and retries with exponential backoff. Results are merged
+in LFN order, so the YAML does not depend on completion order. --dirac-cmd
+points the collector at a local fake of dirac-ilc-get-info for testing.
+
+Parsed CrossSection_fb, CrossSectionError_fb and NumberOfEvents are kept in
+an on-disk cache keyed by ProdID (--cache, YAML). Entries expire after
+--cache-ttl days, the least recently used ones are evicted beyond
+--cache-max-entries, and --refresh ignores cached values. Only productions
+not in the cache are queried; hit/miss statistics are logged.
 """
 
+import os
 import re
+import time
+import shlex
+import threading
 import subprocess
 import yaml
 import logging
 import argparse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-# -------------------------------
-# SUSY process keywords
-# -------------------------------
-SUSY_KEYWORDS = [
-    "n1n1h", "n23n23h", "e1e1h", "e2e2h", "e3e3h",
-    "n23n23h_dd", "n23n23h_uu", "n23n23h_ss",
-    "n1n1h_dd", "n1n1h_uu", "n1n1h_ss",
-    "e3e3h_dd", "e3e3h_uu", "e3e3h_ss",
-    "e2e2h_dd", "e2e2h_uu", "e2e2h_ss",
-    "e1e1h_dd", "e1e1h_uu", "e1e1h_ss",
-    "qqh_e2e2", "qqh_e3e3"
-]
-
-def is_susy_process(process_name: str) -> bool:
-    """Check if the process name matches a SUSY keyword."""
-    return any(tag in process_name for tag in SUSY_KEYWORDS)
+from lfn_parser import LFNCatalog, is_susy_process
 
 # -------------------------------
 # Argument parsing
@@ -53,8 +55,197 @@ def parse_args():
         action="store_true",
         help="Enable debug-level logging."
     )
+    parser.add_argument(
+        "--max-workers",
+        type=int, default=8,
+        help="Maximum number of concurrent dirac-ilc-get-info calls (default: 8)."
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float, default=0.0,
+        help="Maximum number of calls started per second, 0 for no limit (default: 0)."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float, default=120.0,
+        help="Timeout in seconds for a single dirac-ilc-get-info call (default: 120)."
+    )
+    parser.add_argument(
+        "--retries",
+        type=int, default=3,
+        help="Retries per production after a failed or timed-out call (default: 3)."
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float, default=2.0,
+        help="Initial retry delay in seconds, doubled after every attempt (default: 2)."
+    )
+    parser.add_argument(
+        "--dirac-cmd",
+        default="dirac-ilc-get-info",
+        help="Command used to query a production, e.g. a local fake for testing."
+    )
+    parser.add_argument(
+        "--cache",
+        default="prod_info_cache.yaml",
+        help="On-disk production metadata cache, empty string to disable (default: prod_info_cache.yaml)."
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float, default=0.0,
+        help="Expire cache entries older than this many days, 0 for never (default: 0)."
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int, default=10000,
+        help="Evict least recently used cache entries beyond this size (default: 10000)."
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached values and query every production again (results are re-cached)."
+    )
     return parser.parse_args()
 
+# -------------------------------
+# Production metadata cache
+# -------------------------------
+class ProductionCache:
+    """
+    YAML cache of parsed production metadata keyed by ProdID.
+    Each entry stores CrossSection_fb, CrossSectionError_fb, NumberOfEvents
+    plus fetched_at / last_used UNIX timestamps for TTL and LRU eviction.
+    """
+
+    FIELDS = ("CrossSection_fb", "CrossSectionError_fb", "NumberOfEvents")
+
+    def __init__(self, path, ttl_days=0.0, max_entries=10000):
+        self.path = path
+        self.ttl = ttl_days * 86400.0
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = self.misses = self.expired = self.evicted = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = {str(k): v for k, v in (yaml.safe_load(f) or {}).items()}
+
+    def get(self, prod_id):
+        entry = self.entries.get(prod_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self.ttl and time.time() - entry["fetched_at"] > self.ttl:
+            del self.entries[prod_id]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry["last_used"] = time.time()
+        return {field: entry[field] for field in self.FIELDS}
+
+    def put(self, prod_id, info):
+        now = time.time()
+        self.entries[prod_id] = dict(info, fetched_at=now, last_used=now)
+
+    def save(self):
+        if not self.path:
+            return
+        if len(self.entries) > self.max_entries:
+            by_age = sorted(self.entries, key=lambda pid: self.entries[pid]["last_used"])
+            for prod_id in by_age[:len(self.entries) - self.max_entries]:
+                del self.entries[prod_id]
+                self.evicted += 1
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            yaml.dump(self.entries, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        return (f"Production cache {self.path}: {self.hits} hits, {self.misses} misses, "
+                f"{self.expired} expired, {self.evicted} evicted, {len(self.entries)} entries")
+
+# -------------------------------
+# DIRAC queries
+# -------------------------------
+class RateLimiter:
+    """Thread-safe limiter that spaces call starts at least 1/max_rate seconds apart."""
+
+    def __init__(self, max_rate: float):
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def query_production(prod_id, cmd, timeout, retries, backoff, limiter):
+    """
+    Run `<cmd> -p <prod_id>` with retries and exponential backoff.
+    Returns the stdout of the first successful call, or None.
+    """
+    delay = backoff
+    for attempt in range(retries + 1):
+        limiter.wait()
+        logging.info(f"Querying production {prod_id} (attempt {attempt + 1}/{retries + 1})")
+        try:
+            result = subprocess.run(
+                cmd + ["-p", prod_id], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                text=True, check=True, timeout=timeout
+            )
+            return result.stdout
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Error querying ProdID {prod_id}: {e.stderr.strip()}")
+        except subprocess.TimeoutExpired:
+            logging.error(f"Timeout after {timeout}s querying ProdID {prod_id}")
+        except OSError as e:
+            logging.error(f"Could not run {cmd[0]} for ProdID {prod_id}: {e}")
+            return None
+
+        if attempt < retries:
+            time.sleep(delay)
+            delay *= 2
+    return None
+
+def query_productions(prod_ids, args):
+    """Query all productions concurrently; returns {prod_id: stdout or None}."""
+    cmd = shlex.split(args.dirac_cmd)
+    limiter = RateLimiter(args.max_rate)
+    unique_ids = list(dict.fromkeys(prod_ids))
+    with ThreadPoolExecutor(max_workers=max(1, args.max_workers)) as pool:
+        outputs = pool.map(
+            lambda prod_id: query_production(prod_id, cmd, args.timeout, args.retries, args.backoff, limiter),
+            unique_ids,
+        )
+        return dict(zip(unique_ids, outputs))
+
+def parse_production_info(output):
+    """Extract CrossSection_fb, CrossSectionError_fb and NumberOfEvents (None if missing)."""
+    info = dict.fromkeys(ProductionCache.FIELDS)
+
+    # Extract CrossSection
+    cross_section_match = re.search(
+        r'CrossSection\s+:\s+([\dEe\+\-\.]+)\s+fb\+/-([\dEe\+\-\.]+)fb', output
+    )
+    # Extract NumberOfEvents
+    events_match = re.search(
+        r'^\s*NumberOfEvents\s*:\s*(\d+)', output, re.MULTILINE
+    )
+
+    if cross_section_match:
+        xsec_value, xsec_error = cross_section_match.groups()
+        info["CrossSection_fb"] = float(xsec_value)
+        info["CrossSectionError_fb"] = float(xsec_error)
+    if events_match:
+        info["NumberOfEvents"] = int(events_match.group(1))
+    return info
+
 # -------------------------------
 # Main logic
 # -------------------------------
@@ -66,11 +257,6 @@ def main():
         format='%(levelname)s: %(message)s'
     )
 
-    # Regex to extract generator ID, process name, and production ID
-    prod_pattern = re.compile(
-        r'\.I(\d{6})\.P([^\.]+)\..*d_dst_(\d+)_\d+\.slcio'
-    )
-
     # Group info by (generatorID, process)
     process_dict = defaultdict(lambda: {
         "ProductionIDs": [],
@@ -80,58 +266,65 @@ def main():
     })
 
     # Step 1: Parse LFNs
-    with open(args.input, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            match = prod_pattern.search(line)
-            if match:
-                gen_id, process_name, prod_id = match.groups()
-
-                # --- SUSY filter ---
-                if is_susy_process(process_name):
-                    logging.info(f"Skipping SUSY process: {process_name}, ProdID={prod_id}")
-                    continue
-                # -------------------
-
-                key = (gen_id, process_name)
-                if prod_id not in process_dict[key]["ProductionIDs"]:
-                    process_dict[key]["ProductionIDs"].append(prod_id)
-                logging.debug(f"Found ProdID={prod_id}, Process={process_name}, GenID={gen_id}")
-            else:
-                logging.warning(f"Could not parse LFN: {line}")
+    catalog = LFNCatalog.from_file(args.input)
+    for line in catalog.unparsed:
+        logging.warning(f"Could not parse LFN: {line}")
+
+    for (genid, process_name, prodid), rows in catalog.group_rows("genid", "process", "prodid").items():
+        # ProdIDs zero-padded as in the LFN, which is what dirac-ilc-get-info expects
+        gen_id, prod_id = str(genid), f"{prodid:08d}"
+
+        # --- SUSY filter ---
+        if is_susy_process(process_name):
+            logging.info(f"Skipping SUSY process: {process_name}, ProdID={prod_id}")
+            continue
+        # -------------------
+
+        key = (gen_id, process_name)
+        process_dict[key]["ProductionIDs"].append(prod_id)
+        logging.debug(f"Found ProdID={prod_id}, Process={process_name}, GenID={gen_id} ({len(rows)} files)")
 
     logging.info(f"Found {len(process_dict)} unique process entries (by GenID + Process) after SUSY filtering.")
 
-    # Step 2 & 3: Query dirac-ilc-get-info per production
+    # Step 2: Look up cached productions, query dirac-ilc-get-info for the rest concurrently
+    all_prod_ids = list(dict.fromkeys(
+        prod_id for info in process_dict.values() for prod_id in info["ProductionIDs"]
+    ))
+    cache = ProductionCache(args.cache, args.cache_ttl, args.cache_max_entries)
+    prod_info = {}
+    for prod_id in all_prod_ids:
+        if args.refresh:
+            cache.misses += 1
+            continue
+        cached = cache.get(prod_id)
+        if cached is not None:
+            logging.debug(f"Cache hit for ProdID {prod_id}")
+            prod_info[prod_id] = cached
+
+    outputs = query_productions([pid for pid in all_prod_ids if pid not in prod_info], args)
+    for prod_id, output in outputs.items():
+        if output is None:
+            continue
+        info = parse_production_info(output)
+        prod_info[prod_id] = info
+        if info["CrossSection_fb"] is not None and info["NumberOfEvents"] is not None:
+            cache.put(prod_id, info)
+
+    cache.save()
+    if args.cache:
+        logging.info(cache.stats())
+
+    # Step 3: Merge results in LFN order (independent of completion order)
     for (gen_id, process_name), info in process_dict.items():
         for prod_id in info["ProductionIDs"]:
-            logging.info(f"Querying production {prod_id} ({process_name})")
-            try:
-                cmd = ["dirac-ilc-get-info", "-p", prod_id]
-                result = subprocess.run(
-                    cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                    text=True, check=True
-                )
-                output = result.stdout
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Error querying ProdID {prod_id}: {e.stderr.strip()}")
+            result = prod_info.get(prod_id)
+            if result is None:
+                logging.error(f"No result for ProdID {prod_id} ({process_name}), skipping")
                 continue
 
-            # Extract CrossSection
-            cross_section_match = re.search(
-                r'CrossSection\s+:\s+([\dEe\+\-\.]+)\s+fb\+/-([\dEe\+\-\.]+)fb', output
-            )
-            # Extract NumberOfEvents
-            events_match = re.search(
-                r'^\s*NumberOfEvents\s*:\s*(\d+)', output, re.MULTILINE
-            )
-
-            if cross_section_match:
-                xsec_value, xsec_error = cross_section_match.groups()
-                xsec_value = float(xsec_value)
-                xsec_error = float(xsec_error)
+            if result["CrossSection_fb"] is not None:
+                xsec_value = result["CrossSection_fb"]
+                xsec_error = result["CrossSectionError_fb"]
 
                 # Store cross-section if not set yet, else verify consistency
                 if info["CrossSection_fb"] is None:
@@ -143,8 +336,8 @@ def main():
                             f"CrossSection mismatch for process {process_name}, ProdID {prod_id}"
                         )
 
-                if events_match:
-                    info["NumberOfEvents"] += int(events_match.group(1))
+                if result["NumberOfEvents"] is not None:
+                    info["NumberOfEvents"] += result["NumberOfEvents"]
                 else:
                     logging.warning(f"Could not extract NumberOfEvents for ProdID {prod_id}")
 
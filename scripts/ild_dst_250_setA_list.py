@@ -7,15 +7,22 @@ This script runs a Dirac command to list DST files in the ILD MC production.
     dirac-proxy-init -g ilc_user
 
 It will save the output to a timestamped file and log each execution.
+The new listing is then ingested into the local SQLite LFN catalog
+(see lfn_catalog_db.py); only the diff against the previous snapshot is stored.
 """
 
 import subprocess
 from datetime import datetime
 import os
 
+from lfn_catalog_db import LFNDatabase
+
 # Base name for the output files
 output_base = "all_files"
 
+# Persistent LFN catalog updated after every listing (set to None to disable)
+catalog_db = "lfn_catalog.sqlite"
+
 # Dirac command and arguments
 dirac_command = [
     "dirac-ilc-find-in-FC",
@@ -39,11 +46,19 @@ def run_dirac_command():
         
         print(f"Output saved to {output_file}")
         log_execution(output_file)
+        if catalog_db:
+            ingest_snapshot(output_file)
     
     except subprocess.CalledProcessError as e:
         print("Error running Dirac command:")
         print(e.stderr)
 
+def ingest_snapshot(output_file):
+    """Apply the new listing to the persistent LFN catalog as a diff."""
+    with LFNDatabase(catalog_db) as db:
+        n_added, n_removed, n_total = db.ingest(output_file)
+    print(f"Catalog {catalog_db} updated: {n_total} LFNs (+{n_added} / -{n_removed})")
+
 def log_execution(output_file):
     """Log the execution time and output file to a log file."""
     log_file = "dirac_command.log"
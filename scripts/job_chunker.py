@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+job_chunker.py
+
+Balanced splitting of a file list into jobs, shared by the job generators.
+
+Every file has a cost (estimated seconds, events or bytes). The number of jobs
+is chosen so that each job gets about target_cost, within the per-process
+bounds of min_files and max_files per job:
+
+  n_jobs = ceil(total_cost / target_cost), at most n_files // min_files,
+           at least ceil(n_files / max_files)
+
+The files are then distributed with longest-processing-time-first packing
+(largest file into the currently lightest job that still has room), which
+keeps the most expensive job close to the average. Once the files left are
+just enough to bring every job up to min_files, they go to the lightest job
+still below it, so each job gets at least min_files files (unless max_files
+forces more jobs than that allows). Each chunk keeps the original file order,
+and chunks are ordered by their first file.
+
+Usage as a library:
+    from job_chunker import balanced_chunks
+    for chunk in balanced_chunks(files, costs, target_cost=3600, min_files=2, max_files=100):
+        ...
+"""
+
+import heapq
+import math
+
+def plan_n_jobs(n_files, total_cost, target_cost, min_files=1, max_files=None):
+    """Number of jobs for n_files with the given total cost (see module docstring)."""
+    if n_files == 0:
+        return 0
+    n_jobs = math.ceil(total_cost / target_cost) if target_cost and total_cost > 0 else 1
+    n_jobs = min(n_jobs, max(1, n_files // max(1, min_files)))
+    if max_files:
+        n_jobs = max(n_jobs, math.ceil(n_files / max_files))
+    return min(n_jobs, n_files)
+
+def balanced_chunks(files, costs, target_cost, min_files=1, max_files=None):
+    """Split files into chunks of about target_cost each. Returns a list of file lists."""
+    n_jobs = plan_n_jobs(len(files), sum(costs), target_cost, min_files, max_files)
+    if n_jobs == 0:
+        return []
+    capacity = max_files or len(files)
+
+    bins = [[] for _ in range(n_jobs)]
+    loads = [0.0] * n_jobs
+    heap = [(0.0, b) for b in range(n_jobs)]  # (load, bin)
+    short = n_jobs * min_files  # files still needed to give every job min_files
+    order = sorted(range(len(files)), key=lambda i: -costs[i])
+    for n_left, i in zip(range(len(order), 0, -1), order):
+        if n_left <= short:
+            # the rest is needed for the jobs below min_files (the heap is not used any more)
+            b = min((b for b in range(n_jobs) if len(bins[b]) < min_files), key=lambda b: loads[b])
+        else:
+            _, b = heapq.heappop(heap)
+        bins[b].append(i)
+        loads[b] += costs[i]
+        if len(bins[b]) <= min_files:
+            short -= 1
+        if len(bins[b]) < capacity:  # full jobs leave the heap
+            heapq.heappush(heap, (loads[b], b))
+
+    chunks = sorted((sorted(b) for b in bins if b), key=lambda b: b[0])
+    return [[files[i] for i in chunk] for chunk in chunks]
+
+def chunk_costs(chunks, cost_of):
+    """Total cost per chunk, for logging the balance."""
+    return [sum(cost_of[f] for f in chunk) for chunk in chunks]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+job_manifest.py
+
+Incremental regeneration of job directories, shared by the job generators.
+
+Every generated job directory carries a manifest (MANIFEST_NAME) with a hash
+of its rendered files. A generator renders a job in memory, hashes the result
+and rewrites the directory only if the hash differs from the stored one, so
+unchanged jobs - and jobs that are already running - are not touched and keep
+their mtimes, whatever else changed in the generator.
+
+Files are written atomically (temporary file + rename) and the manifest last,
+so an interrupted run leaves a directory that is regenerated next time.
+
+Usage as a library:
+    from job_manifest import inputs_hash, is_current, write_job_files, find_stale_dirs
+    files = {"job.sub": sub_text, "run_job.sh": (script, 0o755)}
+    digest = inputs_hash(files)
+    if not is_current(job_dir, digest):
+        write_job_files(job_dir, files, digest)
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+MANIFEST_NAME = ".job_manifest.json"
+
+# mkstemp creates 0600 files; generated files get the usual umask-based mode
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def inputs_hash(*parts) -> str:
+    """sha256 over the parts (strings/bytes as-is, everything else as canonical JSON)."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        elif not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True, default=str).encode()
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+def read_manifest(job_dir):
+    try:
+        with open(Path(job_dir) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_current(job_dir, digest) -> bool:
+    """True if job_dir was generated from the same inputs and all its files are still there."""
+    manifest = read_manifest(job_dir)
+    return (
+        manifest is not None
+        and manifest.get("inputs_hash") == digest
+        and all((Path(job_dir) / name).exists() for name in manifest.get("files", []))
+    )
+
+def atomic_write_text(path, text, mode=None):
+    """Write text to path via a temporary file in the same directory and a rename."""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp_path, mode if mode is not None else 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def write_if_changed(path, text, mode=None) -> bool:
+    """Atomically write text unless path already has exactly that content. Returns True if written."""
+    path = Path(path)
+    try:
+        if path.read_text() == text:
+            return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    atomic_write_text(path, text, mode)
+    return True
+
+def write_job_files(job_dir, files, digest):
+    """
+    Write {name: text or (text, mode)} into job_dir, then the manifest.
+    Files no longer produced but listed in the old manifest are removed.
+    """
+    job_dir = Path(job_dir)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    for name, content in files.items():
+        text, mode = content if isinstance(content, tuple) else (content, None)
+        atomic_write_text(job_dir / name, text, mode)
+    old = read_manifest(job_dir) or {}
+    for name in set(old.get("files", [])) - set(files):
+        (job_dir / name).unlink(missing_ok=True)
+    atomic_write_text(job_dir / MANIFEST_NAME, json.dumps({"inputs_hash": digest, "files": sorted(files)}, indent=1))
+
+def find_stale_dirs(parent, current_names):
+    """Generated job directories under parent (those with a manifest) that are not in current_names."""
+    current_names = set(current_names)
+    parent = Path(parent)
+    if not parent.is_dir():
+        return []
+    return sorted(
+        d for d in parent.iterdir()
+        if d.is_dir() and d.name not in current_names and (d / MANIFEST_NAME).exists()
+    )
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+lfn_catalog_db.py
+
+Persistent, indexed LFN catalog stored in a local SQLite database.
+
+Each DIRAC listing (e.g. all_files_<timestamp>.txt from ild_dst_250_setA_list.py)
+is ingested as a snapshot. Only the difference against the previous snapshot is
+applied: new LFNs are parsed once with lfn_parser and inserted, vanished LFNs are
+deleted, and both are recorded in the snapshot_changes table.
+
+Tables:
+  - lfns              one row per current LFN with the parsed lfn_parser fields
+                      (NULL fields for lines that are not ILD DST LFNs) and its
+                      position (seq) in the latest snapshot
+  - snapshots         one row per ingested listing with added/removed counts
+  - snapshot_changes  the per-snapshot diff ('+' added, '-' removed)
+
+Indexes exist on process, genid, prodid, version, polarization and on the
+(genid, prodid) and (process_group, version) pairs used by
+filter_and_merge_LFNs.py and generate_grid_jobs.py.
+
+Usage:
+    python3 lfn_catalog_db.py ingest all_files_20250915_224927.txt [--db lfn_catalog.sqlite]
+    python3 lfn_catalog_db.py stats [--db lfn_catalog.sqlite]
+    python3 lfn_catalog_db.py export out.txt [--db lfn_catalog.sqlite]
+"""
+
+import argparse
+import sqlite3
+from datetime import datetime
+
+from lfn_parser import LFNCatalog, parse_lfn, iter_lfns, STRING_FIELDS, INT_FIELDS
+
+# ----------------------------
+# Configuration
+# ----------------------------
+
+DEFAULT_DB = "lfn_catalog.sqlite"
+
+# lfn_parser field name -> SQL column name ("group" is a reserved word)
+COLUMNS = {name: ("process_group" if name == "group" else name) for name in STRING_FIELDS + INT_FIELDS}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lfns (
+    lfn           TEXT PRIMARY KEY,
+    energy_set    TEXT,
+    process_group TEXT,
+    version       TEXT,
+    prefix        TEXT,
+    process       TEXT,
+    polarization  TEXT,
+    genid         INTEGER,
+    n_major       INTEGER,
+    n_minor       INTEGER,
+    prodid        INTEGER,
+    file_index    INTEGER,
+    seq           INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_lfns_process       ON lfns (process);
+CREATE INDEX IF NOT EXISTS idx_lfns_genid         ON lfns (genid);
+CREATE INDEX IF NOT EXISTS idx_lfns_prodid        ON lfns (prodid);
+CREATE INDEX IF NOT EXISTS idx_lfns_version       ON lfns (version);
+CREATE INDEX IF NOT EXISTS idx_lfns_polarization  ON lfns (polarization);
+CREATE INDEX IF NOT EXISTS idx_lfns_genid_prodid  ON lfns (genid, prodid);
+CREATE INDEX IF NOT EXISTS idx_lfns_group_version ON lfns (process_group, version);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    source      TEXT NOT NULL,
+    ingested_at TEXT NOT NULL,
+    n_total     INTEGER NOT NULL,
+    n_added     INTEGER NOT NULL,
+    n_removed   INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS snapshot_changes (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    action      TEXT NOT NULL CHECK (action IN ('+', '-')),
+    lfn         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changes_snapshot ON snapshot_changes (snapshot_id);
+"""
+
+# Catalogs created before lfns.seq existed get the column, in insertion order
+MIGRATION = """
+ALTER TABLE lfns ADD COLUMN seq INTEGER;
+UPDATE lfns SET seq = rowid;
+"""
+
+# ----------------------------
+# Database wrapper
+# ----------------------------
+
+class LFNDatabase:
+    """Thin wrapper around the SQLite LFN catalog."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        if "seq" not in [row[1] for row in self.conn.execute("PRAGMA table_info(lfns)")]:
+            with self.conn:
+                self.conn.executescript(MIGRATION)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_lfns_seq ON lfns (seq)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- ingest -----
+
+    def ingest(self, snapshot_file):
+        """
+        Apply a new listing as a diff against the current catalog.
+        Returns (n_added, n_removed, n_total).
+        """
+        conn = self.conn
+        columns = ["lfn"] + [COLUMNS[name] for name in STRING_FIELDS + INT_FIELDS]
+        insert_sql = f"INSERT INTO lfns ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS temp.snapshot")
+            conn.execute("CREATE TEMP TABLE snapshot (seq INTEGER PRIMARY KEY, lfn TEXT UNIQUE)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO snapshot (lfn) VALUES (?)",
+                ((lfn,) for lfn in iter_lfns(snapshot_file)),
+            )
+
+            added = [row[0] for row in conn.execute(
+                "SELECT s.lfn FROM snapshot s LEFT JOIN lfns l ON l.lfn = s.lfn "
+                "WHERE l.lfn IS NULL ORDER BY s.seq"
+            )]
+            removed = [row[0] for row in conn.execute(
+                "SELECT l.lfn FROM lfns l LEFT JOIN snapshot s ON s.lfn = l.lfn "
+                "WHERE s.lfn IS NULL ORDER BY l.seq"
+            )]
+            n_total = conn.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+
+            cur = conn.execute(
+                "INSERT INTO snapshots (source, ingested_at, n_total, n_added, n_removed) VALUES (?, ?, ?, ?, ?)",
+                (str(snapshot_file), datetime.now().isoformat(timespec="seconds"), n_total, len(added), len(removed)),
+            )
+            snapshot_id = cur.lastrowid
+
+            conn.executemany("DELETE FROM lfns WHERE lfn = ?", ((lfn,) for lfn in removed))
+            conn.executemany(insert_sql, (self._row(lfn) for lfn in added))
+            # Queries return LFNs in the order of the latest listing, like the flat-file mode
+            conn.execute("UPDATE lfns SET seq = (SELECT s.seq FROM snapshot s WHERE s.lfn = lfns.lfn)")
+            conn.executemany(
+                "INSERT INTO snapshot_changes (snapshot_id, action, lfn) VALUES (?, ?, ?)",
+                [(snapshot_id, "+", lfn) for lfn in added] + [(snapshot_id, "-", lfn) for lfn in removed],
+            )
+            conn.execute("DROP TABLE temp.snapshot")
+
+        return len(added), len(removed), n_total
+
+    @staticmethod
+    def _row(lfn):
+        rec = parse_lfn(lfn)
+        if rec is None:
+            return (lfn,) + (None,) * (len(STRING_FIELDS) + len(INT_FIELDS))
+        return tuple(rec)
+
+    # ----- queries -----
+
+    def unparsed(self):
+        """LFNs that are not ILD DST files, in listing order."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT lfn FROM lfns WHERE process IS NULL ORDER BY seq"
+        )]
+
+    def processes(self):
+        """Sorted distinct process names (uses idx_lfns_process)."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT process FROM lfns WHERE process IS NOT NULL ORDER BY process"
+        )]
+
+    def lfns_for_processes(self, processes):
+        """LFNs of the given processes, sorted."""
+        processes = list(processes)
+        if not processes:
+            return []
+        marks = ", ".join("?" * len(processes))
+        return [row[0] for row in self.conn.execute(
+            f"SELECT lfn FROM lfns WHERE process IN ({marks}) ORDER BY lfn", processes
+        )]
+
+    def group_versions(self, exclude_processes=()):
+        """{process_group: [version, ...]} over all parsed LFNs not in exclude_processes."""
+        exclude = set(exclude_processes)
+        result = {}
+        for group, version, process in self.conn.execute(
+            "SELECT DISTINCT process_group, version, process FROM lfns WHERE process IS NOT NULL"
+        ):
+            if process in exclude:
+                continue
+            versions = result.setdefault(group, [])
+            if version not in versions:
+                versions.append(version)
+        return result
+
+    def lfns_for_group_version(self, group, version, exclude_processes=()):
+        """LFNs of one (process_group, version) not in exclude_processes, sorted."""
+        exclude = set(exclude_processes)
+        return [lfn for lfn, process in self.conn.execute(
+            "SELECT lfn, process FROM lfns WHERE process_group = ? AND version = ? ORDER BY lfn",
+            (group, version),
+        ) if process not in exclude]
+
+    def lfns_for_genid_prodid(self, genid, prodid):
+        """LFNs of one (GenID, ProdID), in listing order."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT lfn FROM lfns WHERE genid = ? AND prodid = ? ORDER BY seq",
+            (int(genid), int(prodid)),
+        )]
+
+    def to_catalog(self):
+        """Load the current listing into an in-memory LFNCatalog."""
+        return LFNCatalog.from_lines(row[0] for row in self.conn.execute("SELECT lfn FROM lfns ORDER BY seq"))
+
+    def stats(self):
+        n_lfns = self.conn.execute("SELECT COUNT(*) FROM lfns").fetchone()[0]
+        n_processes = self.conn.execute("SELECT COUNT(DISTINCT process) FROM lfns").fetchone()[0]
+        snapshots = self.conn.execute(
+            "SELECT id, source, ingested_at, n_total, n_added, n_removed FROM snapshots ORDER BY id"
+        ).fetchall()
+        return n_lfns, n_processes, snapshots
+
+# ----------------------------
+# CLI entry
+# ----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent indexed ILD LFN catalog")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite catalog file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="Ingest a new LFN listing (diff against the current catalog)")
+    p_ingest.add_argument("snapshot", help="LFN listing, one per line")
+
+    sub.add_parser("stats", help="Print catalog size and snapshot history")
+
+    p_export = sub.add_parser("export", help="Write the current listing as a flat LFN file")
+    p_export.add_argument("output", help="Output LFN file")
+
+    args = parser.parse_args()
+
+    with LFNDatabase(args.db) as db:
+        if args.command == "ingest":
+            n_added, n_removed, n_total = db.ingest(args.snapshot)
+            print(f"✅ Ingested {args.snapshot}: {n_total} LFNs (+{n_added} / -{n_removed}) into {args.db}")
+        elif args.command == "stats":
+            n_lfns, n_processes, snapshots = db.stats()
+            print(f"{args.db}: {n_lfns} LFNs, {n_processes} processes")
+            for sid, source, ingested_at, n_total, n_added, n_removed in snapshots:
+                print(f"  #{sid:<4} {ingested_at}  {n_total:>9} LFNs  +{n_added:<8} -{n_removed:<8} {source}")
+        elif args.command == "export":
+            with open(args.output, "w") as out:
+                for (lfn,) in db.conn.execute("SELECT lfn FROM lfns ORDER BY seq"):
+                    out.write(lfn + "\n")
+            print(f"✅ Current listing written to {args.output}")
+
+if __name__ == "__main__":
+    main()
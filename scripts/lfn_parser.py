@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+lfn_parser.py
+
+Shared single-pass parser for ILD MC-2020 DST LFNs and a compact columnar
+in-memory catalog built on top of it.
+
+An LFN such as
+
+  /ilc/prod/ilc/mc-2020/ild/dst/250-SetA/higgs/ILD_l5_o2_v02/v02-02-01/00015420/000/
+  rv02-02-01.sv02-02-01.mILD_l5_o2_v02.E250-SetA.I402011.Pqqh.eL.pR.n000_001.d_dst_00015420_175.slcio
+
+is matched exactly once and split into:
+  - energy_set    (250-SetA)
+  - group         (higgs, the process-group directory under the energy set)
+  - version       (v02-02-01, the production version directory)
+  - prefix        (rv02-02-01.sv02-02-01.mILD_l5_o2_v02, file name before the energy tag)
+  - genid         (402011)
+  - process       (qqh)
+  - polarization  (eL.pR)
+  - n_major/n_minor (000_001, the nXXX_YYY field)
+  - prodid        (15420)
+  - file_index    (175)
+
+LFNCatalog stores the string fields as interned codes and the numeric fields
+as integer arrays, so every script can share one parse of the master list.
+
+Usage as a library:
+    from lfn_parser import LFNCatalog
+    catalog = LFNCatalog.from_file("all_files.txt")
+    for (genid, prodid), rows in catalog.group_rows("genid", "prodid").items():
+        ...
+"""
+
+import re
+from array import array
+from collections import namedtuple
+
+# ----------------------------
+# Configuration
+# ----------------------------
+
+# Known SUSY process patterns
+SUSY_KEYWORDS = [
+    "n1n1h", "n23n23h", "e1e1h", "e2e2h", "e3e3h",
+    "n23n23h_dd", "n23n23h_uu", "n23n23h_ss",
+    "n1n1h_dd", "n1n1h_uu", "n1n1h_ss",
+    "e3e3h_dd", "e3e3h_uu", "e3e3h_ss",
+    "e2e2h_dd", "e2e2h_uu", "e2e2h_ss",
+    "e1e1h_dd", "e1e1h_uu", "e1e1h_ss",
+    "qqh_e2e2", "qqh_e3e3"
+]
+
+# One regex for the whole LFN: directory part first, then the file name
+LFN_PATTERN = re.compile(
+    r"/dst/[^/]+/(?P<group>[^/]+)/ILD_[^/]+/(?P<version>v\d{2}-\d{2}(?:-\d{2})?)/"
+    r"(?:[^/]*/)*"                                   # production ID / file number folders
+    r"(?P<prefix>[^/]*?)"                            # rvXX.svXX.mILD_... before energy tag
+    r"\.E(?P<energy_set>[^./]+)"                     # energy + Set tag
+    r"\.I(?P<genid>\d+)"                             # generator ID
+    r"\.P(?P<process>[^./]+)"                        # process name
+    r"\.(?P<polarization>e[LRBW]\.p[LRBW])"          # beam polarization
+    r"\.n(?P<n_major>\d+)_(?P<n_minor>\d+)"          # nXXX_YYY
+    r"\.d_dst_(?P<prodid>\d+)_(?P<file_index>\d+)"   # production ID + file index
+    r"\.slcio$"
+)
+
+# Directory part only (process group + production version). Also matches
+# entries that are not DST files, e.g. LOG tarballs of a production
+GROUP_VERSION_PATTERN = re.compile(
+    r"/ild/dst/[^/]+/(?P<group>[^/]+)/ILD_[^/]+/(?P<version>v\d{2}-\d{2}(?:-\d{2})?)"
+)
+
+STRING_FIELDS = ("energy_set", "group", "version", "prefix", "process", "polarization")
+INT_FIELDS = ("genid", "n_major", "n_minor", "prodid", "file_index")
+FIELDS = STRING_FIELDS + INT_FIELDS
+
+LFNRecord = namedtuple("LFNRecord", ("lfn",) + FIELDS)
+
+# ----------------------------
+# Helpers
+# ----------------------------
+
+def is_susy_process(process_name: str) -> bool:
+    """Check if the process name matches a SUSY keyword."""
+    return any(tag in process_name for tag in SUSY_KEYWORDS)
+
+def version_key(version: str) -> tuple:
+    """Convert version string like 'v02-02-03' → (2, 2, 3) for comparison"""
+    parts = version.strip("v").split("-")
+    return tuple(int(p) for p in parts)
+
+def parse_lfn(lfn: str):
+    """Split one LFN into an LFNRecord, or return None if it is not an ILD DST LFN."""
+    m = LFN_PATTERN.search(lfn)
+    if not m:
+        return None
+    g = m.group
+    return LFNRecord(
+        lfn,
+        *(g(name) for name in STRING_FIELDS),
+        *(int(g(name)) for name in INT_FIELDS),
+    )
+
+def parse_group_version(lfn: str):
+    """(process group, version) from the directory part of any ILD DST-area LFN, or None."""
+    m = GROUP_VERSION_PATTERN.search(lfn)
+    return (m.group("group"), m.group("version")) if m else None
+
+def normalize_line(raw: bytes) -> str:
+    """Strip and decode one raw line of an LFN list ('' for blank lines)."""
+    return raw.strip().replace(b"\r", b"").decode("utf-8", errors="ignore")
+
+def iter_lfns(file_path):
+    """Yield the non-empty, stripped lines of an LFN list."""
+    with open(file_path, "rb") as f:
+        for raw in f:
+            line = normalize_line(raw)
+            if line:
+                yield line
+
+# ----------------------------
+# Columnar catalog
+# ----------------------------
+
+class LFNCatalog:
+    """
+    Columnar in-memory LFN catalog.
+
+    Row i is described by self.lfns[i], the integer arrays in self.ints and the
+    string codes in self.codes, which index into self.strings[field].
+    Lines that do not parse are kept in self.unparsed, in input order.
+    """
+
+    def __init__(self):
+        self.lfns = []
+        self.unparsed = []
+        self.strings = {name: [] for name in STRING_FIELDS}
+        self.codes = {name: array("l") for name in STRING_FIELDS}
+        self.ints = {name: array("l") for name in INT_FIELDS}
+        self._lookup = {name: {} for name in STRING_FIELDS}
+
+    def __len__(self):
+        return len(self.lfns)
+
+    def __iter__(self):
+        for i in range(len(self.lfns)):
+            yield self.record(i)
+
+    def _intern(self, field, value):
+        lookup = self._lookup[field]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.strings[field])
+            self.strings[field].append(value)
+        return code
+
+    def add(self, lfn: str) -> bool:
+        """Parse and append one LFN. Returns False (and keeps it in unparsed) if it does not match."""
+        m = LFN_PATTERN.search(lfn)
+        if not m:
+            self.unparsed.append(lfn)
+            return False
+        g = m.group
+        self.lfns.append(lfn)
+        for name in STRING_FIELDS:
+            self.codes[name].append(self._intern(name, g(name)))
+        for name in INT_FIELDS:
+            self.ints[name].append(int(g(name)))
+        return True
+
+    def extend(self, lines):
+        for lfn in lines:
+            self.add(lfn)
+        return self
+
+    @classmethod
+    def from_lines(cls, lines):
+        return cls().extend(lines)
+
+    @classmethod
+    def from_file(cls, file_path):
+        return cls().extend(iter_lfns(file_path))
+
+    def value(self, field, i):
+        """Value of a single field in row i."""
+        if field == "lfn":
+            return self.lfns[i]
+        if field in self.ints:
+            return self.ints[field][i]
+        return self.strings[field][self.codes[field][i]]
+
+    def column(self, field):
+        """Full column as a list of Python values."""
+        if field == "lfn":
+            return list(self.lfns)
+        if field in self.ints:
+            return list(self.ints[field])
+        table = self.strings[field]
+        return [table[c] for c in self.codes[field]]
+
+    def record(self, i) -> LFNRecord:
+        return LFNRecord(self.lfns[i], *(self.value(name, i) for name in FIELDS))
+
+    def distinct(self, field):
+        """Sorted distinct values of a field."""
+        if field in self.strings:
+            return sorted(self.strings[field])
+        return sorted(set(self.ints[field]))
+
+    def group_rows(self, *fields):
+        """
+        Group row indices by the given fields.
+        Returns {key: [row, ...]} in first-seen order; key is a tuple unless a
+        single field is given.
+        """
+        cols = [self.codes[f] if f in self.codes else self.ints[f] for f in fields]
+        decoders = [self.strings[f] if f in self.codes else None for f in fields]
+        raw = {}
+        if len(cols) == 1:
+            for i, c in enumerate(cols[0]):
+                raw.setdefault(c, []).append(i)
+        else:
+            for i, key in enumerate(zip(*cols)):
+                raw.setdefault(key, []).append(i)
+
+        grouped = {}
+        for key, rows in raw.items():
+            parts = key if len(cols) > 1 else (key,)
+            decoded = tuple(d[p] if d is not None else p for d, p in zip(decoders, parts))
+            grouped[decoded if len(cols) > 1 else decoded[0]] = rows
+        return grouped
@@ -3,60 +3,197 @@
 Pilot selection for Higgs->Invisible analysis at 250 GeV (~50 fb^-1).
 
 This version uses a pre-generated file all_files.txt containing all available LFNs.
-It selects up to MAX_FILES_PER_PROCESS files per process for the pilot run.
+For each process it selects the smallest set of files that reaches an equivalent
+run luminosity of TARGET_LUMI_FB:
+  - files are stratified by generator sample (GenID, polarization). A run of
+    TARGET_LUMI_FB records only a share of it with each beam polarization
+    (POLARIZATION_LUMI_SHARE, H20 scenario), so a sample needs
+    TARGET_LUMI_FB * share * CrossSection_fb events; photon beams (B/W) count
+    for all helicities of that beam
+  - cross sections come from XSEC_FILE, matched on (GenID, process) for
+    ilc_xsec_collector.py output or on (ProdID, process) for one entry per
+    production (one production can hold several processes)
+  - events per file come from the nXXX_YYY field, or from NumberOfEvents of the
+    cross-section entry divided by its number of files where that field is 000
+  - productions of one sample add up: their files (largest first) are taken
+    in turn until the sample has its share
+  - samples without a cross section share MAX_FILES_PER_PROCESS files evenly
+  - the per-sample picks are interleaved and capped at MAX_FILES_PER_PROCESS,
+    so a capped process still covers every sample, ProdID and polarization
 
 Output:
   - LFNs written to pilot_lfns.txt
   - Directory structure samples/<process>/
+
+Files are downloaded by download_manager.py: DOWNLOAD_TRANSFERS concurrent
+transfers straight into samples/<process>/, verified against the catalogue
+size/checksum, retried on failure, and skipped if already present.
+
+With STREAM_CONVERT the files are not downloaded in one go; instead
+slcio_stream_pipeline.py fetches, converts, validates and deletes them
+concurrently while keeping at most DISK_BUDGET_GB of SLCIO on scratch.
 """
 
 import os
-import re
-from collections import defaultdict
-import subprocess
+import math
+from collections import Counter, defaultdict
+
+import yaml
+
+from lfn_parser import LFNCatalog
+from download_manager import DownloadManager, fetch_metadata
+from slcio_stream_pipeline import run_stream_pipeline
 
 # Config
 ALL_FILES = "all_files.txt"
 LFN_FILE = "pilot_lfns.txt"
 SAMPLES_DIR = "samples"
-MAX_FILES_PER_PROCESS = 50
+XSEC_FILE = "pilot_xsec.yaml"  # ilc_xsec_collector.py output, or one entry per ProdID
+TARGET_LUMI_FB = 50.0  # Equivalent run luminosity per process [fb^-1]
+# Share of the run luminosity per (electron, positron) helicity (H20 scenario at 250 GeV)
+POLARIZATION_LUMI_SHARE = {("L", "R"): 0.45, ("R", "L"): 0.45, ("L", "L"): 0.05, ("R", "R"): 0.05}
+DEFAULT_EVENTS_PER_FILE = 1000  # When neither nXXX_YYY nor NumberOfEvents gives a count
+MAX_FILES_PER_PROCESS = 50  # Cap per process (and budget for strata without cross section)
 DRY_RUN = False  # Set to False to download files
-
-# Load all files
-with open(ALL_FILES, "r") as f:
-    all_files = [line.strip() for line in f if line.strip()]
-
-# Group files by process
-files_by_process = defaultdict(list)
-for lfn in all_files:
-    # Extract process name from the filename
-    # Pattern: .P<process>.<polarization>.nXXX_YYY.d_...
-    match = re.search(r"\.P([a-zA-Z0-9_]+)\.", lfn)
-    if match:
-        process = match.group(1)
-        files_by_process[process].append(lfn)
-    else:
-        # fallback if pattern fails
-        files_by_process["unknown"].append(lfn)
-
-# Select up to MAX_FILES_PER_PROCESS per process
+STREAM_CONVERT = False  # Download + convert to EDM4hep file by file with a disk budget
+DISK_BUDGET_GB = 100.0  # Max SLCIO on scratch with STREAM_CONVERT
+DOWNLOAD_TRANSFERS = 8  # Concurrent transfers
+DOWNLOAD_RETRIES = 3    # Attempts per file
+VERIFY_DOWNLOADS = True # Check size + Adler32 against the file catalogue
+
+# Helpers
+def load_xsecs(path):
+    """
+    Cross-section samples from the YAML ({} if it is missing), in either format:
+      - ilc_xsec_collector.py output: GeneratorID, Process, ProductionIDs: [...],
+        keyed ("genid", GenID, process)
+      - one entry per production: ProdID, Process, keyed ("prodid", ProdID, process)
+    Values are {"xsec_fb", "n_events"}; n_events covers all productions of the entry.
+    """
+    if not os.path.exists(path):
+        print(f"⚠️ {path} not found, falling back to MAX_FILES_PER_PROCESS for every process")
+        return {}
+    with open(path) as f:
+        entries = yaml.safe_load(f) or []
+    xsecs = {}
+    for e in entries:
+        sample = {"xsec_fb": e.get("CrossSection_fb"), "n_events": e.get("NumberOfEvents")}
+        if "GeneratorID" in e and "ProductionIDs" in e:
+            xsecs["genid", int(e["GeneratorID"]), e.get("Process")] = sample
+        elif "ProdID" in e:
+            xsecs["prodid", int(e["ProdID"]), e.get("Process")] = sample
+    if entries and not xsecs:
+        raise ValueError(f"{path}: no entry has GeneratorID/ProductionIDs or ProdID")
+    return xsecs
+
+def sample_keys(catalog, xsecs):
+    """Cross-section key of every catalogue row (GenID match first, then ProdID), None without one."""
+    keys = []
+    for genid, prodid, process in zip(catalog.ints["genid"], catalog.ints["prodid"], catalog.column("process")):
+        by_genid, by_prodid = ("genid", genid, process), ("prodid", prodid, process)
+        keys.append(by_genid if by_genid in xsecs else by_prodid if by_prodid in xsecs else None)
+    return keys
+
+def lumi_share(polarization):
+    """Share of the run luminosity recorded with this beam polarization (photon beams B/W summed over)."""
+    e, p = polarization[1], polarization[4]  # "eL.pR"
+    return sum(share for (se, sp), share in POLARIZATION_LUMI_SHARE.items()
+               if (e in "BW" or se == e) and (p in "BW" or sp == p))
+
+def events_per_file(catalog, xsecs, keys):
+    """Estimated events of every catalogue row (nXXX_YYY, else NumberOfEvents / files of the sample)."""
+    files_per_sample = Counter(keys)
+    events = []
+    for n, key in zip(catalog.ints["n_major"], keys):
+        total = xsecs[key]["n_events"] if key is not None else None
+        if n > 0:
+            events.append(n)
+        elif total:
+            events.append(total / files_per_sample[key])
+        else:
+            events.append(DEFAULT_EVENTS_PER_FILE)
+    return events
+
+def interleave(lists):
+    """Round-robin merge: first element of every list, then the second, ..."""
+    merged = []
+    for i in range(max((len(l) for l in lists), default=0)):
+        merged.extend(l[i] for l in lists if i < len(l))
+    return merged
+
+def select_process(catalog, rows, events, xsecs, keys, target_lumi, max_files):
+    """
+    Rows to stage for one process. Returns (rows, n_events, lumi_fb) where
+    lumi_fb is the lowest run luminosity represented by a sample with a cross
+    section (None if no sample has one).
+    """
+    strata = defaultdict(lambda: defaultdict(list))  # (GenID, polarization) -> ProdID -> rows
+    for i in rows:
+        strata[catalog.ints["genid"][i], catalog.value("polarization", i)][catalog.ints["prodid"][i]].append(i)
+
+    def has_xsec(i):
+        return keys[i] is not None and bool(xsecs[keys[i]]["xsec_fb"])
+
+    def file_lumi(i):
+        return events[i] / xsecs[keys[i]]["xsec_fb"]
+
+    picks = []
+    unknown = []
+    for (genid, polarization), by_prodid in sorted(strata.items()):
+        # largest files first, file index for a deterministic order
+        productions = [sorted(members, key=lambda i: (-events[i], catalog.ints["file_index"][i]))
+                       for _, members in sorted(by_prodid.items())]
+        known = [[i for i in members if has_xsec(i)] for members in productions]
+        unknown.extend([i for i in members if not has_xsec(i)] for members in productions)
+        # productions of one sample add up: take their files in turn until the sample has its share
+        needed = target_lumi * lumi_share(polarization)
+        chosen, lumi = [], 0.0
+        for i in interleave(known):
+            if lumi >= needed:
+                break
+            chosen.append(i)
+            lumi += file_lumi(i)
+        picks.append(chosen)
+    unknown = [members for members in unknown if members]
+    if unknown:
+        share = math.ceil(max_files / len(unknown))
+        picks.extend(members[:share] for members in unknown)
+
+    chosen = interleave(picks)[:max_files]
+    chosen_lumi = defaultdict(float)
+    for i in chosen:
+        if has_xsec(i):
+            chosen_lumi[catalog.ints["genid"][i], catalog.value("polarization", i)] += file_lumi(i)
+    lumis = [chosen_lumi[key] / lumi_share(key[1])
+             for key, by_prodid in strata.items()
+             if any(has_xsec(i) for members in by_prodid.values() for i in members)]
+    return chosen, sum(events[i] for i in chosen), min(lumis) if lumis else None
+
+# Load and parse all files once
+catalog = LFNCatalog.from_file(ALL_FILES)
+xsecs = load_xsecs(XSEC_FILE)
+keys = sample_keys(catalog, xsecs)
+events = events_per_file(catalog, xsecs, keys)
+if xsecs and not any(keys):
+    print(f"⚠️ None of the {len(xsecs)} entries in {XSEC_FILE} matches a GenID/ProdID and process of {ALL_FILES}")
+
+# Select the files per process
 selected_files = []
+selected_by_lfn = []  # (lfn, process) download targets
 summary = []
 
-for process, files in files_by_process.items():
-    files.sort()  # deterministic order
-    chosen = files[:MAX_FILES_PER_PROCESS]
-    selected_files.extend(chosen)
+for process, rows in sorted(catalog.group_rows("process").items()):
+    chosen, n_events, lumi = select_process(catalog, rows, events, xsecs, keys, TARGET_LUMI_FB, MAX_FILES_PER_PROCESS)
+    selected_files.extend(catalog.lfns[i] for i in chosen)
+    selected_by_lfn.extend((catalog.lfns[i], process) for i in chosen)
+    summary.append((process, len(chosen), round(n_events), lumi))
 
-    # Estimate total events per process from filename (pattern nXXX_YYY)
-    total_events = 0
-    for f in chosen:
-        m = re.search(r"\.n(\d+)_\d+", f)
-        if m:
-            total_events += int(m.group(1))
-        else:
-            total_events += 1000
-    summary.append((process, len(chosen), total_events))
+# fallback if pattern fails
+if catalog.unparsed:
+    chosen = sorted(catalog.unparsed)[:MAX_FILES_PER_PROCESS]
+    selected_files.extend(chosen)
+    selected_by_lfn.extend((lfn, "unknown") for lfn in chosen)
+    summary.append(("unknown", len(chosen), DEFAULT_EVENTS_PER_FILE * len(chosen), None))
 
 # Write LFNs to file
 with open(LFN_FILE, "w") as f:
@@ -66,29 +203,30 @@ with open(LFN_FILE, "w") as f:
 print(f"✔ Wrote {len(selected_files)} LFNs to {LFN_FILE}")
 
 # Create directories for each process
-for process, _, _ in summary:
+for process, *_ in summary:
     os.makedirs(os.path.join(SAMPLES_DIR, process), exist_ok=True)
 
 # Optional: download files
-if not DRY_RUN:
-    print("⬇ Downloading files...")
-    subprocess.run(["dirac-dms-get-file", LFN_FILE])
-
-    # Move downloaded files to process directories
-    for lfn in selected_files:
-        filename = os.path.basename(lfn)
-        process = next((p for p in files_by_process if p in lfn), None)
-        if process:
-            target_dir = os.path.join(SAMPLES_DIR, process)
-            source_path = os.path.join(os.getcwd(), filename)
-            if os.path.exists(source_path):
-                os.rename(source_path, os.path.join(target_dir, filename))
-    print("✔ Files moved to samples/<process>/ directories")
+if not DRY_RUN and STREAM_CONVERT:
+    print(f"⬇ Streaming download → conversion (disk budget {DISK_BUDGET_GB} GB)...")
+    tally = run_stream_pipeline(LFN_FILE, SAMPLES_DIR, DISK_BUDGET_GB)
+    print(f"✔ Converted {tally['converted']} files into samples/<process>/edm4hep/")
+elif not DRY_RUN:
+    print(f"⬇ Downloading {len(selected_by_lfn)} files with {DOWNLOAD_TRANSFERS} concurrent transfers...")
+    metadata = fetch_metadata(selected_files) if VERIFY_DOWNLOADS else {}
+    manager = DownloadManager(SAMPLES_DIR, transfers=DOWNLOAD_TRANSFERS, retries=DOWNLOAD_RETRIES, metadata=metadata)
+    tally, failures = manager.run(selected_by_lfn)
+    print(f"✔ Files in samples/<process>/ directories: {tally['downloaded']} downloaded, "
+          f"{tally['skipped']} already present, {tally['failed']} failed")
+    for lfn, reason in failures:
+        print(f"   failed: {lfn} ({reason})")
 
 # Print summary
 print("\nPilot selection summary:")
-print(f"{'Process':25s} {'#Files':>6s} {'#Events':>10s}")
-for process, n_files, total_events in summary:
-    print(f"{process:25s} {n_files:6d} {total_events:10d}")
+print(f"{'Process':25s} {'#Files':>6s} {'#Events':>10s} {'L [fb^-1]':>10s}")
+for process, n_files, total_events, lumi in summary:
+    lumi_str = "n/a" if lumi is None else f"{lumi:.1f}"
+    flag = "  (below target)" if lumi is not None and lumi < TARGET_LUMI_FB else ""
+    print(f"{process:25s} {n_files:6d} {total_events:10d} {lumi_str:>10s}{flag}")
 
 print("\n✔ Ready for pilot download and analysis")
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+sample_scanner.py
+
+Shared scanner for sample trees of the form
+
+  ROOT_DIR/ProcessName/edm4hep/*.root
+
+used by discover_mc_processes.py and generate_job_yamls.py.
+
+- One os.scandir per directory; file sizes come from the same directory entries
+- Process directories are listed in parallel (every listing on EOS is a network
+  round trip, so the threads mostly wait)
+- Listings are cached per directory, keyed by the directory's mtime: adding,
+  removing or renaming a file changes the mtime and triggers a new listing,
+  unchanged directories are not listed again. Directories modified within the
+  last MTIME_SETTLE_S seconds are never cached, so a listing taken while files
+  are still being written is not reused.
+
+Usage as a library:
+    from sample_scanner import scan_samples
+    for process, edm in scan_samples(ROOT_DIR, cache_path="sample_scan_cache.json").items():
+        if edm is None: ...             # no edm4hep/ subdirectory
+        edm["path"], edm["files"]       # {name: size in bytes}, sorted by name
+
+Usage (print a summary):
+    python3 sample_scanner.py ROOT_DIR [--cache sample_scan_cache.json] [-j 16]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------------------------
+# Configuration
+# -----------------------------
+SUBDIR = "edm4hep"
+SUFFIX = ".root"
+SCAN_WORKERS = 16
+MTIME_SETTLE_S = 2.0
+
+# -----------------------------
+# Listing cache
+# -----------------------------
+class ScanCache:
+    """JSON file {dir_path: {"mtime_ns": int, "files": {name: size}}}, written atomically."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable scan cache {path}: {e}")
+
+    def get(self, dir_path, mtime_ns):
+        with self.lock:
+            entry = self.entries.get(dir_path)
+            if entry is not None and entry["mtime_ns"] == mtime_ns:
+                self.hits += 1
+                return entry["files"]
+            self.misses += 1
+            return None
+
+    def put(self, dir_path, mtime_ns, files):
+        if time.time() - mtime_ns / 1e9 < MTIME_SETTLE_S:
+            return
+        with self.lock:
+            self.entries[dir_path] = {"mtime_ns": mtime_ns, "files": files}
+            self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+# -----------------------------
+# Scanning
+# -----------------------------
+def list_files(dir_path, suffix=SUFFIX, cache=None):
+    """{name: size} of the files ending in suffix in dir_path (None if it is not a directory)."""
+    try:
+        mtime_ns = os.stat(dir_path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if cache is not None:
+        files = cache.get(dir_path, mtime_ns)
+        if files is not None:
+            return files
+
+    files = {}
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if not entry.name.endswith(suffix):
+                    continue
+                try:
+                    if entry.is_file():
+                        files[entry.name] = entry.stat().st_size
+                except OSError as e:  # e.g. dangling symlink
+                    logging.warning(f"Cannot stat {entry.path}: {e}")
+    except NotADirectoryError:
+        return None
+    files = dict(sorted(files.items()))
+    if cache is not None:
+        cache.put(dir_path, mtime_ns, files)
+    return files
+
+def scan_samples(root_dir, subdir=SUBDIR, suffix=SUFFIX, workers=SCAN_WORKERS, cache_path=None):
+    """
+    Scan root_dir/<process>/<subdir>/ for files ending in suffix.
+    Returns {process: {"path": abs dir, "files": {name: size}} or None if the
+    process has no <subdir>/}, ordered by process name.
+    """
+    with os.scandir(root_dir) as it:
+        process_dirs = sorted(entry.name for entry in it if entry.is_dir())
+
+    cache = ScanCache(cache_path) if cache_path else None
+    edm_dirs = [os.path.realpath(os.path.join(root_dir, p, subdir)) for p in process_dirs]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        listings = list(pool.map(lambda d: list_files(d, suffix, cache), edm_dirs))
+
+    if cache is not None:
+        cache.save()
+        logging.info(f"Scan cache {cache_path}: {cache.hits} directories unchanged, {cache.misses} listed")
+
+    return {
+        process: None if files is None else {"path": edm_dir, "files": files}
+        for process, edm_dir, files in zip(process_dirs, edm_dirs, listings)
+    }
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Scan <root>/<process>/edm4hep/*.root with a directory-mtime cache")
+    parser.add_argument("root_dir", help="Directory with one subdirectory per process")
+    parser.add_argument("--cache", default=None, help="Listing cache file (JSON)")
+    parser.add_argument("-j", "--workers", type=int, default=SCAN_WORKERS, help="Parallel directory listings")
+    args = parser.parse_args()
+
+    start = time.time()
+    samples = scan_samples(args.root_dir, workers=args.workers, cache_path=args.cache)
+    for process, edm in samples.items():
+        if edm is None:
+            print(f"{process:<30} | no {SUBDIR}/ subdir")
+        else:
+            print(f"{process:<30} | {len(edm['files']):>6} files | {sum(edm['files'].values()) / 1024**3:8.2f} GB")
+    print(f"✅ Scanned {len(samples)} process directories in {time.time() - start:.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,18 @@ slcio2edm4hep_crawler.py
 Recursively crawl through a given root directory, find all .slcio files,
 convert them into edm4hep .root files using:
 
-    check_missing_cols --minimal input.slcio > patch.txt
-    lcio2edm4hep input.slcio output.root patch.txt
+    check_missing_cols --minimal input.slcio > input.patch.txt
+    lcio2edm4hep input.slcio output.root input.patch.txt
 
 Validation:
-- The converted .root file is checked with edm4hep-dump (or rootls as fallback).
+- If uproot is installed (optional: pip install uproot, which also pulls in
+  awkward), the converted .root file is checked structurally: it must open (a
+  truncated file has no valid key list), contain the "events" tree with the
+  collections in EXPECTED_COLLECTIONS, and have as many entries as the source
+  file has LCIO events (lcio_event_counter). Only the header, key list and
+  tree metadata are read, not the event data.
+- Without uproot (or with --validator edm4hep-dump) the file is checked with
+  edm4hep-dump (or rootls as fallback).
 - Only if validation succeeds, the original .slcio file is deleted.
 
 Features:
@@ -18,21 +25,68 @@ Features:
 - Deletes .slcio files after successful validation
 - Dry-run mode (shows what would be done without executing commands)
 - Logging to both console and a file (slcio2edm4hep.log)
+- Parallel mode (--jobs N): files are converted by a pool of N worker processes.
+  Each worker buffers its log messages, which are written in file order once the
+  file is done; a failure in one file (or a crashed worker) only affects that file.
+  Every file gets its own <name>.patch.txt, so workers in the same directory
+  never overwrite each other's patch file.
+- Final tally of converted / validation-failed / errored files
+- Patch cache: all files of one production (same software prefix
+  rvXX.svXX.mILD_... and ProdID in the file name) share one collection layout,
+  so check_missing_cols runs once per production. The patch is stored
+  content-addressed in the cache directory (objects/<sha256>.txt, with
+  keys/<production> pointing to it) and reused by every later file and run.
+  If lcio2edm4hep rejects a file with the cached patch, the patch is recomputed
+  for that file, the conversion retried, and the production re-pointed to the
+  new patch. Disable with --no-patch-cache.
+- Resumable: every finished step (patched, converted, moved, validated,
+  deleted) is appended to a JSONL journal (default
+  <rootdir>/.conversion_journal.jsonl). After an interruption, a restart
+  resumes each file at the next step, e.g. a .root file that was already moved
+  is only validated instead of being converted again. Disable with --no-journal.
+- Local staging (--scratch DIR): for inputs on EOS/AFS, each file is copied to
+  a private directory on local scratch (or tmpfs, --tmpfs-max-mb) and patched,
+  converted and validated there. Only the validated .root is copied back to
+  edm4hep/ in one sequential write plus a rename, and the lcio2edm4hep log only
+  if it is not empty. Falls back to in-place conversion if scratch is too full.
 
 Usage:
     source /cvmfs/sw.hsf.org/key4hep/setup.sh -r 2025-01-28
-    python3 slcio2edm4hep_crawler.py /path/to/rootdir [--dry-run]
+    python3 slcio2edm4hep_crawler.py /path/to/rootdir [--dry-run] [--jobs 16] [--patch-cache DIR]
+                                     [--scratch /tmp/$USER/convert [--tmpfs-max-mb 512]]
 
     or better, use nohup to keep the job running if connection fails:
     nohup python3 slcio2edm4hep_crawler.py /path/to/rootdir [--dry-run] > convert.out 2>&1 &
 """
 
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
 import argparse
+import tempfile
 import logging
 import subprocess
 import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
+try:
+    import uproot
+except ImportError:  # optional: fall back to edm4hep-dump / rootls
+    uproot = None
+
+EVENTS_TREE = "events"
+EXPECTED_COLLECTIONS = ["PandoraPFOs", "MCParticlesSkimmed"]  # collections the H→inv analysis reads
+
+# rv02-02.sv02-02.mILD_l5_o1_v02.E250-SetA.I500010.P4f_ww_h.eL.pR.n001.d_dst_00015162_42.slcio
+#   -> production "rv02-02.sv02-02.mILD_l5_o1_v02.15162"
+PRODUCTION_PATTERN = re.compile(r"^(?P<software>[^/]*?)\.E[^./]+\..*\.d_dst_(?P<prodid>\d+)_\d+\.slcio$")
+
 def setup_logging():
     logger = logging.getLogger("slcio2edm4hep")
     logger.setLevel(logging.INFO)
@@ -47,12 +101,258 @@ def setup_logging():
 
     return logger
 
-def validate_root_file(root_file: Path, logger) -> bool:
-    """Check if the ROOT file is valid using edm4hep-dump or rootls."""
+class BufferedLogger:
+    """Collects (level, message) pairs in a worker process; replayed by the parent logger."""
+
+    def __init__(self):
+        self.records = []
+
+    def info(self, msg):
+        self.records.append((logging.INFO, msg))
+
+    def warning(self, msg):
+        self.records.append((logging.WARNING, msg))
+
+    def error(self, msg):
+        self.records.append((logging.ERROR, msg))
+
+def production_key(slcio_file: Path):
+    """Software prefix + ProdID of an ILD DST file name, or None for other files."""
+    m = PRODUCTION_PATTERN.match(slcio_file.name)
+    if not m:
+        return None
+    return f"{m.group('software')}.{int(m.group('prodid'))}"
+
+class PatchCache:
+    """
+    Content-addressed store of check_missing_cols patch files:
+      objects/<sha256>.txt   patch contents
+      keys/<production>      sha256 of the patch used for that production
+    Writes are atomic renames, and computing a missing patch holds a per-production
+    flock, so parallel workers (and concurrent runs) compute each patch only once.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.keys_dir = self.cache_dir / "keys"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.keys_dir.mkdir(parents=True, exist_ok=True)
+
+    def lookup(self, key):
+        try:
+            digest = (self.keys_dir / key).read_text().strip()
+        except FileNotFoundError:
+            return None
+        obj = self.objects_dir / f"{digest}.txt"
+        return obj if obj.exists() else None
+
+    def store(self, key, content: bytes) -> Path:
+        digest = hashlib.sha256(content).hexdigest()
+        obj = self.objects_dir / f"{digest}.txt"
+        if not obj.exists():
+            atomic_write(obj, content)
+        atomic_write(self.keys_dir / key, digest.encode())
+        return obj
+
+    @contextmanager
+    def lock(self, key):
+        with open(self.keys_dir / f"{key}.lock", "w") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+def atomic_write(path: Path, content: bytes):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(content)
+    tmp_path.replace(path)
+
+def run_check_missing_cols(slcio_file: Path) -> bytes:
+    """Full read of slcio_file with check_missing_cols --minimal; returns the patch."""
+    return subprocess.run(
+        ["check_missing_cols", "--minimal", str(slcio_file)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    ).stdout
+
+def get_patch(slcio_file: Path, patch_cache, logger):
+    """
+    Patch file for slcio_file: (path, cached key or None).
+    The path is a cache object (do not delete) when a key is returned.
+    """
+    key = production_key(slcio_file) if patch_cache is not None else None
+    if key is None:
+        patch_file = slcio_file.with_suffix(".patch.txt")  # per file: safe with parallel workers
+        patch_file.write_bytes(run_check_missing_cols(slcio_file))
+        return patch_file, None
+
+    patch_file = patch_cache.lookup(key)
+    if patch_file is None:
+        with patch_cache.lock(key):
+            patch_file = patch_cache.lookup(key)  # another worker may have been faster
+            if patch_file is None:
+                patch_file = patch_cache.store(key, run_check_missing_cols(slcio_file))
+                logger.info(f" → Patch computed for production {key}: {patch_file.name}")
+                return patch_file, key
+    logger.info(f" → Patch from cache for production {key}: {patch_file.name}")
+    return patch_file, key
+
+def run_lcio2edm4hep(slcio_file: Path, root_file: Path, patch_file: Path, err_log: Path):
+    with open(err_log, "w") as elog:
+        subprocess.run(
+            ["lcio2edm4hep", str(slcio_file), str(root_file), str(patch_file)],
+            stdout=subprocess.DEVNULL,
+            stderr=elog,
+            check=True,
+        )
+
+def count_lcio_events(slcio_file: Path, logger):
+    """
+    Number of events in an LCIO file (lcio_event_counter), or None (with a
+    warning, the event-count check is then skipped) if it cannot be determined.
+    """
+    try:
+        result = subprocess.run(
+            ["lcio_event_counter", str(slcio_file)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        )
+    except FileNotFoundError:
+        logger.warning(f"lcio_event_counter not found, event count of {slcio_file} not checked")
+        return None
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"lcio_event_counter failed on {slcio_file} (exit code {e.returncode}), event count not checked")
+        return None
+    numbers = re.findall(r"\d+", result.stdout)
+    if not numbers:
+        logger.warning(f"No event count in lcio_event_counter output for {slcio_file}, event count not checked")
+        return None
+    return int(numbers[-1])
+
+def validate_root_structure(root_file: Path, logger, expected_events=None) -> bool:
+    """Structural check with uproot: events tree, expected collections and entry count."""
+    try:
+        with uproot.open(root_file) as f:
+            if EVENTS_TREE not in f:
+                logger.error(f"Validation failed for {root_file}: no '{EVENTS_TREE}' tree")
+                return False
+            tree = f[EVENTS_TREE]
+            n_entries = tree.num_entries
+            branches = set(tree.keys(recursive=False))
+    except Exception as e:  # truncated or corrupt file
+        logger.error(f"Validation failed for {root_file}: {e}")
+        return False
+
+    missing = [c for c in EXPECTED_COLLECTIONS if c not in branches]
+    if missing:
+        logger.error(f"Validation failed for {root_file}: missing collections {missing}")
+        return False
+    if expected_events is not None and n_entries != expected_events:
+        logger.error(f"Validation failed for {root_file}: {n_entries} entries, source has {expected_events} events")
+        return False
+    if n_entries == 0:
+        logger.error(f"Validation failed for {root_file}: '{EVENTS_TREE}' tree is empty")
+        return False
+    checked = "event count checked" if expected_events is not None else "event count NOT checked"
+    logger.info(f"Validation OK (structure, {n_entries} events, {checked}): {root_file}")
+    return True
+
+def convert_with_patch(slcio_file: Path, root_file: Path, patch_file: Path, key, patch_cache, err_log: Path, logger):
+    """lcio2edm4hep with the given patch; a rejected cached patch is recomputed for this file once."""
+    try:
+        run_lcio2edm4hep(slcio_file, root_file, patch_file, err_log)
+    except subprocess.CalledProcessError:
+        if key is None:
+            raise
+        # this file does not fit the production's patch: recompute it for this file
+        logger.warning(f"Cached patch for {key} rejected, recomputing for {slcio_file}")
+        root_file.unlink(missing_ok=True)
+        with patch_cache.lock(key):
+            patch_file = patch_cache.store(key, run_check_missing_cols(slcio_file))
+        run_lcio2edm4hep(slcio_file, root_file, patch_file, err_log)
+    if key is None:
+        patch_file.unlink(missing_ok=True)
+
+class ScratchArea:
+    """
+    Local scratch for staged conversions. Inputs up to tmpfs_max_mb go to
+    tmpfs_dir (e.g. /dev/shm), everything else to scratch_dir. Only the path
+    settings are stored, so the object can be handed to pool workers.
+    """
+
+    def __init__(self, scratch_dir, tmpfs_dir="/dev/shm", tmpfs_max_mb=0):
+        self.scratch_dir = Path(scratch_dir)
+        self.tmpfs_dir = Path(tmpfs_dir)
+        self.tmpfs_max_mb = tmpfs_max_mb
+        self.scratch_dir.mkdir(parents=True, exist_ok=True)
+
+    def make_workdir(self, slcio_file: Path):
+        """Fresh private directory for one conversion, or None if there is no room for it."""
+        size = slcio_file.stat().st_size
+        base = self.scratch_dir
+        if self.tmpfs_max_mb and size <= self.tmpfs_max_mb * 1024**2 and self.tmpfs_dir.is_dir():
+            base = self.tmpfs_dir
+        if shutil.disk_usage(base).free < 3 * size:  # input + output + headroom
+            return None
+        return Path(tempfile.mkdtemp(prefix=f"{slcio_file.stem[:60]}.", dir=base))
+
+def convert_in_scratch(slcio_file: Path, final_root: Path, work_dir: Path, logger, patch_cache, record, validator) -> bool:
+    """
+    Steps 1-5 with every intermediate file in work_dir on local scratch: the input
+    is copied there once, patched, converted and validated locally, and only the
+    validated .root is written back to edm4hep/ (one sequential copy + rename).
+    The lcio2edm4hep log is copied back next to the input only if it is not empty.
+    """
+    local_slcio = work_dir / slcio_file.name
+    local_root = local_slcio.with_suffix(".root")
+    local_log = local_slcio.with_suffix(".log")
+    try:
+        shutil.copyfile(slcio_file, local_slcio)
+        logger.info(f" → Staged in {work_dir}")
+
+        patch_file, key = get_patch(local_slcio, patch_cache, logger)
+        record("patched")
+        convert_with_patch(local_slcio, local_root, patch_file, key, patch_cache, local_log, logger)
+        record("converted")
+
+        if not validate_root_file(local_root, logger, local_slcio, validator):
+            record("invalid")
+            logger.warning(f"Keeping .slcio since validation failed: {slcio_file}")
+            return False
+
+        partial = final_root.with_name(f".{final_root.name}.part")
+        shutil.copyfile(local_root, partial)
+        os.replace(partial, final_root)
+        record("moved")
+        record("validated")
+    finally:
+        if local_log.exists() and local_log.stat().st_size > 0:
+            shutil.copyfile(local_log, slcio_file.with_suffix(".log"))
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    slcio_file.unlink()
+    record("deleted")
+    logger.info(f"Deleted original: {slcio_file}")
+    return True
+
+def validate_root_file(root_file: Path, logger, slcio_file: Path = None, validator: str = "auto") -> bool:
+    """
+    Check if the ROOT file is valid: structurally with uproot (validator "auto"
+    with uproot installed, or "uproot"), otherwise using edm4hep-dump or rootls.
+    """
     if not root_file.exists() or root_file.stat().st_size == 0:
         logger.error(f"Validation failed: {root_file} is missing or empty.")
         return False
 
+    if validator == "uproot" or (validator == "auto" and uproot is not None):
+        expected_events = count_lcio_events(slcio_file, logger) if slcio_file is not None else None
+        return validate_root_structure(root_file, logger, expected_events)
+
     try:
         subprocess.run(
             ["edm4hep-dump", str(root_file)],
@@ -77,74 +377,233 @@ def validate_root_file(root_file: Path, logger) -> bool:
             logger.error(f"Validation failed for {root_file}: {e}")
             return False
 
-def convert_file(slcio_file: Path, dry_run: bool, logger):
+def convert_file(slcio_file: Path, dry_run: bool, logger, patch_cache=None, journal=None, stage=None,
+                 validator="auto", stop_after=None, scratch=None) -> bool:
+    """
+    Convert, validate and delete one .slcio file. Returns False if validation failed.
+    With a journal, every completed step is recorded, and `stage` (the last step
+    recorded by an earlier run) decides where to resume. stop_after="moved"
+    returns once the .root file is in edm4hep/ (slcio_stream_pipeline.py then
+    validates in a separate stage by calling again with stage="moved").
+    With a ScratchArea, a fresh conversion runs in local scratch (convert_in_scratch).
+    """
     root_file = slcio_file.with_suffix(".root")
-    patch_file = slcio_file.parent / "patch.txt"
     edm4hep_dir = slcio_file.parent / "edm4hep"
     edm4hep_dir.mkdir(exist_ok=True)
+    final_root = edm4hep_dir / root_file.name
 
-    logger.info(f"Converting: {slcio_file}")
-    logger.info(f" → Output: {edm4hep_dir / root_file.name}")
+    # Only resume from a step whose product is still on disk
+    if stage == "converted" and not root_file.exists():
+        stage = None
+    if stage in ("moved", "validated") and not final_root.exists():
+        stage = None
+
+    if stage in (None, "fetched", "patched", "invalid"):
+        logger.info(f"Converting: {slcio_file}")
+    else:
+        logger.info(f"Continuing after '{stage}': {slcio_file}")
+    logger.info(f" → Output: {final_root}")
 
     if dry_run:
-        return
+        return True
 
-    # Per-file error log
-    err_log = slcio_file.with_suffix(".log")
+    def record(step):
+        if journal is not None:
+            journal.record(slcio_file, step)
 
-    # Step 1: run check_missing_cols
-    with patch_file.open("w") as pf:
-        subprocess.run(
-            ["check_missing_cols", "--minimal", str(slcio_file)],
-            stdout=pf,
-            stderr=subprocess.DEVNULL,
-            check=True,
-        )
+    if scratch is not None and stage in (None, "fetched", "patched", "invalid"):
+        work_dir = scratch.make_workdir(slcio_file)
+        if work_dir is not None:
+            return convert_in_scratch(slcio_file, final_root, work_dir, logger, patch_cache, record, validator)
+        logger.warning(f"Not enough local scratch space for {slcio_file}, converting in place")
 
-    # Step 2: run lcio2edm4hep
-    with open(err_log, "w") as elog:
-        subprocess.run(
-            ["lcio2edm4hep", str(slcio_file), str(root_file), str(patch_file)],
-            stdout=subprocess.DEVNULL,
-            stderr=elog,
-            check=True,
-        )
+    if stage in (None, "fetched", "patched", "invalid"):
+        # Per-file error log
+        err_log = slcio_file.with_suffix(".log")
 
-    # Step 3: move .root file to edm4hep dir
-    final_root = edm4hep_dir / root_file.name
-    shutil.move(str(root_file), final_root)
+        # Step 1: patch from the production cache, or run check_missing_cols
+        patch_file, key = get_patch(slcio_file, patch_cache, logger)
+        record("patched")
 
-    # Step 4: validate
-    if validate_root_file(final_root, logger):
-        # Step 5: delete original slcio
-        slcio_file.unlink()
-        logger.info(f"Deleted original: {slcio_file}")
-    else:
-        logger.warning(f"Keeping .slcio since validation failed: {slcio_file}")
+        # Step 2: run lcio2edm4hep
+        convert_with_patch(slcio_file, root_file, patch_file, key, patch_cache, err_log, logger)
+        record("converted")
+        stage = "converted"
 
-def crawl_and_convert(root_dir: Path, dry_run: bool, logger):
-    for slcio_file in root_dir.rglob("*.slcio"):
-        try:
-            convert_file(slcio_file, dry_run, logger)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error processing {slcio_file}: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error with {slcio_file}: {e}")
+    if stage == "converted":
+        # Step 3: move .root file to edm4hep dir
+        shutil.move(str(root_file), final_root)
+        record("moved")
+        stage = "moved"
+        if stop_after == "moved":
+            return True
+
+    if stage == "moved":
+        # Step 4: validate
+        if not validate_root_file(final_root, logger, slcio_file, validator):
+            record("invalid")
+            logger.warning(f"Keeping .slcio since validation failed: {slcio_file}")
+            return False
+        record("validated")
+
+    # Step 5: delete original slcio
+    slcio_file.unlink(missing_ok=True)
+    record("deleted")
+    logger.info(f"Deleted original: {slcio_file}")
+    return True
+
+class ConversionJournal:
+    """
+    Append-only JSONL journal of per-file conversion steps:
+      {"file": ..., "stage": "fetched|patched|converted|moved|validated|invalid|deleted", "time": ...}
+    ("fetched" is only written by slcio_stream_pipeline.py.)
+    Each line is written under an flock and fsync'ed, so parallel workers can
+    share the file and a crash loses at most the step in progress. Only the
+    path is stored on the object, so it can be handed to pool workers.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        """Last recorded stage per file; compacts the journal to one line per unfinished file."""
+        stages = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:  # torn last line after a crash
+                        continue
+                    stages[entry["file"]] = entry["stage"]
+        pending = {name: stage for name, stage in stages.items() if stage != "deleted"}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            for name, stage in pending.items():
+                f.write(json.dumps({"file": name, "stage": stage}) + "\n")
+        tmp_path.replace(self.path)
+        return pending
+
+    def record(self, slcio_file, stage):
+        line = json.dumps({"file": str(slcio_file), "stage": stage, "time": round(time.time(), 1)}) + "\n"
+        with open(self.path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def convert_file_safe(slcio_file: Path, dry_run: bool, logger, patch_cache=None, journal=None, stage=None,
+                      validator="auto", stop_after=None, scratch=None) -> str:
+    """convert_file with error isolation. Returns "converted", "invalid" or "error"."""
+    try:
+        return "converted" if convert_file(slcio_file, dry_run, logger, patch_cache, journal, stage, validator, stop_after,
+                                          scratch) else "invalid"
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error processing {slcio_file}: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error with {slcio_file}: {e}")
+    return "error"
+
+def convert_file_worker(slcio_file: Path, dry_run: bool, patch_cache=None, journal=None, stage=None, validator="auto",
+                        scratch=None):
+    """Process-pool entry point: returns (outcome, buffered log records)."""
+    buffered = BufferedLogger()
+    outcome = convert_file_safe(slcio_file, dry_run, buffered, patch_cache, journal, stage, validator, scratch=scratch)
+    return outcome, buffered.records
+
+def crawl_and_convert(root_dir: Path, dry_run: bool, logger, jobs: int = 1, patch_cache=None, journal=None,
+                      validator="auto", scratch=None) -> Counter:
+    """Convert every .slcio below root_dir, serially or with a pool of `jobs` processes."""
+    tally = Counter()
+    stages = journal.load() if journal is not None else {}
+    if stages:
+        logger.info(f"Journal {journal.path}: {len(stages)} files recorded by earlier runs")
+
+    if jobs <= 1:
+        for slcio_file in root_dir.rglob("*.slcio"):
+            stage = stages.get(str(slcio_file))
+            tally[convert_file_safe(slcio_file, dry_run, logger, patch_cache, journal, stage, validator,
+                                    scratch=scratch)] += 1
+        return tally
+
+    slcio_files = sorted(root_dir.rglob("*.slcio"))
+    logger.info(f"Converting {len(slcio_files)} files with {jobs} worker processes")
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        futures = [pool.submit(convert_file_worker, f, dry_run, patch_cache, journal, stages.get(str(f)), validator,
+                               scratch)
+                   for f in slcio_files]
+        # results are collected in file order, so the log reads like a serial run
+        for slcio_file, future in zip(slcio_files, futures):
+            try:
+                outcome, records = future.result()
+            except Exception as e:  # worker died (e.g. killed or BrokenProcessPool)
+                outcome, records = "error", [(logging.ERROR, f"Worker failed on {slcio_file}: {e!r}")]
+            for level, msg in records:
+                logger.log(level, msg)
+            tally[outcome] += 1
+    except KeyboardInterrupt:
+        logger.warning("Interrupted: cancelling queued files (the journal lets the next run resume)")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return tally
 
 def main():
     parser = argparse.ArgumentParser(description="Convert .slcio files to edm4hep .root files.")
     parser.add_argument("rootdir", type=Path, help="Root directory to start crawling from")
     parser.add_argument("--dry-run", action="store_true", help="Show actions without executing them")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help=f"Number of parallel conversion processes (this node has {os.cpu_count()} cores)")
+    parser.add_argument("--patch-cache", type=Path, default=None,
+                        help="Directory of the per-production patch cache (default: <rootdir>/.patch_cache)")
+    parser.add_argument("--no-patch-cache", action="store_true",
+                        help="Run check_missing_cols for every file instead of once per production")
+    parser.add_argument("--journal", type=Path, default=None,
+                        help="Conversion journal used to resume interrupted runs (default: <rootdir>/.conversion_journal.jsonl)")
+    parser.add_argument("--no-journal", action="store_true", help="Do not record or resume conversion steps")
+    parser.add_argument("--validator", choices=["auto", "uproot", "edm4hep-dump"], default="auto",
+                        help="Output check: uproot structure check (auto: if uproot is installed) or full edm4hep-dump")
+    parser.add_argument("--scratch", type=Path, default=None,
+                        help="Convert in this local scratch directory and copy only the validated .root back")
+    parser.add_argument("--tmpfs-max-mb", type=float, default=0,
+                        help="With --scratch: stage inputs up to this size in --tmpfs-dir instead (0: off)")
+    parser.add_argument("--tmpfs-dir", type=Path, default=Path("/dev/shm"), help="tmpfs used by --tmpfs-max-mb")
     args = parser.parse_args()
+    if args.validator == "uproot" and uproot is None:
+        parser.error("--validator uproot requires the uproot package (pip install uproot)")
 
     logger = setup_logging()
     logger.info("Starting SLCIO → EDM4hep conversion")
     logger.info(f"Root directory: {args.rootdir}")
     logger.info(f"Dry-run mode: {args.dry_run}")
+    logger.info(f"Parallel jobs: {args.jobs}")
+    logger.info(f"Validator: {args.validator} (uproot {'available' if uproot is not None else 'not installed'})")
+
+    patch_cache = None
+    if not args.no_patch_cache and not args.dry_run:
+        patch_cache = PatchCache(args.patch_cache or args.rootdir / ".patch_cache")
+        logger.info(f"Patch cache: {patch_cache.cache_dir}")
+
+    journal = None
+    if not args.no_journal and not args.dry_run:
+        journal = ConversionJournal(args.journal or args.rootdir / ".conversion_journal.jsonl")
+        logger.info(f"Journal: {journal.path}")
+
+    scratch = None
+    if args.scratch and not args.dry_run:
+        scratch = ScratchArea(args.scratch, args.tmpfs_dir, args.tmpfs_max_mb)
+        logger.info(f"Local scratch: {scratch.scratch_dir}"
+                    + (f" (≤ {args.tmpfs_max_mb} MB in {args.tmpfs_dir})" if args.tmpfs_max_mb else ""))
 
-    crawl_and_convert(args.rootdir, args.dry_run, logger)
+    tally = crawl_and_convert(args.rootdir, args.dry_run, logger, args.jobs, patch_cache, journal,
+                              args.validator, scratch)
 
-    logger.info("Finished.")
+    logger.info(f"Finished. Converted: {tally['converted']}, validation failed: {tally['invalid']}, "
+                f"errors: {tally['error']}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+slcio_stream_pipeline.py
+
+Streaming download → convert → validate → delete pipeline for selected LFNs,
+so that scratch only ever holds a bounded amount of SLCIO input.
+
+Stages (each a pool of threads; the heavy lifting happens in subprocesses):
+  fetch     dirac-dms-get-file <lfn> into samples/<process>/ (download_manager.py:
+            partial directory + rename, retries with backoff)
+  convert   check_missing_cols (patch cache) + lcio2edm4hep, move to edm4hep/
+  validate  structural/edm4hep-dump validation, delete the .slcio on success
+The stages are connected by bounded queues (--queue-size), so a slow stage
+throttles the ones in front of it, and network and CPU work overlap.
+
+Disk budget (--disk-budget-gb): the SLCIO bytes on scratch (downloaded and not
+yet deleted, plus a reservation for every running download based on the average
+file size so far) are kept below the budget. Fetchers pause until validated
+inputs have been deleted. Inputs that fail conversion or validation are kept and
+stay counted; if they alone exhaust the budget, the remaining downloads are skipped.
+
+Conversion and validation reuse slcio2edm4hep_validate_crawler.py, including its
+per-production patch cache and resumable journal. LFNs whose .root already
+exists in samples/<process>/edm4hep/ without a pending .slcio are skipped.
+
+Usage:
+    source /cvmfs/sw.hsf.org/key4hep/setup.sh -r 2025-01-28
+    python3 slcio_stream_pipeline.py pilot_lfns.txt --samples-dir samples --disk-budget-gb 200 \
+        [--fetchers 4] [--converters 8] [--validators 2]
+"""
+
+import queue
+import logging
+import argparse
+import threading
+from collections import Counter
+from pathlib import Path
+
+from lfn_parser import LFNCatalog
+from download_manager import DownloadManager
+from slcio2edm4hep_validate_crawler import (
+    PatchCache, ConversionJournal, convert_file_safe, uproot,
+)
+
+# -----------------------------
+# Configuration
+# -----------------------------
+FETCH_CMD = "dirac-dms-get-file"
+FETCH_RETRIES = 3
+INITIAL_SIZE_ESTIMATE = 2 * 1024**3   # bytes reserved per download until real sizes are known
+DONE = None                           # queue sentinel
+
+def setup_logging():
+    logger = logging.getLogger("slcio_pipeline")
+    logger.setLevel(logging.INFO)
+
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(ch)
+
+    fh = logging.FileHandler("slcio_pipeline.log", mode="w")
+    fh.setFormatter(logging.Formatter("%(asctime)s - %(threadName)s - %(levelname)s - %(message)s"))
+    logger.addHandler(fh)
+
+    return logger
+
+# -----------------------------
+# Disk budget
+# -----------------------------
+class DiskBudget:
+    """
+    Byte accounting of SLCIO inputs on scratch.
+    reserve() blocks while a new download would exceed the limit and other
+    files are still in flight (their deletion will free space).
+    """
+
+    def __init__(self, limit_bytes, initial_estimate=INITIAL_SIZE_ESTIMATE):
+        self.limit = limit_bytes
+        self.used = 0          # reserved + downloaded, not yet deleted
+        self.kept = 0          # inputs kept after a failure
+        self.in_flight = 0
+        self.n_sizes = 0
+        self.total_size = 0
+        self.initial_estimate = initial_estimate
+        self.cond = threading.Condition()
+
+    def estimate(self):
+        return self.total_size // self.n_sizes if self.n_sizes else self.initial_estimate
+
+    def reserve(self):
+        """Reserve space for one download. Returns the reserved bytes, or None if the budget is exhausted by kept files."""
+        with self.cond:
+            while True:
+                need = self.estimate()
+                # a budget smaller than one file still lets files through one at a time
+                if self.used + need <= self.limit or (self.in_flight == 0 and self.kept == 0):
+                    break
+                if self.in_flight == 0:
+                    return None
+                self.cond.wait()
+            self.used += need
+            self.in_flight += 1
+            return need
+
+    def adopt(self, size):
+        """Count an input that is already on scratch (left over from an interrupted run)."""
+        with self.cond:
+            self.used += size
+            self.in_flight += 1
+
+    def downloaded(self, reserved, actual):
+        with self.cond:
+            self.used += actual - reserved
+            self.n_sizes += 1
+            self.total_size += actual
+
+    def cancel(self, reserved):
+        """Download failed: give the reservation back."""
+        self.release(reserved)
+
+    def release(self, size, kept=False):
+        """File left the pipeline: deleted (space freed) or kept on disk."""
+        with self.cond:
+            self.in_flight -= 1
+            if kept:
+                self.kept += size
+            else:
+                self.used -= size
+            self.cond.notify_all()
+
+# -----------------------------
+# Stages
+# -----------------------------
+class StreamPipeline:
+    def __init__(self, samples_dir, budget, logger, fetchers=4, converters=4, validators=2,
+                 queue_size=8, patch_cache=None, journal=None, validator="auto"):
+        self.samples_dir = Path(samples_dir)
+        self.budget = budget
+        self.logger = logger
+        self.n_fetchers = fetchers
+        self.n_converters = converters
+        self.n_validators = validators
+        self.patch_cache = patch_cache
+        self.journal = journal
+        self.validator = validator
+        self.downloader = DownloadManager(samples_dir, transfers=fetchers, retries=FETCH_RETRIES, transfer_cmd=FETCH_CMD)
+        self.todo = queue.Queue()
+        self.to_convert = queue.Queue(maxsize=queue_size)
+        self.to_validate = queue.Queue(maxsize=queue_size)
+        self.tally = Counter()
+        self.tally_lock = threading.Lock()
+
+    def count(self, outcome):
+        with self.tally_lock:
+            self.tally[outcome] += 1
+
+    def fetcher(self):
+        while True:
+            item = self.todo.get()
+            if item is DONE:
+                return
+            lfn, process, stage = item
+            local = self.samples_dir / process / Path(lfn).name
+            if stage is not None and local.exists():
+                # downloaded by an interrupted run: resume without fetching again
+                size = local.stat().st_size
+                self.budget.adopt(size)
+                self.logger.info(f"Already on scratch ({stage}): {local.name}")
+                self.to_convert.put((local, size, stage))
+                continue
+
+            reserved = self.budget.reserve()
+            if reserved is None:
+                self.logger.error(f"Disk budget exhausted by kept (failed) inputs, skipping {lfn}")
+                self.count("skipped_budget")
+                continue
+            try:
+                status, local, detail = self.downloader.download(lfn, process)
+                if status != "failed":
+                    size = local.stat().st_size
+            except Exception as e:  # e.g. transfer command missing: must not leak the reservation
+                status, detail = "failed", repr(e)
+            if status == "failed":
+                self.logger.error(f"Download failed for {lfn}: {detail}")
+                self.budget.cancel(reserved)
+                self.count("fetch_error")
+                continue
+            self.budget.downloaded(reserved, size)
+            if self.journal is not None:
+                self.journal.record(local, "fetched")
+            self.logger.info(f"Fetched {local.name} ({size / 1024**2:.0f} MB, "
+                             f"{self.budget.used / 1024**3:.1f}/{self.budget.limit / 1024**3:.1f} GB in use)")
+            self.to_convert.put((local, size, "fetched"))
+
+    def converter(self):
+        while True:
+            item = self.to_convert.get()
+            if item is DONE:
+                return
+            local, size, stage = item
+            outcome = convert_file_safe(local, False, self.logger, self.patch_cache, self.journal, stage,
+                                        validator=self.validator, stop_after="moved")
+            if outcome == "converted" and local.exists():
+                self.to_validate.put((local, size))
+            elif outcome == "converted":  # resumed after validation: nothing left to check
+                self.budget.release(size)
+                self.count(outcome)
+            else:
+                self.budget.release(size, kept=True)
+                self.count(outcome)
+
+    def validator_stage(self):
+        while True:
+            item = self.to_validate.get()
+            if item is DONE:
+                return
+            local, size = item
+            outcome = convert_file_safe(local, False, self.logger, self.patch_cache, self.journal,
+                                        stage="moved", validator=self.validator)
+            self.budget.release(size, kept=local.exists())
+            self.count(outcome)
+
+    def run(self, work):
+        """work: list of (lfn, process, stage). Returns the outcome tally."""
+        def start(target, n, name):
+            threads = [threading.Thread(target=target, name=f"{name}-{i}", daemon=True) for i in range(n)]
+            for t in threads:
+                t.start()
+            return threads
+
+        fetchers = start(self.fetcher, self.n_fetchers, "fetch")
+        converters = start(self.converter, self.n_converters, "convert")
+        validators = start(self.validator_stage, self.n_validators, "validate")
+
+        for item in work:
+            self.todo.put(item)
+        for _ in fetchers:
+            self.todo.put(DONE)
+
+        # shut the stages down front to back
+        for t in fetchers:
+            t.join()
+        for _ in converters:
+            self.to_convert.put(DONE)
+        for t in converters:
+            t.join()
+        for _ in validators:
+            self.to_validate.put(DONE)
+        for t in validators:
+            t.join()
+        return self.tally
+
+def pending_work(catalog, samples_dir: Path, logger, stages=None):
+    """
+    (lfn, process, journal stage) for every LFN whose output does not exist yet,
+    in catalog order. The stage is None unless an earlier run already fetched the file.
+    """
+    stages = stages or {}
+    work = []
+    for lfn, process in zip(catalog.lfns, catalog.column("process")):
+        name = Path(lfn).name
+        process_dir = samples_dir / process
+        done = (process_dir / "edm4hep" / name).with_suffix(".root").exists()
+        if done and not (process_dir / name).exists():
+            continue
+        work.append((lfn, process, stages.get(str(process_dir / name))))
+    logger.info(f"{len(work)} of {len(catalog)} LFNs still to process")
+    for lfn in catalog.unparsed:
+        logger.warning(f"Skipping unparseable LFN: {lfn}")
+    return work
+
+def run_stream_pipeline(lfn_file, samples_dir, disk_budget_gb, fetchers=4, converters=4, validators=2,
+                        queue_size=8, patch_cache_dir=None, journal_path=None, validator="auto"):
+    """Run the whole pipeline for an LFN list; returns the outcome tally."""
+    logger = setup_logging()
+    samples_dir = Path(samples_dir)
+    samples_dir.mkdir(parents=True, exist_ok=True)
+    catalog = LFNCatalog.from_file(lfn_file)
+
+    journal = ConversionJournal(journal_path or samples_dir / ".conversion_journal.jsonl")
+    work = pending_work(catalog, samples_dir, logger, journal.load())
+    pipeline = StreamPipeline(
+        samples_dir,
+        DiskBudget(int(disk_budget_gb * 1024**3)),
+        logger,
+        fetchers=fetchers,
+        converters=converters,
+        validators=validators,
+        queue_size=queue_size,
+        patch_cache=PatchCache(patch_cache_dir or samples_dir / ".patch_cache"),
+        journal=journal,
+        validator=validator,
+    )
+    tally = pipeline.run(work)
+
+    logger.info(f"Finished. Converted: {tally['converted']}, validation failed: {tally['invalid']}, "
+                f"conversion errors: {tally['error']}, download errors: {tally['fetch_error']}, "
+                f"skipped (budget): {tally['skipped_budget']}")
+    return tally
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Streaming SLCIO download → EDM4hep conversion with a disk budget")
+    parser.add_argument("lfn_file", help="Selected LFNs, one per line (e.g. pilot_lfns.txt)")
+    parser.add_argument("--samples-dir", type=Path, default=Path("samples"), help="Scratch area with <process>/ subdirectories")
+    parser.add_argument("--disk-budget-gb", type=float, default=100.0, help="Maximum SLCIO input on scratch at any time")
+    parser.add_argument("--fetchers", type=int, default=4, help="Concurrent downloads")
+    parser.add_argument("--converters", type=int, default=4, help="Concurrent conversions")
+    parser.add_argument("--validators", type=int, default=2, help="Concurrent validations")
+    parser.add_argument("--queue-size", type=int, default=8, help="Capacity of the queues between stages")
+    parser.add_argument("--patch-cache", type=Path, default=None, help="Patch cache directory (default: <samples-dir>/.patch_cache)")
+    parser.add_argument("--journal", type=Path, default=None, help="Conversion journal (default: <samples-dir>/.conversion_journal.jsonl)")
+    parser.add_argument("--validator", choices=["auto", "uproot", "edm4hep-dump"], default="auto", help="Output check, see the crawler")
+    args = parser.parse_args()
+    if args.validator == "uproot" and uproot is None:
+        parser.error("--validator uproot requires the uproot package (pip install uproot)")
+
+    run_stream_pipeline(
+        args.lfn_file, args.samples_dir, args.disk_budget_gb,
+        fetchers=args.fetchers,
+        converters=args.converters,
+        validators=args.validators,
+        queue_size=args.queue_size,
+        patch_cache_dir=args.patch_cache,
+        journal_path=args.journal,
+        validator=args.validator,
+    )
+
+if __name__ == "__main__":
+    main()
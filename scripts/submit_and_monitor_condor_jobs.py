@@ -4,20 +4,59 @@ submit_and_monitor_condor_jobs.py
 
 Script to submit all HTCondor job scripts in the generated_jobs directory,
 capture their Condor job IDs, and provide a live status summary.
+
+If CLUSTER_SUBMIT is set and generated_jobs/jobs.sub exists (written by
+generate_key4hep_options_and_htcondor.py), all jobs are submitted with a single
+condor_submit call; ProcId N belongs to line N of generated_jobs/jobs.txt.
+Otherwise every job.sub is submitted on its own.
+
+Monitoring polls once per SLEEP_BETWEEN_CHECKS with a single
+`condor_q -json` constrained to our clusters, plus one `condor_history -json`
+for jobs that have left the queue, and refreshes an Idle/Running/Held/Completed
+table until every job is Completed or Removed (or only Held jobs remain).
+A job that is found in neither condor_q nor condor_history (e.g. a purged
+history entry), or whose status cannot be queried, for MAX_MISSING_POLLS polls
+in a row is given up as Unknown, and the monitor stops after MONITOR_TIMEOUT
+seconds in any case.
+With MONITOR_MODE = "userlog" the same table is built from the per-job
+job.log user logs (condor_log_tracker.py) without querying the schedd at all.
+
+Every submission is recorded in the JOB_STATE_DB SQLite store
+(condor_job_state.py). With AUTO_RESUBMIT, held jobs and jobs that completed
+with a non-zero exit code are removed and resubmitted from their job.sub, up
+to MAX_ATTEMPTS submissions per job with an exponential backoff starting at
+RETRY_BACKOFF seconds. Jobs whose outputs already exist in OUTPUT_CHECK_DIR are
+not resubmitted; jobs that run out of attempts are reported as Failed.
 """
 
+import json
 import subprocess
+from collections import Counter
 from pathlib import Path
 import datetime
 import time
 
+from condor_log_tracker import CondorLogTracker
+from condor_job_state import JobStateDB, ResubmissionEngine
+
 # -----------------------------
 # User-configurable parameters
 # -----------------------------
 GENERATED_JOBS_DIR = Path("generated_jobs")
 SUMMARY_LOGFILE = Path(f"condor_submission_summary_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-CHECK_QUEUE = True           # If True, queries condor_q after submission
-SLEEP_BETWEEN_CHECKS = 10    # Seconds to wait between queue checks (optional)
+CHECK_QUEUE = True           # If True, monitors the queue after submission
+SLEEP_BETWEEN_CHECKS = 10    # Seconds to wait between queue checks
+MAX_MISSING_POLLS = 30       # Consecutive NotInQueue/QueryFailed polls before a job is given up as Unknown
+MONITOR_TIMEOUT = 72 * 3600  # Seconds before the monitor stops waiting (None = no limit)
+MONITOR_MODE = "schedd"      # "schedd" (condor_q/condor_history) or "userlog" (tail job.log files)
+CLUSTER_SUBMIT = True        # Use generated_jobs/jobs.sub (one ClusterId) when it exists
+CLUSTER_SUB_FILE = GENERATED_JOBS_DIR / "jobs.sub"
+CLUSTER_ITEMDATA_FILE = GENERATED_JOBS_DIR / "jobs.txt"
+JOB_STATE_DB = Path("condor_job_state.sqlite")  # Persistent per-job attempts/status store
+AUTO_RESUBMIT = True         # Resubmit held jobs and jobs with a non-zero exit code
+MAX_ATTEMPTS = 3             # Total submissions per job, including the first one
+RETRY_BACKOFF = 300          # Seconds before the first retry; doubled for every further attempt
+OUTPUT_CHECK_DIR = "/eos/user/c/chensel/ILC/KEY4HEP_OUTPUT/PILOT_MC_RUN"  # Skip resubmission if outputs are here
 
 # -----------------------------
 # Helper functions
@@ -41,45 +80,183 @@ def submit_job(sub_file):
     except subprocess.CalledProcessError as e:
         return None, e.stderr.strip()
 
-def query_condor_status(job_id):
-    """Query condor_q for a given job ID and return status"""
+def remove_job(job_id):
+    """condor_rm a single job ("ClusterId.ProcId"); failures are only reported."""
+    result = subprocess.run(
+        ["condor_rm", job_id],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        print(f"condor_rm {job_id} failed: {result.stderr.strip()}")
+
+def submit_cluster(sub_file, itemdata_file):
+    """
+    Submit the cluster .sub file once. Returns (cluster_id, {job_dir: "ClusterId.ProcId"}, output);
+    the mapping is empty if the submission failed.
+    """
+    cluster_id, output = submit_job(sub_file)
+    if not cluster_id or cluster_id == "Unknown":
+        return None, {}, output
+    # first itemdata column is the job directory, the rest are per-job resource requests
+    job_dirs = [line.split()[0] for line in Path(itemdata_file).read_text().splitlines() if line.strip()]
+    return cluster_id, {job_dir: f"{cluster_id}.{proc_id}" for proc_id, job_dir in enumerate(job_dirs)}, output
+
+STATUS_MAP = {
+    1: "Idle",
+    2: "Running",
+    3: "Removed",
+    4: "Completed",
+    5: "Held",
+    6: "Transferring Output",
+    7: "Suspended"
+}
+TERMINAL_STATES = {"Completed", "Removed", "Failed", "Unknown"}
+MISSING_STATES = {"NotInQueue", "QueryFailed"}
+STATUS_COLUMNS = ["Idle", "Running", "Held", "RetryPending", "Completed", "Failed", "Removed", "Unknown", "Other"]
+
+def normalize_job_id(job_id):
+    """'12345' (single-job cluster) -> '12345.0'; 'C.P' is kept."""
+    return job_id if "." in job_id else f"{job_id}.0"
+
+def cluster_constraint(job_ids):
+    clusters = sorted({int(job_id.split(".")[0]) for job_id in job_ids})
+    return " || ".join(f"ClusterId == {c}" for c in clusters)
+
+def condor_json(cmd):
+    """Run a condor_q/condor_history -json command and return the list of ClassAds."""
+    result = subprocess.run(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True
+    )
+    output = result.stdout.strip()
+    return json.loads(output) if output else []
+
+def job_state(ad):
+    """(status, exit_code) of one condor_q/condor_history ClassAd."""
+    return STATUS_MAP.get(ad.get("JobStatus"), f"Unknown({ad.get('JobStatus')})"), ad.get("ExitCode")
+
+def query_condor_statuses(job_ids):
+    """
+    Query the status of many jobs ("ClusterId.ProcId") with one condor_q call,
+    plus one condor_history call for the jobs no longer in the queue.
+    Returns {job_id: (status, exit_code)}; exit_code is None until the job has exited.
+    """
+    job_ids = [normalize_job_id(j) for j in job_ids]
+    if not job_ids:
+        return {}
+    statuses = {}
+    attributes = "ClusterId,ProcId,JobStatus,ExitCode"
+
     try:
-        result = subprocess.run(
-            ["condor_q", job_id, "-format", "%s\n", "JobStatus"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
-        status_map = {
-            "1": "Idle",
-            "2": "Running",
-            "3": "Removed",
-            "4": "Completed",
-            "5": "Held",
-            "6": "Transferring Output",
-            "7": "Suspended"
-        }
-        status_code = result.stdout.strip()
-        return status_map.get(status_code, f"Unknown({status_code})")
-    except subprocess.CalledProcessError:
-        return "NotInQueue"
+        for ad in condor_json(["condor_q", "-json", "-constraint", cluster_constraint(job_ids),
+                               "-attributes", attributes]):
+            statuses[f"{ad['ClusterId']}.{ad['ProcId']}"] = job_state(ad)
+    except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
+        print(f"condor_q query failed: {e}")
+        return {job_id: ("QueryFailed", None) for job_id in job_ids}
 
-# -----------------------------
-# Main
-# -----------------------------
-def main():
-    if not GENERATED_JOBS_DIR.exists():
-        print(f"Error: {GENERATED_JOBS_DIR} does not exist.")
-        return
+    missing = [job_id for job_id in job_ids if job_id not in statuses]
+    if missing:
+        try:
+            for ad in condor_json(["condor_history", "-json", "-constraint", cluster_constraint(missing),
+                                   "-attributes", attributes]):
+                job_id = f"{ad['ClusterId']}.{ad['ProcId']}"
+                if job_id not in statuses:
+                    statuses[job_id] = job_state(ad)
+        except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
+            print(f"condor_history query failed: {e}")
 
-    summary_lines = []
-    summary_lines.append(f"{'Job Name':<30} | {'Job Dir':<80} | {'Condor Job ID':<12} | {'Status'}")
-    summary_lines.append("-" * 140)
+    return {job_id: statuses.get(job_id, ("NotInQueue", None)) for job_id in job_ids}
 
-    submitted_jobs = {}
+def print_status_table(statuses):
+    counts = Counter(s if s in STATUS_COLUMNS else "Other" for s in statuses.values())
+    now = datetime.datetime.now().strftime("%H:%M:%S")
+    print(f"[{now}] " + " | ".join(f"{col}: {counts.get(col, 0):>5}" for col in STATUS_COLUMNS)
+          + f" | Total: {len(statuses)}")
 
-    # Submit all jobs
+def needs_retry(status, exit_code):
+    return status == "Held" or (status == "Completed" and exit_code not in (None, 0))
+
+def monitor_jobs(submitted_jobs, interval, db=None, engine=None,
+                 max_missing_polls=MAX_MISSING_POLLS, timeout=MONITOR_TIMEOUT):
+    """
+    Poll all submitted jobs until each one is Completed, Failed, Removed or
+    Unknown, only Held jobs are left, or timeout seconds have passed. Costs one
+    condor_q (+ one condor_history) per interval, or no schedd query at all in
+    "userlog" mode.
+    A job that stays NotInQueue/QueryFailed (or has no user-log entry) for
+    max_missing_polls polls in a row is given up as Unknown.
+    Statuses are written to db; held or failed jobs are passed to engine, which
+    may resubmit them (submitted_jobs is updated with the new job IDs).
+    Returns {job_name: status}.
+    """
+    job_ids = {name: normalize_job_id(info["job_id"]) for name, info in submitted_jobs.items()}
+    statuses = {}
+    missing_polls = Counter()
+    deadline = time.time() + timeout if timeout else None
+    tracker = CondorLogTracker() if MONITOR_MODE == "userlog" else None
+    while True:
+        pending = [job_id for name, job_id in job_ids.items() if statuses.get(name) not in TERMINAL_STATES]
+        if tracker is not None:
+            tracker.poll(Path(info["dir"]) / "job.log" for info in submitted_jobs.values())
+            by_id = {job_id: (tracker.jobs[job_id]["status"], tracker.jobs[job_id]["exit_code"])
+                     for job_id in pending if job_id in tracker.jobs}
+        else:
+            by_id = query_condor_statuses(pending)
+        for name, job_id in job_ids.items():
+            if statuses.get(name) in TERMINAL_STATES:
+                continue
+            status, exit_code = by_id.get(job_id, ("NotInQueue", None))
+            if status in MISSING_STATES:
+                missing_polls[name] += 1
+                if missing_polls[name] >= max_missing_polls:
+                    print(f"⚠️ {name} ({job_id}) was {status} for {missing_polls[name]} polls in a row; "
+                          f"giving up on it as Unknown")
+                    status = "Unknown"
+            else:
+                missing_polls[name] = 0
+            job_dir = submitted_jobs[name]["dir"]
+            if engine is not None and needs_retry(status, exit_code):
+                action, new_job_id = engine.handle(job_dir, job_id, status, exit_code)
+                if action == "resubmitted":
+                    print(f"🔁 Resubmitted {name} ({status}, exit code {exit_code}) -> Condor job ID {new_job_id}")
+                    submitted_jobs[name]["job_id"] = new_job_id
+                    job_ids[name] = normalize_job_id(new_job_id)
+                    status = "Idle"
+                elif action == "waiting":
+                    status = "RetryPending"
+                elif action == "gave_up":
+                    print(f"❌ Giving up on {name} after {MAX_ATTEMPTS} attempts ({status}, exit code {exit_code})")
+                    status = "Failed"
+                elif action == "outputs_exist":
+                    print(f"✅ Outputs of {name} already exist, not resubmitting")
+                    status = "Completed"
+            elif db is not None and statuses.get(name) != status:
+                db.update_status(job_dir, status, exit_code)
+            statuses[name] = status
+        print_status_table(statuses)
+
+        remaining = [statuses.get(name, "Unknown") for name in job_ids if statuses.get(name) not in TERMINAL_STATES]
+        if not remaining:
+            print("All jobs reached a terminal state.")
+            break
+        if all(s == "Held" for s in remaining):
+            print(f"Only held jobs remain ({len(remaining)}); stopping the monitor.")
+            break
+        if deadline is not None and time.time() + interval > deadline:
+            print(f"⏱️ Monitor timeout of {timeout} s reached with {len(remaining)} jobs not finished; stopping the monitor.")
+            break
+        time.sleep(interval)
+    return statuses
+
+def submit_per_job():
+    """Submit every generated_jobs/<job>/job.sub separately (one schedd transaction per job)"""
+    submitted_jobs = {}
     for job_dir in sorted(GENERATED_JOBS_DIR.iterdir()):
         if job_dir.is_dir():
             sub_file = job_dir / "job.sub"
@@ -92,15 +269,54 @@ def main():
                     print(f"Failed to submit {job_dir.name}: {output}")
             else:
                 print(f"No .sub file found in {job_dir}, skipping.")
+    return submitted_jobs
+
+# -----------------------------
+# Main
+# -----------------------------
+def main():
+    if not GENERATED_JOBS_DIR.exists():
+        print(f"Error: {GENERATED_JOBS_DIR} does not exist.")
+        return
+
+    summary_lines = []
+    summary_lines.append(f"{'Job Name':<30} | {'Job Dir':<80} | {'Condor Job ID':<12} | {'Status'}")
+    summary_lines.append("-" * 140)
 
-    # Query queue for job status
+    submitted_jobs = {}
+
+    # Submit all jobs
+    if CLUSTER_SUBMIT and CLUSTER_SUB_FILE.exists() and CLUSTER_ITEMDATA_FILE.exists():
+        cluster_id, job_ids, output = submit_cluster(CLUSTER_SUB_FILE, CLUSTER_ITEMDATA_FILE)
+        if job_ids:
+            print(f"Submitted {len(job_ids)} jobs from {CLUSTER_SUB_FILE} -> Condor cluster {cluster_id}")
+            for job_dir, job_id in job_ids.items():
+                submitted_jobs[Path(job_dir).name] = {"dir": job_dir, "job_id": job_id}
+        else:
+            print(f"Failed to submit {CLUSTER_SUB_FILE}: {output}")
+    else:
+        submitted_jobs = submit_per_job()
+
+    # Record the submissions in the persistent job-state store
+    db = JobStateDB(JOB_STATE_DB)
+    for info in submitted_jobs.values():
+        db.record_submission(info["dir"], normalize_job_id(info["job_id"]), fresh=True)
+    engine = None
+    if AUTO_RESUBMIT:
+        engine = ResubmissionEngine(db, submit_job, remove_job, max_attempts=MAX_ATTEMPTS,
+                                    backoff=RETRY_BACKOFF, output_check_dir=OUTPUT_CHECK_DIR)
+
+    # Monitor the queue until all jobs are done
     if CHECK_QUEUE and submitted_jobs:
-        print("\nChecking Condor queue status...")
+        print("\nMonitoring Condor queue status...")
+        statuses = monitor_jobs(submitted_jobs, SLEEP_BETWEEN_CHECKS, db=db, engine=engine)
         for job_name, info in submitted_jobs.items():
-            status = query_condor_status(info["job_id"])
+            status = statuses.get(job_name, "Unknown")
             summary_lines.append(f"{job_name:<30} | {info['dir']:<80} | {info['job_id']:<12} | {status}")
             print(f"{job_name:<30} | Job ID {info['job_id']} | Status: {status}")
 
+    db.close()
+
     # Write summary to logfile
     SUMMARY_LOGFILE.write_text("\n".join(summary_lines))
     print(f"\nSubmission summary written to {SUMMARY_LOGFILE}")